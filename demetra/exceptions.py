@@ -14,5 +14,35 @@ class LinearError(DemetraError):
     pass
 
 
+class GraphQLQueryError(LinearError):
+    pass
+
+
 class InfiniteLoopError(DemetraError):
     pass
+
+
+class OpenCodeServerError(DemetraError):
+    pass
+
+
+class ApprovalError(DemetraError):
+    pass
+
+
+class WorkflowGraphError(DemetraError):
+    pass
+
+
+class StepTimeoutError(DemetraError):
+    pass
+
+
+class CommandTimeoutError(DemetraError):
+    def __init__(self, command: list, reason: str, timeout: float, stdout: str = "", stderr: str = ""):
+        super().__init__(f"Command '{' '.join(map(str, command[:3]))}' hit {reason} timeout of {timeout} seconds")
+        self.command = command
+        self.reason = reason
+        self.timeout = timeout
+        self.stdout = stdout
+        self.stderr = stderr
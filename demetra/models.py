@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Any
 
 from slugify import slugify
 
@@ -13,6 +14,9 @@ class LinearIssue:
     created_at: str
     branch_name: str
     comments: list[str] = field(default_factory=list)
+    updated_at: str = ""
+    project_name: str = ""
+    state_name: str = ""
 
     @property
     def full_title(self) -> str:
@@ -35,3 +39,80 @@ class Session:
     session_id: str
     created_at: str
     updated_at: str
+
+
+@dataclass
+class OutboxMessage:
+    id: int
+    idempotency_key: str
+    issue_id: str
+    operation: str
+    variables: dict[str, Any]
+    status: str
+    attempts: int
+    last_error: str | None
+    available_at: str
+    created_at: str
+    updated_at: str
+
+
+@dataclass
+class CommandLog:
+    id: int
+    run_id: str
+    task_id: str
+    task_identifier: str
+    step: str
+    command: str
+    path: str
+    exit_code: int | None
+    size: int
+    started_at: str
+    finished_at: str | None
+
+
+@dataclass
+class Checkpoint:
+    task_id: str
+    task_identifier: str
+    project_path: str
+    stage: str
+    completed_steps: list[str]
+    loops: dict[str, int]
+    state: dict[str, Any]
+    created_at: str
+    updated_at: str
+
+
+@dataclass
+class ApprovalRequest:
+    id: str
+    task_id: str
+    task_identifier: str
+    kind: str
+    body: str
+    options: list[str]
+    created_at: str
+
+
+@dataclass
+class PoolStats:
+    name: str
+    limit: int
+    active: int = 0
+    queued: int = 0
+    acquired: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.acquired if self.acquired else 0.0
+
+
+@dataclass(frozen=True)
+class GraphQLQuery:
+    name: str
+    operation: str
+    document: str
+    sha256: str
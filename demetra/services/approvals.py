@@ -0,0 +1,292 @@
+import asyncio
+import re
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+from aiohttp import web
+
+from demetra.exceptions import ApprovalError, LinearError, SettingsError
+from demetra.models import ApprovalRequest, LinearIssue
+from demetra.services.flow import user_input
+from demetra.services.linear import list_issue_comments
+from demetra.services.outbox import enqueue_comment
+from demetra.services.tui import print_message
+from demetra.settings import (
+    APPROVAL_AUTO_MAX_LINES,
+    APPROVAL_LINEAR_POLL_INTERVAL,
+    APPROVAL_POLICIES,
+    APPROVAL_RISK_PATTERNS,
+    APPROVAL_SOCKET_PATH,
+)
+
+
+APPROVE = "approve"
+COMMENT = "comment"
+EXIT = "exit"
+SKIP = "skip"
+
+KIND_PLAN = "plan"
+KIND_REVIEW = "review"
+
+PLAN_OPTIONS = [APPROVE, COMMENT, EXIT]
+REVIEW_OPTIONS = [APPROVE, SKIP]
+
+LINEAR_REPLY_PATTERN = re.compile(r"^\s*/(\w+)\s*(.*)$", re.DOTALL)
+
+Decision = tuple[str, str | None]
+
+
+class ApprovalPolicy(ABC):
+    name = ""
+    # Interactive policies wait for a person and run concurrently, the first answer wins
+    interactive = True
+
+    @abstractmethod
+    async def decide(self, request: ApprovalRequest) -> Decision | None: ...
+
+
+class AutoApprovalPolicy(ApprovalPolicy):
+    name = "auto"
+    interactive = False
+
+    def __init__(self, max_lines: int = APPROVAL_AUTO_MAX_LINES, risk_patterns: list[str] | None = None):
+        self.max_lines = max_lines
+        self.risk_patterns = APPROVAL_RISK_PATTERNS if risk_patterns is None else risk_patterns
+
+    async def decide(self, request: ApprovalRequest) -> Decision | None:
+        # Approving review comments sends them back to the build agent, so only plans are decided here
+        if request.kind != KIND_PLAN:
+            return None
+        lines = len(request.body.strip().splitlines())
+        if lines > self.max_lines:
+            return None
+        body = request.body.lower()
+        if any(pattern in body for pattern in self.risk_patterns):
+            return None
+        print_message(f"Auto-approved the {request.kind} ({lines} lines, no risky changes)", style="result")
+        return APPROVE, None
+
+
+class TerminalApprovalPolicy(ApprovalPolicy):
+    name = "terminal"
+
+    async def decide(self, request: ApprovalRequest) -> Decision | None:
+        return await user_input([(str(index), option) for index, option in enumerate(request.options, start=1)])
+
+
+def parse_linear_reply(body: str, options: list[str]) -> Decision | None:
+    if (match := LINEAR_REPLY_PATTERN.match(body)) is None:
+        return None
+    choice, comment = match.group(1).lower(), match.group(2).strip() or None
+    if choice not in options or (choice == COMMENT and comment is None):
+        return None
+    return choice, comment
+
+
+class LinearApprovalPolicy(ApprovalPolicy):
+    name = "linear"
+
+    def __init__(self, poll_interval: float = APPROVAL_LINEAR_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+
+    async def decide(self, request: ApprovalRequest) -> Decision | None:
+        replies = ", ".join(
+            f"`/{option} <text>`" if option == COMMENT else f"`/{option}`" for option in request.options
+        )
+        await enqueue_comment(
+            task_id=request.task_id,
+            body=f"Waiting for approval of the {request.kind}:\n\n{request.body}\n\nReply with one of: {replies}",
+            idempotency_key=f"approval:{request.id}",
+        )
+        while True:
+            try:
+                comments = await list_issue_comments(task_id=request.task_id, created_after=request.created_at)
+            except LinearError as e:
+                print_message(f"Failed to read Linear comments: {e}", style="error")
+                comments = []
+            for comment in comments:
+                if decision := parse_linear_reply(comment.get("body") or "", request.options):
+                    print_message(f"The {request.kind} was answered on Linear: {decision[0]}", style="result")
+                    return decision
+            await asyncio.sleep(self.poll_interval)
+
+
+class SocketApprovalPolicy(ApprovalPolicy):
+    name = "socket"
+
+    def __init__(self, path: Path = APPROVAL_SOCKET_PATH):
+        self.path = path
+
+    async def decide(self, request: ApprovalRequest) -> Decision | None:
+        print_message(
+            f"Waiting for approval of the {request.kind}: "
+            f"uv run main.py approve {request.task_identifier} [{' | '.join(request.options)}]",
+            style="heading",
+        )
+        # Answers arrive through the approval server, which resolves the request in the queue
+        await asyncio.Event().wait()
+        return None
+
+
+POLICIES: dict[str, type[ApprovalPolicy]] = {
+    policy.name: policy
+    for policy in (AutoApprovalPolicy, TerminalApprovalPolicy, LinearApprovalPolicy, SocketApprovalPolicy)
+}
+
+
+def build_policies(names: list[str]) -> list[ApprovalPolicy]:
+    if unknown := [name for name in names if name not in POLICIES]:
+        raise SettingsError(f"Unknown approval policies: {', '.join(unknown)}, expected: {', '.join(POLICIES)}")
+    policies = [POLICIES[name]() for name in names]
+    # Requests the non-interactive policies can not decide still need someone to answer them
+    if not any(policy.interactive for policy in policies):
+        policies.append(TerminalApprovalPolicy())
+    return policies
+
+
+class ApprovalQueue:
+    def __init__(self, policy_names: list[str] = APPROVAL_POLICIES, socket_path: Path = APPROVAL_SOCKET_PATH):
+        self.policy_names = policy_names
+        self.socket_path = socket_path
+        self._policies: list[ApprovalPolicy] | None = None
+        self._pending: dict[str, tuple[ApprovalRequest, asyncio.Future[Decision]]] = {}
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def policies(self) -> list[ApprovalPolicy]:
+        if self._policies is None:
+            self._policies = build_policies(self.policy_names)
+        return self._policies
+
+    @property
+    def pending(self) -> list[ApprovalRequest]:
+        return [request for request, _ in self._pending.values()]
+
+    async def request(self, task: LinearIssue, kind: str, body: str, options: list[str]) -> Decision:
+        request = ApprovalRequest(
+            id=uuid.uuid4().hex[:8],
+            task_id=task.id,
+            task_identifier=task.identifier,
+            kind=kind,
+            body=body,
+            options=options,
+            created_at=datetime.now(UTC).isoformat(),
+        )
+        for policy in self.policies:
+            if not policy.interactive and (decision := await policy.decide(request)):
+                return decision
+
+        # Only this workflow waits, the others keep running and may queue their own requests
+        future: asyncio.Future[Decision] = asyncio.get_running_loop().create_future()
+        self._pending[request.id] = (request, future)
+        waiters = [asyncio.create_task(policy.decide(request)) for policy in self.policies if policy.interactive]
+        try:
+            while not future.done():
+                done, _ = await asyncio.wait([future, *waiters], return_when=asyncio.FIRST_COMPLETED)
+                for waiter in done:
+                    if waiter is future:
+                        continue
+                    waiters.remove(waiter)
+                    if (decision := waiter.result()) is not None and not future.done():
+                        future.set_result(decision)
+            return future.result()
+        finally:
+            del self._pending[request.id]
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+
+    def answer(self, task_identifier: str, choice: str, comment: str | None = None) -> ApprovalRequest:
+        for request, future in self._pending.values():
+            if request.task_identifier.lower() != task_identifier.lower() or future.done():
+                continue
+            if choice not in request.options:
+                raise ApprovalError(f"Invalid choice '{choice}', expected one of: {', '.join(request.options)}")
+            if choice == COMMENT and not comment:
+                raise ApprovalError("A comment is required")
+            future.set_result((choice, comment))
+            return request
+        raise ApprovalError(f"No pending approval for {task_identifier}")
+
+    async def start(self) -> None:
+        if self._runner is not None or not any(isinstance(policy, SocketApprovalPolicy) for policy in self.policies):
+            return
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # A socket left behind by a crashed run would make the bind fail
+        self.socket_path.unlink(missing_ok=True)
+        self._runner = web.AppRunner(create_approval_app(self))
+        await self._runner.setup()
+        await web.UnixSite(self._runner, str(self.socket_path)).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            self.socket_path.unlink(missing_ok=True)
+
+
+def create_approval_app(queue: ApprovalQueue) -> web.Application:
+    async def list_approvals(request: web.Request) -> web.Response:
+        return web.json_response([asdict(pending) for pending in queue.pending])
+
+    async def answer_approval(request: web.Request) -> web.Response:
+        try:
+            payload = await request.json()
+            answered = queue.answer(payload["task"], payload["choice"], payload.get("comment"))
+        except (ValueError, KeyError, TypeError) as e:
+            return web.json_response({"error": f"Invalid request: {e}"}, status=400)
+        except ApprovalError as e:
+            return web.json_response({"error": str(e)}, status=409)
+        return web.json_response(asdict(answered))
+
+    app = web.Application()
+    app.router.add_get("/approvals", list_approvals)
+    app.router.add_post("/approvals", answer_approval)
+    return app
+
+
+async def call_approval_server(
+    method: str, payload: dict | None = None, socket_path: Path = APPROVAL_SOCKET_PATH
+) -> Any:
+    try:
+        async with (
+            aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=str(socket_path))) as session,
+            session.request(method, "http://demetra/approvals", json=payload) as response,
+        ):
+            result = await response.json()
+    except aiohttp.ClientError as e:
+        raise ApprovalError(f"No Demetra run is listening on {socket_path}, is the socket policy enabled?") from e
+    if response.status >= 400:
+        raise ApprovalError(result.get("error", f"Approval server error {response.status}"))
+    return result
+
+
+async def show_approvals(socket_path: Path = APPROVAL_SOCKET_PATH) -> None:
+    pending = [ApprovalRequest(**item) for item in await call_approval_server("GET", socket_path=socket_path)]
+    if not pending:
+        print_message("No pending approvals", style="error")
+        return
+    print_message("Pending approvals", style="heading")
+    for request in pending:
+        print_message(f"{request.task_identifier}: {request.kind} [{' | '.join(request.options)}]", style="heading")
+        print_message(request.body)
+
+
+async def send_approval(
+    task_identifier: str, choice: str, comment: str | None = None, socket_path: Path = APPROVAL_SOCKET_PATH
+) -> None:
+    payload = {"task": task_identifier, "choice": choice, "comment": comment}
+    answered = ApprovalRequest(**await call_approval_server("POST", payload, socket_path=socket_path))
+    print_message(f"Answered the {answered.kind} of {answered.task_identifier}: {choice}", style="result")
+
+
+approvals = ApprovalQueue()
+
+
+async def request_approval(task: LinearIssue, kind: str, body: str, options: list[str]) -> Decision:
+    return await approvals.request(task=task, kind=kind, body=body, options=options)
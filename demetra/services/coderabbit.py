@@ -1,7 +1,8 @@
 from pathlib import Path
 
+from demetra.services.scheduler import POOL_AGENT
 from demetra.services.subprocess import run_command
-from demetra.settings import CODERABBIT_PATH
+from demetra.settings import AGENT_IDLE_TIMEOUT, AGENT_TIMEOUT, CODERABBIT_PATH
 
 
 async def review_agent(target_path: Path) -> tuple[int, str, str]:
@@ -10,4 +11,10 @@ async def review_agent(target_path: Path) -> tuple[int, str, str]:
 
 async def run_coderabbit_agent(target_path: Path) -> tuple[int, str, str]:
     command = [str(CODERABBIT_PATH), "review", "--prompt-only", "--no-color", "--type", "uncommitted"]
-    return await run_command(command=command, target_path=target_path)
+    return await run_command(
+        command=command,
+        target_path=target_path,
+        timeout=AGENT_TIMEOUT,
+        idle_timeout=AGENT_IDLE_TIMEOUT,
+        pool=POOL_AGENT,
+    )
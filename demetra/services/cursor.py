@@ -1,7 +1,8 @@
 from pathlib import Path
 
+from demetra.services.scheduler import POOL_AGENT
 from demetra.services.subprocess import run_command
-from demetra.settings import CURSOR_PATH
+from demetra.settings import AGENT_IDLE_TIMEOUT, AGENT_TIMEOUT, CURSOR_PATH
 
 
 async def review_agent(target_path: Path, session_id: str | None = None) -> tuple[int, str, str]:
@@ -19,4 +20,10 @@ async def run_cursor_agent(target_path: Path, task: str, session_id: str | None
     command = [str(CURSOR_PATH), "--plan", "--print", task, "--force"]
     if session_id is not None:
         command.extend(["--session", session_id])
-    return await run_command(command=command, target_path=target_path)
+    return await run_command(
+        command=command,
+        target_path=target_path,
+        timeout=AGENT_TIMEOUT,
+        idle_timeout=AGENT_IDLE_TIMEOUT,
+        pool=POOL_AGENT,
+    )
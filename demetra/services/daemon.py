@@ -0,0 +1,126 @@
+import asyncio
+from pathlib import Path
+
+from demetra.exceptions import LinearError
+from demetra.models import LinearIssue
+from demetra.services.database import list_issues
+from demetra.services.linear import TODO_STATE_NAME, claim_linear_task, sync_issues
+from demetra.services.scheduler import scheduler
+from demetra.services.tui import print_message
+from demetra.services.webhook import IssueQueue, WebhookReceiver, start_webhook_server
+from demetra.services.workflow import run_workflow
+from demetra.settings import DAEMON_CONCURRENCY, DAEMON_POLL_INTERVAL, LINEAR_ISSUES_LIMIT
+
+
+class Daemon:
+    def __init__(
+        self,
+        projects: dict[str, Path],
+        concurrency: int = DAEMON_CONCURRENCY,
+        poll_interval: float = DAEMON_POLL_INTERVAL,
+        webhook: bool = False,
+    ):
+        self.projects = {name.lower(): path for name, path in projects.items()}
+        self.concurrency = max(concurrency, 1)
+        self.poll_interval = poll_interval
+        self.webhook = webhook
+        self.queue = IssueQueue()
+        self.running: set[str] = set()
+        # Failed and stopped workflows move their issue back to TODO, polling must not start them over and over
+        self.failed: set[str] = set()
+        self._stopping = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def stop(self) -> None:
+        if self.stopping:
+            # A second signal does not wait for running workflows, their cleanup still runs on cancel
+            print_message("Cancelling running workflows", style="error")
+            for task in self._tasks:
+                task.cancel()
+            return
+        print_message("Stopping, waiting for running workflows to finish", style="heading")
+        self._stopping.set()
+
+    async def serve(self) -> None:
+        self._tasks = [asyncio.create_task(self.run_poller())]
+        self._tasks.extend(asyncio.create_task(self.run_worker()) for _ in range(self.concurrency))
+        runner = None
+        if self.webhook:
+            runner = await start_webhook_server(WebhookReceiver(queue=self.queue, projects=list(self.projects)))
+        try:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            if runner is not None:
+                await runner.cleanup()
+
+    async def poll(self) -> int:
+        try:
+            await sync_issues()
+        except LinearError:
+            print_message("Failed to sync Linear issues, using the local copy", style="error")
+
+        queued = 0
+        for project_name in self.projects:
+            for issue in await list_issues(project_name, state_name=TODO_STATE_NAME, limit=LINEAR_ISSUES_LIMIT):
+                if issue.id not in self.queue and issue.id not in self.running and issue.id not in self.failed:
+                    self.queue.put(issue)
+                    queued += 1
+        return queued
+
+    def print_status(self) -> None:
+        status = f"{len(self.running)} running, {len(self.queue)} queued"
+        if pools := scheduler.describe():
+            status += f" | {pools}"
+        print_message(status, style="result")
+
+    async def run_poller(self) -> None:
+        while not self.stopping:
+            if await self.poll() or self.running:
+                self.print_status()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except TimeoutError:
+                pass
+
+    async def next_issue(self) -> LinearIssue | None:
+        if self.stopping:
+            return None
+        get_task = asyncio.ensure_future(self.queue.get())
+        stop_task = asyncio.ensure_future(self._stopping.wait())
+        try:
+            await asyncio.wait({get_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            get_task.cancel()
+            stop_task.cancel()
+        if get_task.cancelled():
+            return None
+        issue = get_task.result()
+        if self.stopping:
+            # Queued issues are not claimed yet, so the ones left behind on stop stay in TODO
+            self.queue.put(issue)
+            return None
+        return issue
+
+    async def run_worker(self) -> None:
+        while (issue := await self.next_issue()) is not None:
+            project_path = self.projects.get(issue.project_name.lower())
+            if project_path is None or issue.id in self.failed or not await claim_linear_task(issue.id):
+                continue
+
+            self.running.add(issue.id)
+            print_message(f"Starting task: {issue.identifier} - {issue.title}", style="heading")
+            completed = False
+            try:
+                completed = await run_workflow(task=issue, project_path=project_path)
+            except Exception as e:  # noqa: BLE001
+                # One broken workflow must not take the worker down with it
+                print_message(f"{issue.identifier} failed: {e!r}", style="error")
+            finally:
+                self.running.discard(issue.id)
+            if not completed:
+                self.failed.add(issue.id)
+                print_message(f"{issue.identifier} did not complete, it is not retried until serve restarts")
@@ -0,0 +1,200 @@
+import asyncio
+import time
+from collections import Counter, defaultdict
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from graphlib import CycleError, TopologicalSorter
+from typing import Any, final
+
+from demetra.exceptions import DemetraError, InfiniteLoopError, StepTimeoutError, WorkflowGraphError
+from demetra.services.logs import set_log_step
+from demetra.services.tui import print_message
+
+
+@final
+@dataclass
+class Loop:
+    target: str
+    values: dict[str, Any] = field(default_factory=dict)
+
+
+@final
+@dataclass
+class Stop:
+    reason: str
+
+
+StepResult = dict[str, Any] | Loop | Stop | None
+
+
+@dataclass
+class Step:
+    name: str
+    action: Callable[..., Awaitable[StepResult]]
+    needs: tuple[str, ...] = ()
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+    loops: tuple[str, ...] = ()
+    when: Callable[..., Awaitable[bool]] | None = None
+    retries: int = 0
+    retry_delay: float = 1.0
+    timeout: float | None = None
+    # How often loop-back edges may re-enter this step, None allows it without a limit
+    max_loops: int | None = 0
+    # Steps without a checkpoint run again when a run is resumed
+    checkpoint: bool = True
+
+
+class Workflow:
+    def __init__(self, steps: list[Step]):
+        self.steps = {step.name: step for step in steps}
+        if len(self.steps) != len(steps):
+            raise WorkflowGraphError("Step names must be unique")
+
+        for step in steps:
+            if missing := set(step.needs) - self.steps.keys():
+                raise WorkflowGraphError(f"Step '{step.name}' needs unknown steps: {', '.join(sorted(missing))}")
+        try:
+            self.order = list(TopologicalSorter({step.name: step.needs for step in steps}).static_order())
+        except CycleError as e:
+            raise WorkflowGraphError(f"Workflow has a cycle: {' -> '.join(e.args[1])}") from e
+
+        self.ancestors: dict[str, set[str]] = {}
+        for name in self.order:
+            self.ancestors[name] = set()
+            for need in self.steps[name].needs:
+                self.ancestors[name] |= {need} | self.ancestors[need]
+        self.descendants: dict[str, set[str]] = defaultdict(set)
+        for name, ancestors in self.ancestors.items():
+            for ancestor in ancestors:
+                self.descendants[ancestor].add(name)
+
+        for step in steps:
+            if invalid := set(step.loops) - self.ancestors[step.name]:
+                raise WorkflowGraphError(
+                    f"Step '{step.name}' loops back to non-ancestors: {', '.join(sorted(invalid))}"
+                )
+
+    def check_inputs(self, state: dict[str, Any]) -> None:
+        for name in self.order:
+            step = self.steps[name]
+            available = set(state).union(*(self.steps[ancestor].outputs for ancestor in self.ancestors[name]))
+            if missing := set(step.inputs) - available:
+                raise WorkflowGraphError(f"Step '{name}' has no source for inputs: {', '.join(sorted(missing))}")
+
+
+class WorkflowRun:
+    def __init__(
+        self,
+        workflow: Workflow,
+        state: dict[str, Any],
+        completed_steps: Iterable[str] = (),
+        loops: dict[str, int] | None = None,
+        on_progress: Callable[["WorkflowRun", str], Awaitable[None]] | None = None,
+    ):
+        self.workflow = workflow
+        # Steps write their outputs into the shared state, so callers can clean up after failures
+        self.state = state
+        self.completed = False
+        self.stopped: Stop | None = None
+        self.done: set[str] = {
+            name for name in completed_steps if name in workflow.steps and workflow.steps[name].checkpoint
+        }
+        self.skipped: set[str] = set()
+        self.loops: Counter[str] = Counter(loops or {})
+        self.durations: Counter[str] = Counter()
+        self.on_progress = on_progress
+
+    async def execute(self) -> bool:
+        self.workflow.check_inputs(self.state)
+        pending = set(self.workflow.order) - self.done
+        running: dict[asyncio.Task, str] = {}
+        try:
+            while pending or running:
+                for name in self.workflow.order:
+                    if name in pending and self.done.issuperset(self.workflow.steps[name].needs):
+                        pending.remove(name)
+                        running[asyncio.create_task(self.run_step(self.workflow.steps[name]))] = name
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(finished, key=lambda task: self.workflow.order.index(running[task])):
+                    name = running.pop(task)
+                    if name in pending:
+                        # Reset by a loop-back edge handled earlier in this batch
+                        continue
+                    result = task.result()
+                    if isinstance(result, Stop):
+                        self.stopped = result
+                        return False
+                    if isinstance(result, Loop):
+                        await self.loop_back(self.workflow.steps[name], result, pending, running)
+                    else:
+                        self.done.add(name)
+                    if self.on_progress is not None:
+                        await self.on_progress(self, name)
+            self.completed = True
+            return True
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def loop_back(self, step: Step, loop: Loop, pending: set[str], running: dict[asyncio.Task, str]) -> None:
+        if loop.target not in step.loops:
+            raise WorkflowGraphError(f"Step '{step.name}' has no loop-back edge to '{loop.target}'")
+        target = self.workflow.steps[loop.target]
+        self.loops[target.name] += 1
+        if target.max_loops is not None and self.loops[target.name] > target.max_loops:
+            raise InfiniteLoopError(f"Step '{target.name}' was re-entered more than {target.max_loops} times")
+
+        self.state.update(self.check_outputs(step, loop.values))
+        reset = {target.name} | self.workflow.descendants[target.name]
+        cancelled = [task for task, name in running.items() if name in reset]
+        for task in cancelled:
+            task.cancel()
+            running.pop(task)
+        await asyncio.gather(*cancelled, return_exceptions=True)
+        self.done -= reset
+        self.skipped -= reset
+        pending |= reset
+
+    def check_outputs(self, step: Step, values: dict[str, Any]) -> dict[str, Any]:
+        if undeclared := set(values) - set(step.outputs):
+            raise WorkflowGraphError(f"Step '{step.name}' returned undeclared outputs: {', '.join(sorted(undeclared))}")
+        return values
+
+    async def run_step(self, step: Step) -> StepResult:
+        # Every step runs in its own task, so the log step does not leak into concurrent steps
+        set_log_step(step.name)
+        inputs = {key: self.state[key] for key in step.inputs}
+        if step.when is not None and not await step.when(**inputs):
+            self.skipped.add(step.name)
+            return None
+
+        for attempt in range(step.retries + 1):
+            started_at = time.monotonic()
+            timeout = asyncio.timeout(step.timeout)
+            try:
+                async with timeout:
+                    result = await step.action(**inputs)
+            except TimeoutError as e:
+                if not timeout.expired():
+                    raise
+                error: DemetraError | OSError = StepTimeoutError(
+                    f"Step '{step.name}' hit timeout of {step.timeout} seconds"
+                )
+                error.__cause__ = e
+            except (DemetraError, OSError) as e:
+                error = e
+            else:
+                if isinstance(result, dict):
+                    self.state.update(self.check_outputs(step, result))
+                return result
+            finally:
+                self.durations[step.name] += time.monotonic() - started_at
+
+            if attempt == step.retries:
+                raise error
+            print_message(f"Step '{step.name}' failed: {error}, retrying", style="error")
+            await asyncio.sleep(step.retry_delay)
+        return None
@@ -1,3 +1,4 @@
+import json
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from datetime import UTC, datetime
@@ -5,7 +6,8 @@ from datetime import UTC, datetime
 import aiosqlite
 from aiosqlite import Connection
 
-from demetra.models import Session
+from demetra.exceptions import DemetraError
+from demetra.models import Checkpoint, CommandLog, LinearIssue, OutboxMessage, Session
 from demetra.settings import DB_PATH
 
 
@@ -22,6 +24,8 @@ async def get_connection() -> AsyncGenerator[Connection]:
 
 async def init_db() -> None:
     async with get_connection() as connection:
+        # WAL lets concurrent workflows read while another one writes
+        await connection.execute("PRAGMA journal_mode=WAL")
         await connection.execute(
             """
             CREATE TABLE IF NOT EXISTS sessions (
@@ -33,6 +37,100 @@ async def init_db() -> None:
             )
             """
         )
+        await connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS issues (
+                id TEXT NOT NULL PRIMARY KEY,
+                identifier TEXT NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                branch_name TEXT NOT NULL,
+                project_name TEXT NOT NULL COLLATE NOCASE,
+                state_name TEXT NOT NULL COLLATE NOCASE
+            )
+            """
+        )
+        await connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS issues_project_state_idx
+            ON issues (project_name, state_name, priority, created_at DESC)
+            """
+        )
+        await connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT NOT NULL PRIMARY KEY,
+                watermark TEXT NOT NULL
+            )
+            """
+        )
+        await connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                issue_id TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                variables TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                available_at TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        await connection.execute("CREATE INDEX IF NOT EXISTS outbox_status_issue_idx ON outbox (status, issue_id, id)")
+        await connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS command_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                task_identifier TEXT NOT NULL COLLATE NOCASE,
+                step TEXT NOT NULL,
+                command TEXT NOT NULL,
+                path TEXT NOT NULL,
+                exit_code INTEGER,
+                size INTEGER NOT NULL DEFAULT 0,
+                started_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+            """
+        )
+        await connection.execute(
+            "CREATE INDEX IF NOT EXISTS command_logs_task_run_idx ON command_logs (task_identifier, run_id, id)"
+        )
+        await connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                task_id TEXT NOT NULL PRIMARY KEY,
+                task_identifier TEXT NOT NULL COLLATE NOCASE,
+                project_path TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                completed_steps TEXT NOT NULL,
+                loops TEXT NOT NULL,
+                state TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        await connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS plan_cache (
+                key TEXT NOT NULL PRIMARY KEY,
+                plan TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                used_at TEXT NOT NULL
+            )
+            """
+        )
         await connection.commit()
 
 
@@ -59,3 +157,409 @@ async def get_session(task_id: str) -> Session | None:
             updated_at=row["updated_at"],
         )
     return None
+
+
+async def get_issue(issue_id: str) -> LinearIssue | None:
+    async with get_connection() as connection:
+        cursor = await connection.execute("SELECT * FROM issues WHERE id = ?", (issue_id,))
+        row = await cursor.fetchone()
+    return build_issue(row) if row else None
+
+
+async def upsert_issues(issues: list[LinearIssue]) -> None:
+    async with get_connection() as connection:
+        await connection.executemany(
+            """
+            INSERT INTO issues (
+                id, identifier, title, description, priority, created_at, updated_at, branch_name, project_name, state_name
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                identifier = excluded.identifier,
+                title = excluded.title,
+                description = excluded.description,
+                priority = excluded.priority,
+                updated_at = excluded.updated_at,
+                branch_name = excluded.branch_name,
+                project_name = excluded.project_name,
+                state_name = excluded.state_name
+            """,
+            [
+                (
+                    issue.id,
+                    issue.identifier,
+                    issue.title,
+                    issue.description,
+                    issue.priority,
+                    issue.created_at,
+                    issue.updated_at,
+                    issue.branch_name,
+                    issue.project_name,
+                    issue.state_name,
+                )
+                for issue in issues
+            ],
+        )
+        await connection.commit()
+
+
+async def delete_issues(issue_ids: list[str]) -> None:
+    async with get_connection() as connection:
+        await connection.executemany("DELETE FROM issues WHERE id = ?", [(issue_id,) for issue_id in issue_ids])
+        await connection.commit()
+
+
+def build_issue(row: aiosqlite.Row) -> LinearIssue:
+    return LinearIssue(
+        id=row["id"],
+        identifier=row["identifier"],
+        title=row["title"],
+        description=row["description"],
+        priority=row["priority"],
+        created_at=row["created_at"],
+        branch_name=row["branch_name"],
+        updated_at=row["updated_at"],
+        project_name=row["project_name"],
+        state_name=row["state_name"],
+    )
+
+
+async def list_issues(project_name: str, state_name: str, limit: int) -> list[LinearIssue]:
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            """
+            SELECT * FROM issues
+            WHERE project_name = ? AND state_name = ?
+            ORDER BY priority, created_at DESC
+            LIMIT ?
+            """,
+            (project_name, state_name, limit),
+        )
+        rows = await cursor.fetchall()
+    return [build_issue(row) for row in rows]
+
+
+async def claim_issues(project_name: str, state_name: str, claimed_state_name: str, limit: int) -> list[LinearIssue]:
+    # A single UPDATE moves the issues out of the state, so concurrent runs never claim the same issue
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            """
+            UPDATE issues SET state_name = ?
+            WHERE id IN (
+                SELECT id FROM issues
+                WHERE project_name = ? AND state_name = ?
+                ORDER BY priority, created_at DESC
+                LIMIT ?
+            )
+            RETURNING *
+            """,
+            (claimed_state_name, project_name, state_name, limit),
+        )
+        rows = await cursor.fetchall()
+        await connection.commit()
+    issues = sorted((build_issue(row) for row in rows), key=lambda issue: issue.created_at, reverse=True)
+    return sorted(issues, key=lambda issue: issue.priority)
+
+
+async def claim_issue(issue_id: str, state_name: str, claimed_state_name: str) -> bool:
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            "UPDATE issues SET state_name = ? WHERE id = ? AND state_name = ?",
+            (claimed_state_name, issue_id, state_name),
+        )
+        await connection.commit()
+    return cursor.rowcount == 1
+
+
+async def update_issue_state(issue_id: str, state_name: str) -> None:
+    async with get_connection() as connection:
+        await connection.execute("UPDATE issues SET state_name = ? WHERE id = ?", (state_name, issue_id))
+        await connection.commit()
+
+
+async def get_sync_watermark(key: str) -> str | None:
+    async with get_connection() as connection:
+        cursor = await connection.execute("SELECT watermark FROM sync_state WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+    return row["watermark"] if row else None
+
+
+async def set_sync_watermark(key: str, watermark: str) -> None:
+    async with get_connection() as connection:
+        await connection.execute(
+            "INSERT INTO sync_state (key, watermark) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET watermark = excluded.watermark",
+            (key, watermark),
+        )
+        await connection.commit()
+
+
+def build_outbox_message(row: aiosqlite.Row) -> OutboxMessage:
+    return OutboxMessage(
+        id=row["id"],
+        idempotency_key=row["idempotency_key"],
+        issue_id=row["issue_id"],
+        operation=row["operation"],
+        variables=json.loads(row["variables"]),
+        status=row["status"],
+        attempts=row["attempts"],
+        last_error=row["last_error"],
+        available_at=row["available_at"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
+async def create_outbox_message(idempotency_key: str, issue_id: str, operation: str, variables: dict) -> OutboxMessage:
+    now = datetime.now(UTC).isoformat()
+    async with get_connection() as connection:
+        # A message with the same key is already recorded, keep the original
+        await connection.execute(
+            """
+            INSERT OR IGNORE INTO outbox (
+                idempotency_key, issue_id, operation, variables, status, available_at, created_at, updated_at
+            ) VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)
+            """,
+            (idempotency_key, issue_id, operation, json.dumps(variables), now, now, now),
+        )
+        await connection.commit()
+        cursor = await connection.execute("SELECT * FROM outbox WHERE idempotency_key = ?", (idempotency_key,))
+        row = await cursor.fetchone()
+    if row is None:
+        raise DemetraError(f"Outbox message {idempotency_key} was not stored")
+    return build_outbox_message(row)
+
+
+async def list_outbox_heads() -> list[OutboxMessage]:
+    # Only the oldest pending message of every issue can be delivered, this keeps per-issue order
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            """
+            SELECT * FROM outbox WHERE id IN (
+                SELECT MIN(id) FROM outbox WHERE status = 'pending' GROUP BY issue_id
+            ) ORDER BY id
+            """
+        )
+        rows = await cursor.fetchall()
+    return [build_outbox_message(row) for row in rows]
+
+
+async def count_pending_outbox_messages() -> int:
+    async with get_connection() as connection:
+        cursor = await connection.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'")
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def update_outbox_message(
+    message_id: int,
+    status: str,
+    attempts: int,
+    last_error: str | None = None,
+    available_at: str | None = None,
+    variables: dict | None = None,
+) -> None:
+    now = datetime.now(UTC).isoformat()
+    async with get_connection() as connection:
+        await connection.execute(
+            """
+            UPDATE outbox SET status = ?, attempts = ?, last_error = ?, available_at = COALESCE(?, available_at),
+                variables = COALESCE(?, variables), updated_at = ?
+            WHERE id = ?
+            """,
+            (
+                status,
+                attempts,
+                last_error,
+                available_at,
+                json.dumps(variables) if variables is not None else None,
+                now,
+                message_id,
+            ),
+        )
+        await connection.commit()
+
+
+def build_command_log(row: aiosqlite.Row) -> CommandLog:
+    return CommandLog(
+        id=row["id"],
+        run_id=row["run_id"],
+        task_id=row["task_id"],
+        task_identifier=row["task_identifier"],
+        step=row["step"],
+        command=row["command"],
+        path=row["path"],
+        exit_code=row["exit_code"],
+        size=row["size"],
+        started_at=row["started_at"],
+        finished_at=row["finished_at"],
+    )
+
+
+async def create_command_log(
+    run_id: str, task_id: str, task_identifier: str, step: str, command: str, path: str
+) -> CommandLog:
+    now = datetime.now(UTC).isoformat()
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            """
+            INSERT INTO command_logs (run_id, task_id, task_identifier, step, command, path, started_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (run_id, task_id, task_identifier, step, command, path, now),
+        )
+        await connection.commit()
+        cursor = await connection.execute("SELECT * FROM command_logs WHERE id = ?", (cursor.lastrowid,))
+        row = await cursor.fetchone()
+    if row is None:
+        raise DemetraError(f"Command log of {task_identifier} {step} was not stored")
+    return build_command_log(row)
+
+
+async def finish_command_log(log_id: int, exit_code: int | None, size: int) -> None:
+    now = datetime.now(UTC).isoformat()
+    async with get_connection() as connection:
+        await connection.execute(
+            "UPDATE command_logs SET exit_code = ?, size = ?, finished_at = ? WHERE id = ?",
+            (exit_code, size, now, log_id),
+        )
+        await connection.commit()
+
+
+async def list_command_logs(
+    task_identifier: str | None = None, run_id: str | None = None, step: str | None = None
+) -> list[CommandLog]:
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            """
+            SELECT * FROM command_logs
+            WHERE (:task_identifier IS NULL OR task_identifier = :task_identifier)
+                AND (:run_id IS NULL OR run_id = :run_id)
+                AND (:step IS NULL OR step = :step)
+            ORDER BY id
+            """,
+            {"task_identifier": task_identifier, "run_id": run_id, "step": step},
+        )
+        rows = await cursor.fetchall()
+    return [build_command_log(row) for row in rows]
+
+
+def build_checkpoint(row: aiosqlite.Row) -> Checkpoint:
+    return Checkpoint(
+        task_id=row["task_id"],
+        task_identifier=row["task_identifier"],
+        project_path=row["project_path"],
+        stage=row["stage"],
+        completed_steps=json.loads(row["completed_steps"]),
+        loops=json.loads(row["loops"]),
+        state=json.loads(row["state"]),
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
+async def save_checkpoint(
+    task_id: str,
+    task_identifier: str,
+    project_path: str,
+    stage: str,
+    completed_steps: list[str],
+    loops: dict[str, int],
+    state: dict,
+) -> None:
+    now = datetime.now(UTC).isoformat()
+    async with get_connection() as connection:
+        await connection.execute(
+            """
+            INSERT INTO checkpoints (
+                task_id, task_identifier, project_path, stage, completed_steps, loops, state, created_at, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (task_id) DO UPDATE SET
+                project_path = excluded.project_path,
+                stage = excluded.stage,
+                completed_steps = excluded.completed_steps,
+                loops = excluded.loops,
+                state = excluded.state,
+                updated_at = excluded.updated_at
+            """,
+            (
+                task_id,
+                task_identifier,
+                project_path,
+                stage,
+                json.dumps(completed_steps),
+                json.dumps(loops),
+                json.dumps(state),
+                now,
+                now,
+            ),
+        )
+        await connection.commit()
+
+
+async def get_checkpoint(task_id: str | None = None, task_identifier: str | None = None) -> Checkpoint | None:
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            "SELECT * FROM checkpoints WHERE task_id = :task_id OR task_identifier = :task_identifier",
+            {"task_id": task_id, "task_identifier": task_identifier},
+        )
+        row = await cursor.fetchone()
+    return build_checkpoint(row) if row else None
+
+
+async def list_checkpoints() -> list[Checkpoint]:
+    async with get_connection() as connection:
+        cursor = await connection.execute("SELECT * FROM checkpoints ORDER BY updated_at DESC")
+        rows = await cursor.fetchall()
+    return [build_checkpoint(row) for row in rows]
+
+
+async def delete_checkpoint(task_id: str) -> None:
+    async with get_connection() as connection:
+        await connection.execute("DELETE FROM checkpoints WHERE task_id = ?", (task_id,))
+        await connection.commit()
+
+
+async def get_cached_plan(key: str, created_after: str) -> str | None:
+    async with get_connection() as connection:
+        cursor = await connection.execute(
+            "UPDATE plan_cache SET used_at = ? WHERE key = ? AND created_at > ? RETURNING plan",
+            (datetime.now(UTC).isoformat(), key, created_after),
+        )
+        row = await cursor.fetchone()
+        await connection.commit()
+    return row["plan"] if row else None
+
+
+async def store_cached_plan(key: str, plan: str) -> None:
+    now = datetime.now(UTC).isoformat()
+    async with get_connection() as connection:
+        await connection.execute(
+            """
+            INSERT INTO plan_cache (key, plan, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                plan = excluded.plan, size = excluded.size, created_at = excluded.created_at, used_at = excluded.used_at
+            """,
+            (key, plan, len(plan.encode()), now, now),
+        )
+        await connection.commit()
+
+
+async def evict_cached_plans(created_before: str, max_size: int) -> int:
+    async with get_connection() as connection:
+        cursor = await connection.execute("DELETE FROM plan_cache WHERE created_at <= ?", (created_before,))
+        expired = cursor.rowcount
+        # Least recently used plans go first once the cache is over its size budget
+        cursor = await connection.execute(
+            """
+            DELETE FROM plan_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY used_at DESC, key) AS total FROM plan_cache
+                )
+                WHERE total > ?
+            )
+            """,
+            (max_size,),
+        )
+        await connection.commit()
+    return expired + cursor.rowcount
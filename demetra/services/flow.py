@@ -1,34 +1,60 @@
 import asyncio
 
+from demetra.services.output import current_channel, output
 from demetra.services.tui import print_message
 
 
+input_lock = asyncio.Lock()
+
+
 async def user_input(options: list[tuple[str, str]]) -> tuple[str, str | None]:
-    print_message("How would you like to proceed?")
-
-    choices = []
-    choice_map = {}
-    for index, option in options:
-        choices.extend([index, option])
-        choice_map[index] = option
-        print_message(f"  [{index}] {option}{' - default' if index == '1' else ''}")
-
-    loop = asyncio.get_event_loop()
-    while True:
-        action = await loop.run_in_executor(None, lambda: input("Action: ").strip().lower())
-        if not action:
-            action = choice_map.get("1", "")
-        if action in choices:
-            break
-        print_message("Invalid choice. Please try again.")
-
-    action = choice_map[action] if action in choice_map else action
-
-    comment = None
-    if action == "comment":
+    # Concurrent workflows share one terminal, so only one of them asks at a time
+    await input_lock.acquire()
+    reader: asyncio.Future[str] | None = None
+    try:
+        prefix = f"[{channel}] " if output.labelled and (channel := current_channel.get()) else ""
+        print_message("How would you like to proceed?")
+
+        choices = []
+        choice_map = {}
+        for index, option in options:
+            choices.extend([index, option])
+            choice_map[index] = option
+            print_message(f"  [{index}] {option}{' - default' if index == '1' else ''}")
+
+        loop = asyncio.get_event_loop()
         while True:
-            comment = await loop.run_in_executor(None, lambda: input("Enter comment: ").strip())
-            if comment:
+            # The prompt goes straight to the terminal, so buffered output has to be written first
+            await output.drain()
+            reader = asyncio.ensure_future(
+                loop.run_in_executor(None, lambda: input(f"{prefix}Action: ").strip().lower())
+            )
+            action = await asyncio.shield(reader)
+            if not action:
+                action = choice_map.get("1", "")
+            if action in choices:
                 break
-
-    return action, comment
+            print_message("Invalid choice. Please try again.")
+
+        action = choice_map[action] if action in choice_map else action
+
+        comment = None
+        if action == "comment":
+            while True:
+                await output.drain()
+                reader = asyncio.ensure_future(
+                    loop.run_in_executor(None, lambda: input(f"{prefix}Enter comment: ").strip())
+                )
+                comment = await asyncio.shield(reader)
+                if comment:
+                    break
+
+        return action, comment
+    finally:
+        if reader is not None and not reader.done():
+            # Another approver answered first, but input() can not be interrupted, so the
+            # terminal stays taken until the pending line is read
+            print_message("Answered elsewhere, press Enter to dismiss the prompt", style="result")
+            reader.add_done_callback(lambda _: input_lock.release())
+        else:
+            input_lock.release()
@@ -1,44 +1,417 @@
+import asyncio
+import hashlib
+import random
+import re
+import time
+from collections.abc import Coroutine, Iterator, Mapping
+from pathlib import Path
 from typing import Any
 
-import aiofiles
 import aiohttp
 
-from demetra.exceptions import LinearError
-from demetra.settings import BASE_PATH, LINEAR_API_KEY, LINEAR_API_URL
-
-
-async def get_todo_issues_query() -> str:
-    async with aiofiles.open(BASE_PATH / "demetra" / "services" / "queries" / "get_todo_issues.gql") as file:
-        content = await file.read()
-    return content
-
-
-async def list_states_query() -> str:
-    async with aiofiles.open(BASE_PATH / "demetra" / "services" / "queries" / "list_states.gql") as file:
-        content = await file.read()
-    return content
-
-
-async def graphql_request(query: str, variables: dict[str, Any] | None = None) -> dict:
-    if not LINEAR_API_KEY:
-        raise LinearError("LINEAR_API_KEY is not set")
-
-    payload = {"query": query}
-    if variables:
-        payload["variables"] = variables
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                LINEAR_API_URL,
-                json=payload,
-                headers={
-                    "Authorization": LINEAR_API_KEY,
-                    "Content-Type": "application/json",
-                },
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as response:
-                response.raise_for_status()
-                return await response.json()
-    except aiohttp.ClientError as e:
-        raise LinearError(f"Linear API error: {e}") from e
+from demetra.exceptions import DemetraError, GraphQLQueryError, LinearError
+from demetra.models import GraphQLQuery
+from demetra.settings import (
+    BASE_PATH,
+    LINEAR_API_KEY,
+    LINEAR_API_URL,
+    LINEAR_BATCH_SIZE,
+    LINEAR_BATCH_WINDOW,
+    LINEAR_DNS_CACHE_TTL,
+    LINEAR_KEEPALIVE_TIMEOUT,
+    LINEAR_MAX_RETRIES,
+    LINEAR_PERSISTED_QUERIES,
+    LINEAR_POOL_LIMIT,
+    LINEAR_POOL_LIMIT_PER_HOST,
+    LINEAR_RATE_LIMIT,
+    LINEAR_RATE_LIMIT_WINDOW,
+    LINEAR_REQUEST_TIMEOUT,
+    LINEAR_RETRY_BACKOFF,
+    LINEAR_RETRY_BACKOFF_MAX,
+)
+
+
+QUERIES_PATH = BASE_PATH / "demetra" / "services" / "queries"
+OPERATION_PATTERN = re.compile(r"\b(query|mutation|subscription)\s+([_A-Za-z][_0-9A-Za-z]*)")
+MUTATION_PATTERN = re.compile(
+    r"^\s*mutation\s+\w+\s*(?:\((?P<definitions>[^)]*)\))?\s*\{(?P<body>\s*(?P<field>\w+).*)\}\s*$", re.S
+)
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+RATE_LIMIT_LIMIT_HEADER = "X-RateLimit-Requests-Limit"
+RATE_LIMIT_REMAINING_HEADER = "X-RateLimit-Requests-Remaining"
+RATE_LIMIT_RESET_HEADER = "X-RateLimit-Requests-Reset"
+
+
+def parse_query(document: str, source: str = "<string>") -> GraphQLQuery:
+    document = document.strip()
+    operations = OPERATION_PATTERN.findall(document)
+    if len(operations) != 1:
+        raise GraphQLQueryError(f"{source}: expected exactly one named operation, found {len(operations)}")
+
+    depth = 0
+    for char in re.sub(r'"(?:\\.|[^"\\])*"|#[^\n]*', "", document):
+        if char in "{(":
+            depth += 1
+        elif char in "})":
+            depth -= 1
+        if depth < 0:
+            break
+    if depth != 0:
+        raise GraphQLQueryError(f"{source}: unbalanced brackets")
+
+    operation, name = operations[0]
+    return GraphQLQuery(
+        name=name, operation=operation, document=document, sha256=hashlib.sha256(document.encode()).hexdigest()
+    )
+
+
+class QueryRegistry:
+    def __init__(self, path: Path = QUERIES_PATH):
+        self.path = path
+        self._queries: dict[str, GraphQLQuery] = {}
+
+    def load(self) -> None:
+        for file_path in sorted(self.path.glob("*.gql")):
+            self.register(parse_query(file_path.read_text(), source=file_path.name))
+
+    def register(self, query: GraphQLQuery) -> None:
+        if query.name in self._queries:
+            raise GraphQLQueryError(f"Duplicate GraphQL operation '{query.name}'")
+        self._queries[query.name] = query
+
+    def __getitem__(self, name: str) -> GraphQLQuery:
+        if name not in self._queries:
+            raise GraphQLQueryError(f"Unknown GraphQL operation '{name}'")
+        return self._queries[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._queries
+
+    def __iter__(self) -> Iterator[GraphQLQuery]:
+        return iter(self._queries.values())
+
+
+queries = QueryRegistry()
+queries.load()
+
+
+class TokenBucket:
+    def __init__(self, capacity: float = LINEAR_RATE_LIMIT, window: float = LINEAR_RATE_LIMIT_WINDOW):
+        self.capacity = capacity
+        self.window = window
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.window
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                self.refill()
+                now = time.monotonic()
+                if self.blocked_until > now:
+                    await asyncio.sleep(self.blocked_until - now)
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    await asyncio.sleep((1 - self.tokens) / self.refill_rate)
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        try:
+            limit = int(headers[RATE_LIMIT_LIMIT_HEADER])
+            remaining = int(headers[RATE_LIMIT_REMAINING_HEADER])
+        except (KeyError, ValueError):
+            return
+
+        self.refill()
+        self.capacity = max(limit, 1)
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0 and (reset := headers.get(RATE_LIMIT_RESET_HEADER, "")).isdigit():
+            # Linear reports the reset time as a UNIX timestamp in milliseconds
+            self.blocked_until = time.monotonic() + max(int(reset) / 1000 - time.time(), 0)
+
+
+def retry_delay(attempt: int, headers: Mapping[str, str] | None = None, backoff: float = LINEAR_RETRY_BACKOFF) -> float:
+    delay = random.uniform(0, min(LINEAR_RETRY_BACKOFF_MAX, backoff * 2**attempt))  # noqa: S311 # nosec B311
+    if headers and (retry_after := headers.get("Retry-After", "")).isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+def is_mutation(query: GraphQLQuery | str) -> bool:
+    if isinstance(query, str):
+        return query.lstrip().startswith("mutation")
+    return query.operation == "mutation"
+
+
+def is_rate_limited(result: dict) -> bool:
+    return any((error.get("extensions") or {}).get("code") == "RATELIMITED" for error in result.get("errors") or [])
+
+
+class GraphQLClient:
+    def __init__(
+        self,
+        url: str = LINEAR_API_URL,
+        timeout: float = LINEAR_REQUEST_TIMEOUT,
+        limit: int = LINEAR_POOL_LIMIT,
+        limit_per_host: int = LINEAR_POOL_LIMIT_PER_HOST,
+        dns_cache_ttl: int = LINEAR_DNS_CACHE_TTL,
+        keepalive_timeout: float = LINEAR_KEEPALIVE_TIMEOUT,
+        persisted_queries: bool = LINEAR_PERSISTED_QUERIES,
+        max_retries: int = LINEAR_MAX_RETRIES,
+        backoff: float = LINEAR_RETRY_BACKOFF,
+        rate_limiter: TokenBucket | None = None,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.persisted_queries = persisted_queries
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self._persisted: set[str] = set()
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session is bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Content-Type": "application/json"},
+            )
+        return self._session
+
+    async def request(
+        self, query: GraphQLQuery | str, variables: dict[str, Any] | None = None, idempotent: bool | None = None
+    ) -> dict:
+        if not LINEAR_API_KEY:
+            raise LinearError("LINEAR_API_KEY is not set")
+        if idempotent is None:
+            idempotent = not is_mutation(query)
+
+        if isinstance(query, str):
+            return await self.post({"query": query}, variables, idempotent=idempotent)
+
+        if not self.persisted_queries:
+            return await self.post(
+                {"query": query.document, "operationName": query.name}, variables, idempotent=idempotent
+            )
+
+        # Automatic persisted queries: send the hash only once the server has seen the document
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query.sha256}}
+        if query.sha256 in self._persisted:
+            result = await self.post(
+                {"operationName": query.name, "extensions": extensions}, variables, idempotent=idempotent
+            )
+            if not is_persisted_query_not_found(result):
+                return result
+            self._persisted.discard(query.sha256)
+
+        result = await self.post(
+            {"query": query.document, "operationName": query.name, "extensions": extensions},
+            variables,
+            idempotent=idempotent,
+        )
+        if not result.get("errors"):
+            self._persisted.add(query.sha256)
+        return result
+
+    async def post(
+        self, payload: dict[str, Any], variables: dict[str, Any] | None = None, idempotent: bool = True
+    ) -> dict:
+        if variables:
+            payload["variables"] = variables
+
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            headers, error = None, None
+            try:
+                async with self.session.post(
+                    self.url, json=payload, headers={"Authorization": LINEAR_API_KEY}
+                ) as response:
+                    self.rate_limiter.update(response.headers)
+                    if response.status < 400:
+                        return await response.json()
+
+                    headers = response.headers
+                    message = f"Linear API error: {response.status}, message='{response.reason}'"
+                    # A failed mutation may have been applied, only rejected rate-limited ones are safe to repeat
+                    retryable = response.status == 429 or (idempotent and response.status >= 500)
+                    if response.status == 400:
+                        # Linear reports exhausted rate limits as 400 with a RATELIMITED error code
+                        retryable = is_rate_limited(await response.json(content_type=None))
+                    if not retryable:
+                        raise LinearError(message)
+            except (aiohttp.ClientConnectionError, TimeoutError) as e:
+                message, error = f"Linear API error: {e!r}", e
+                # Without a connection nothing was sent, after that the server may have applied the mutation
+                if not idempotent and not isinstance(e, aiohttp.ClientConnectorError):
+                    raise LinearError(message) from e
+            except (aiohttp.ClientError, ValueError) as e:
+                raise LinearError(f"Linear API error: {e}") from e
+
+            if attempt >= self.max_retries:
+                raise LinearError(message) from error
+            await asyncio.sleep(retry_delay(attempt, headers=headers, backoff=self.backoff))
+            attempt += 1
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+client = GraphQLClient()
+
+
+def is_persisted_query_not_found(result: dict) -> bool:
+    for error in result.get("errors") or []:
+        code = (error.get("extensions") or {}).get("code")
+        if PERSISTED_QUERY_NOT_FOUND in (code, error.get("message")):
+            return True
+    return False
+
+
+async def graphql_request(
+    query: GraphQLQuery | str, variables: dict[str, Any] | None = None, idempotent: bool | None = None
+) -> dict:
+    return await client.request(query, variables, idempotent=idempotent)
+
+
+def match_mutation(query: GraphQLQuery) -> re.Match:
+    if not (match := MUTATION_PATTERN.match(query.document)):
+        raise GraphQLQueryError(f"Operation '{query.name}' can not be batched")
+    return match
+
+
+def merge_mutations(mutations: list[tuple[GraphQLQuery, dict[str, Any]]]) -> tuple[GraphQLQuery, dict[str, Any]]:
+    definitions, selections, variables = [], [], {}
+    for index, (query, query_variables) in enumerate(mutations):
+        match = match_mutation(query)
+        alias = f"m{index}"
+
+        def rename(text: str, alias: str = alias) -> str:
+            return re.sub(r"\$(\w+)", rf"${alias}_\1", text)
+
+        if match["definitions"]:
+            definitions.append(rename(match["definitions"].strip()))
+        selections.append(f"{alias}: {rename(match['body'].strip())}")
+        variables.update({f"{alias}_{name}": value for name, value in query_variables.items()})
+
+    header = f"mutation BatchMutations({', '.join(definitions)})" if definitions else "mutation BatchMutations"
+    return parse_query(f"{header} {{\n{'\n'.join(selections)}\n}}"), variables
+
+
+def split_batch_result(mutations: list[tuple[GraphQLQuery, dict[str, Any]]], result: dict) -> list[dict]:
+    data = result.get("data") or {}
+    errors = result.get("errors") or []
+    # Errors without a path can not be attributed to a single mutation
+    shared_errors = [error for error in errors if not error.get("path")]
+
+    results = []
+    for index, (query, _) in enumerate(mutations):
+        alias, field = f"m{index}", match_mutation(query)["field"]
+        item: dict[str, Any] = {"data": {field: data.get(alias)}}
+        item_errors = [
+            {**error, "path": [field, *error["path"][1:]]}
+            for error in errors
+            if error.get("path") and error["path"][0] == alias
+        ]
+        if item_errors or shared_errors:
+            item["errors"] = item_errors + shared_errors
+        results.append(item)
+    return results
+
+
+class MutationBatcher:
+    def __init__(self, window: float = LINEAR_BATCH_WINDOW, max_size: int = LINEAR_BATCH_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._pending: list[tuple[GraphQLQuery, dict[str, Any], bool, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, query: GraphQLQuery, variables: dict[str, Any], idempotent: bool = False) -> dict:
+        if self.window <= 0:
+            return await graphql_request(query, variables, idempotent=idempotent)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((query, variables, idempotent, future))
+        if len(self._pending) >= self.max_size:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._spawn(self.flush(self._take()))
+        elif self._timer is None:
+            self._timer = self._spawn(self._flush_later())
+        return await future
+
+    def _take(self) -> list[tuple[GraphQLQuery, dict[str, Any], bool, asyncio.Future]]:
+        pending, self._pending = self._pending, []
+        return pending
+
+    def _spawn(self, coroutine: Coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush(self._take())
+
+    async def flush(self, pending: list[tuple[GraphQLQuery, dict[str, Any], bool, asyncio.Future]]) -> None:
+        pending = [item for item in pending if not item[3].done()]
+        if not pending:
+            return
+
+        mutations = [(query, variables) for query, variables, _, _ in pending]
+        # One request carries the whole batch, so it is only repeated when every mutation in it may be
+        idempotent = all(item_idempotent for _, _, item_idempotent, _ in pending)
+        try:
+            if len(mutations) == 1:
+                query, variables = mutations[0]
+                results = [await graphql_request(query, variables, idempotent=idempotent)]
+            else:
+                query, variables = merge_mutations(mutations)
+                results = split_batch_result(mutations, await graphql_request(query, variables, idempotent=idempotent))
+        except DemetraError as e:
+            for _, _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, _, future), result in zip(pending, results, strict=True):
+            if not future.done():
+                future.set_result(result)
+
+
+batcher = MutationBatcher()
+
+
+async def graphql_mutation(query: GraphQLQuery, variables: dict[str, Any], idempotent: bool = False) -> dict:
+    return await batcher.submit(query, variables, idempotent=idempotent)
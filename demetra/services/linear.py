@@ -1,68 +1,128 @@
-import aiofiles
-
-from demetra.models import LinearIssue
-from demetra.services.graphql import get_todo_issues_query, graphql_request
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from demetra.exceptions import LinearError
+from demetra.models import GraphQLQuery, LinearIssue
+from demetra.services.database import (
+    claim_issue,
+    claim_issues,
+    delete_issues,
+    get_sync_watermark,
+    set_sync_watermark,
+    update_issue_state,
+    upsert_issues,
+)
+from demetra.services.graphql import graphql_request, queries
+from demetra.services.outbox import enqueue_status_update
+from demetra.services.states import STATE_IN_PROGRESS, STATE_TODO, get_state_id
 from demetra.services.tui import print_message
-from demetra.settings import BASE_PATH, LINEAR_STATE_TODO_ID, LINEAR_TEAM_ID
-
-
-async def get_todo_issues(project_name: str) -> list[LinearIssue]:
-    query = await get_todo_issues_query()
-    result = await graphql_request(query, {"teamId": LINEAR_TEAM_ID})
-    states = result.get("data", {}).get("team", {}).get("states", {}).get("nodes", [])
-
-    issues = []
-    for state in states:
-        if state["name"].lower() == "todo":
-            for issue in state["issues"]["nodes"]:
-                if issue.get("project", {}).get("name", "").lower() == project_name.lower():
-                    issues.append(
-                        LinearIssue(
-                            id=issue["id"],
-                            identifier=issue["identifier"],
-                            title=issue["title"],
-                            description=issue.get("description", ""),
-                            priority=issue["priority"],
-                            created_at=issue["createdAt"],
-                            branch_name=issue["branchName"],
-                        )
-                    )
-    return issues
-
-
-async def get_linear_task(project_name: str) -> LinearIssue | None:
-    issues = await get_todo_issues(project_name=project_name)
-    issues = sorted(issues, key=lambda x: (-(x.priority or 0), x.created_at or ""), reverse=True)
-    if issues:
-        return issues[0]
-    return None
-
-
-async def get_update_issue_mutation() -> str:
-    async with aiofiles.open(BASE_PATH / "demetra" / "services" / "queries" / "update_issue_status.gql") as file:
-        content = await file.read()
-    return content
-
-
-async def update_ticket_status(task_id: str, state_id: str) -> bool:
-    query = await get_update_issue_mutation()
-    result = await graphql_request(query, {"issueId": task_id, "stateId": state_id})
-    return result.get("data", {}).get("issueUpdate", {}).get("success", False)
-
-
-async def get_create_comment_mutation() -> str:
-    async with aiofiles.open(BASE_PATH / "demetra" / "services" / "queries" / "create_issue_comment.gql") as file:
-        content = await file.read()
-    return content
-
-
-async def post_comment(task_id: str, body: str) -> bool:
-    query = await get_create_comment_mutation()
-    result = await graphql_request(query, {"issueId": task_id, "body": body})
-    return result.get("data", {}).get("commentCreate", {}).get("success", False)
+from demetra.settings import LINEAR_ISSUES_LIMIT, LINEAR_TEAM_ID
+
+
+TODO_STATE_NAME = "todo"
+
+
+def build_linear_issue(node: dict) -> LinearIssue:
+    return LinearIssue(
+        id=node["id"],
+        identifier=node["identifier"],
+        title=node["title"],
+        description=node.get("description") or "",
+        priority=node["priority"],
+        created_at=node["createdAt"],
+        branch_name=node.get("branchName") or "",
+        updated_at=node.get("updatedAt") or "",
+        project_name=(node.get("project") or {}).get("name", ""),
+        state_name=(node.get("state") or {}).get("name", ""),
+    )
+
+
+async def iter_issue_pages(query: GraphQLQuery, variables: dict[str, Any]) -> AsyncGenerator[list[dict]]:
+    page_variables = variables
+    while True:
+        result = await graphql_request(query, page_variables)
+        connection = (result.get("data") or {}).get("issues") or {}
+        yield connection.get("nodes", [])
+
+        page_info = connection.get("pageInfo") or {}
+        if not page_info.get("hasNextPage"):
+            break
+        page_variables = {**variables, "after": page_info["endCursor"]}
+
+
+async def iter_todo_issues(project_name: str, page_size: int = LINEAR_ISSUES_LIMIT) -> AsyncGenerator[LinearIssue]:
+    variables = {
+        "teamId": LINEAR_TEAM_ID,
+        "projectName": project_name,
+        "stateName": TODO_STATE_NAME,
+        "first": page_size,
+    }
+    async for nodes in iter_issue_pages(queries["GetTodoIssues"], variables):
+        for node in nodes:
+            yield build_linear_issue(node)
+
+
+async def sync_issues() -> int:
+    sync_key = f"issues:{LINEAR_TEAM_ID}"
+    watermark = await get_sync_watermark(sync_key)
+    issue_filter: dict[str, Any] = {"team": {"id": {"eq": LINEAR_TEAM_ID}}}
+    if watermark is None:
+        # The first sync only needs the TODO backlog, issues moving into TODO later are caught by updatedAt
+        issue_filter["state"] = {"name": {"eqIgnoreCase": TODO_STATE_NAME}}
+    else:
+        issue_filter["updatedAt"] = {"gt": watermark}
+    variables = {
+        "filter": issue_filter,
+        # Archived issues only matter for removing rows already mirrored locally
+        "includeArchived": watermark is not None,
+        "first": LINEAR_ISSUES_LIMIT,
+    }
+
+    synced, latest = 0, watermark
+    async for nodes in iter_issue_pages(queries["SyncIssues"], variables):
+        await upsert_issues([build_linear_issue(node) for node in nodes if not node.get("archivedAt")])
+        await delete_issues([node["id"] for node in nodes if node.get("archivedAt")])
+        synced += len(nodes)
+        if nodes:
+            latest = max(latest or "", *(node["updatedAt"] for node in nodes))
+
+    # Only move the watermark once every page is stored, so an interrupted sync is repeated. An empty
+    # first sync stores none, so the next one is still limited to TODO instead of the whole history.
+    if latest is not None:
+        await set_sync_watermark(sync_key, latest)
+    return synced
+
+
+async def claim_linear_tasks(project_name: str, limit: int) -> list[LinearIssue]:
+    try:
+        await sync_issues()
+    except LinearError:
+        print_message("Failed to sync Linear issues, using the local copy", style="error")
+
+    return await claim_issues(
+        project_name=project_name, state_name=TODO_STATE_NAME, claimed_state_name=STATE_IN_PROGRESS, limit=limit
+    )
+
+
+async def claim_linear_task(task_id: str) -> bool:
+    return await claim_issue(issue_id=task_id, state_name=TODO_STATE_NAME, claimed_state_name=STATE_IN_PROGRESS)
+
+
+async def release_linear_task(task_id: str) -> None:
+    # Until the next sync the local copy is the only place the claim is recorded
+    await update_issue_state(issue_id=task_id, state_name=TODO_STATE_NAME)
+
+
+async def list_issue_comments(task_id: str, created_after: str) -> list[dict]:
+    result = await graphql_request(queries["ListIssueComments"], {"issueId": task_id, "createdAfter": created_after})
+    if errors := result.get("errors"):
+        raise LinearError(f"Linear API error: {errors[0].get('message', errors[0])}")
+    comments = ((result.get("data") or {}).get("issue") or {}).get("comments") or {}
+    return sorted(comments.get("nodes", []), key=lambda comment: comment["createdAt"])
 
 
 async def linear_cleanup(task_id: str, is_error: bool):
     if is_error:
         print_message("Moving back a ticket in TODO column", style="heading")
-        await update_ticket_status(task_id=task_id, state_id=LINEAR_STATE_TODO_ID)
+        await release_linear_task(task_id)
+        await enqueue_status_update(task_id=task_id, state_id=await get_state_id(STATE_TODO))
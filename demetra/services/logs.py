@@ -0,0 +1,117 @@
+import gzip
+import shlex
+import uuid
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from pathlib import Path
+
+from demetra.models import CommandLog, LinearIssue
+from demetra.services.database import create_command_log, finish_command_log, list_command_logs
+from demetra.services.output import output
+from demetra.services.tui import print_message
+from demetra.settings import LOGS_COMPRESSION_LEVEL, LOGS_FLUSH_SIZE, LOGS_PATH
+
+
+DEFAULT_STEP = "workflow"
+
+current_run: ContextVar[tuple[str, LinearIssue] | None] = ContextVar("current_run", default=None)
+current_step: ContextVar[str] = ContextVar("current_step", default=DEFAULT_STEP)
+
+
+@contextmanager
+def log_run(task: LinearIssue) -> Iterator[str]:
+    run_id = f"{datetime.now(UTC):%Y%m%dT%H%M%S}-{task.identifier}-{uuid.uuid4().hex[:6]}"
+    run_token = current_run.set((run_id, task))
+    step_token = current_step.set(DEFAULT_STEP)
+    try:
+        yield run_id
+    finally:
+        current_step.reset(step_token)
+        current_run.reset(run_token)
+
+
+def set_log_step(step: str) -> None:
+    current_step.set(step)
+
+
+class CommandLogWriter:
+    def __init__(
+        self, log: CommandLog, compression_level: int = LOGS_COMPRESSION_LEVEL, flush_size: int = LOGS_FLUSH_SIZE
+    ):
+        self.log = log
+        self.flush_size = flush_size
+        self.size = 0
+        self._unflushed = 0
+        path = Path(log.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(path, "wb", compresslevel=compression_level)
+        self.write(f"$ {log.command}\n")
+
+    def write(self, text: str) -> None:
+        data = text.encode()
+        self._file.write(data)
+        self.size += len(data)
+        self._unflushed += len(data)
+        # A sync flush ends every block, so an interrupted run still leaves a readable log
+        if self._unflushed >= self.flush_size:
+            self._file.flush(zlib.Z_SYNC_FLUSH)
+            self._unflushed = 0
+
+    async def finish(self, exit_code: int | None) -> None:
+        self._file.close()
+        await finish_command_log(self.log.id, exit_code=exit_code, size=self.size)
+
+
+async def open_command_log(command: list) -> CommandLogWriter | None:
+    if (run := current_run.get()) is None:
+        return None
+    run_id, task = run
+    step = current_step.get()
+    log = await create_command_log(
+        run_id=run_id,
+        task_id=task.id,
+        task_identifier=task.identifier,
+        step=step,
+        command=shlex.join(str(part) for part in command),
+        path=str(LOGS_PATH / run_id / f"{step}-{uuid.uuid4().hex[:8]}.log.gz"),
+    )
+    return CommandLogWriter(log)
+
+
+def read_command_log(path: Path) -> str:
+    # Logs of interrupted runs have no gzip trailer, so decompress what is there instead of using gzip.open
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    return decompressor.decompress(path.read_bytes()).decode(errors="replace")
+
+
+async def show_logs(task_identifier: str | None = None, run_id: str | None = None, step: str | None = None) -> None:
+    logs = await list_command_logs(task_identifier=task_identifier, run_id=run_id, step=step)
+    if not logs:
+        print_message("No logs found", style="error")
+        return
+
+    if task_identifier is None and run_id is None:
+        runs: dict[str, list[CommandLog]] = {}
+        for log in logs:
+            runs.setdefault(log.run_id, []).append(log)
+        print_message("Recorded runs", style="heading")
+        for run_logs in runs.values():
+            steps = ", ".join(dict.fromkeys(log.step for log in run_logs))
+            print_message(f"{run_logs[0].run_id} ({len(run_logs)} commands: {steps})", style="result")
+        return
+
+    # Without an explicit run only the latest run of the task is shown
+    latest_run = run_id or logs[-1].run_id
+    for log in logs:
+        if log.run_id != latest_run:
+            continue
+        exit_code = "running" if log.finished_at is None else f"exit code {log.exit_code}"
+        print_message(f"{log.task_identifier} / {log.step} ({exit_code})", style="heading")
+        path = Path(log.path)
+        if not path.exists():
+            print_message(f"Log file is missing: {path}", style="error")
+            continue
+        output.write(read_command_log(path))
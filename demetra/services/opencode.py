@@ -1,25 +1,81 @@
+import asyncio
 import json
 import shlex
 from pathlib import Path
 
-from demetra.services.subprocess import run_command
-from demetra.settings import OPENCODE_MODEL, OPENCODE_PATH
+from demetra.exceptions import OpenCodeServerError
+from demetra.services.opencode_server import get_opencode_server, run_server_agent
+from demetra.services.output import output
+from demetra.services.scheduler import POOL_AGENT, PRIORITY_DEFAULT, PRIORITY_PLAN
+from demetra.services.subprocess import capture_command, run_command
+from demetra.services.tui import print_message
+from demetra.settings import AGENT_IDLE_TIMEOUT, AGENT_TIMEOUT, OPENCODE_BACKEND, OPENCODE_MODEL, OPENCODE_PATH
 
 
 PLAN_HEADER_STRING = "## Implementation Plan"
 PLAN_IS_READY_STRING = "Ready to proceed to build."
 PLAN_HAS_QUESTIONS = "Please check my questions above."
+PLAN_END_STRINGS = (PLAN_IS_READY_STRING, PLAN_HAS_QUESTIONS)
+
+
+class PlanStream:
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.session_id: str | None = None
+        self._parts: list[str] = []
+        self._window = ""
+        self._window_size = max(len(end_string) for end_string in PLAN_END_STRINGS)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed_line(self, line: str) -> None:
+        if not (line := line.strip()):
+            return
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            # Plain output of older OpenCode versions is treated as text
+            self.add_text(f"{line}\n")
+            return
+        if not isinstance(event, dict):
+            return
+
+        self.session_id = event.get("sessionID") or self.session_id
+        part = event.get("part") or {}
+        if event.get("type") == "text" and (text := part.get("text")):
+            self.add_text(text if text.endswith("\n") else f"{text}\n")
+
+    def add_text(self, text: str) -> None:
+        self._parts.append(text)
+        output.write(text)
+        # Only the new text and the end of the previous one are searched, an end marker can span both
+        window = self._window + text
+        if any(end_string in window for end_string in PLAN_END_STRINGS):
+            self.done.set()
+        self._window = window[-self._window_size :]
 
 
 async def plan_agent(
-    target_path: Path, task: str, session_id: str | None = None, task_title: str | None = None
+    target_path: Path,
+    task: str,
+    session_id: str | None = None,
+    task_title: str | None = None,
+    stream: PlanStream | None = None,
 ) -> tuple[int, str, str]:
     task += (
         f"\nIf you have some question about implementation, just print in the end `{PLAN_HAS_QUESTIONS}`"
         f"\nIf there are no questions, just print in the end `{PLAN_IS_READY_STRING}`"
     )
     return await run_opencode_agent(
-        target_path=target_path, task=task, session_id=session_id, task_title=task_title, agent="plan"
+        target_path=target_path,
+        task=task,
+        session_id=session_id,
+        task_title=task_title,
+        agent="plan",
+        stream=stream or PlanStream(),
+        priority=PRIORITY_PLAN,
     )
 
 
@@ -34,8 +90,32 @@ async def build_agent(
 
 
 async def run_opencode_agent(
-    target_path: Path, task: str, agent: str, session_id: str | None = None, task_title: str | None = None
+    target_path: Path,
+    task: str,
+    agent: str,
+    session_id: str | None = None,
+    task_title: str | None = None,
+    stream: PlanStream | None = None,
+    priority: int = PRIORITY_DEFAULT,
 ) -> tuple[int, str, str]:
+    if OPENCODE_BACKEND == "server":
+        try:
+            server_session_id = session_id
+            if stream is not None and server_session_id is None:
+                # The server sends no event stream, the session is created here so the caller learns its id
+                server = await get_opencode_server(target_path)
+                server_session_id = stream.session_id = await server.create_session(title=task_title)
+            return await run_server_agent(
+                target_path=target_path,
+                task=task,
+                agent=agent,
+                session_id=server_session_id,
+                task_title=task_title,
+                priority=priority,
+            )
+        except OpenCodeServerError as e:
+            print_message(f"{e}, falling back to the OpenCode CLI", style="error")
+
     command = [str(OPENCODE_PATH), "run", "--model", OPENCODE_MODEL, "--agent", agent]
 
     if session_id is not None:
@@ -43,14 +123,45 @@ async def run_opencode_agent(
     if task_title is not None:
         command.extend(["--title", task_title])
 
+    if stream is not None:
+        # JSON events are parsed as they arrive, the run is ended once the plan is final
+        command.extend(["--format", "json"])
+        command.append(shlex.quote(task)[:4095])
+        exit_code, _, error = await run_command(
+            command=command,
+            target_path=target_path,
+            disable_stdio=True,
+            timeout=AGENT_TIMEOUT,
+            idle_timeout=AGENT_IDLE_TIMEOUT,
+            pool=POOL_AGENT,
+            priority=priority,
+            on_line=stream.feed_line,
+            stop_event=stream.done,
+        )
+        return exit_code, stream.text, error
+
     command.append(shlex.quote(task)[:4095])
-    return await run_command(command=command, target_path=target_path)
+    return await run_command(
+        command=command,
+        target_path=target_path,
+        timeout=AGENT_TIMEOUT,
+        idle_timeout=AGENT_IDLE_TIMEOUT,
+        pool=POOL_AGENT,
+        priority=priority,
+    )
 
 
 async def get_opencode_sessions(target_path: Path) -> list[dict[str, str]]:
+    if OPENCODE_BACKEND == "server":
+        try:
+            return await (await get_opencode_server(target_path)).list_sessions()
+        except OpenCodeServerError as e:
+            print_message(f"{e}, falling back to the OpenCode CLI", style="error")
+
     command = [str(OPENCODE_PATH), "session", "list", "--format", "json"]
-    _, result, _ = await run_command(command=command, target_path=target_path)
-    return json.loads(result)
+    # The text of a large output skips its middle, the JSON has to be parsed from the full output
+    async with capture_command(command=command, target_path=target_path) as (_, result, _):
+        return json.loads(result.read())
 
 
 async def get_opencode_session_id(target_path: Path, task_title: str) -> str | None:
@@ -0,0 +1,185 @@
+import asyncio
+import socket
+import time
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+
+from demetra.exceptions import OpenCodeServerError
+from demetra.services.logs import open_command_log
+from demetra.services.output import output
+from demetra.services.scheduler import POOL_AGENT, PRIORITY_DEFAULT, scheduler
+from demetra.services.subprocess import terminate_process_group
+from demetra.settings import (
+    AGENT_TIMEOUT,
+    OPENCODE_MODEL,
+    OPENCODE_PATH,
+    OPENCODE_SERVER_HOST,
+    OPENCODE_SERVER_START_TIMEOUT,
+    OPENCODE_SERVER_URL,
+)
+
+
+def find_free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def build_model(model: str) -> dict[str, str]:
+    provider_id, _, model_id = model.partition("/")
+    return {"providerID": provider_id, "modelID": model_id}
+
+
+def extract_text(message: dict[str, Any]) -> str:
+    return "".join(part.get("text", "") for part in message.get("parts", []) if part.get("type") == "text")
+
+
+class OpenCodeServer:
+    def __init__(
+        self,
+        target_path: Path,
+        url: str | None = None,
+        host: str = OPENCODE_SERVER_HOST,
+        start_timeout: float = OPENCODE_SERVER_START_TIMEOUT,
+    ):
+        self.target_path = target_path
+        self.url = url
+        self.host = host
+        self.start_timeout = start_timeout
+        self.process: asyncio.subprocess.Process | None = None
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=AGENT_TIMEOUT))
+        return self._session
+
+    async def start(self) -> None:
+        if self.url is None:
+            port = find_free_port(self.host)
+            self.process = await asyncio.create_subprocess_exec(
+                str(OPENCODE_PATH),
+                "serve",
+                "--hostname",
+                self.host,
+                "--port",
+                str(port),
+                cwd=self.target_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            self.url = f"http://{self.host}:{port}"
+        await self.wait_until_ready()
+
+    async def wait_until_ready(self) -> None:
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            if self.process is not None and self.process.returncode is not None:
+                returncode = self.process.returncode
+                await self.stop()
+                raise OpenCodeServerError(f"OpenCode server exited with code {returncode}")
+            try:
+                await self.request("GET", "/session")
+                return
+            except OpenCodeServerError:
+                if time.monotonic() >= deadline:
+                    await self.stop()
+                    raise
+            await asyncio.sleep(0.2)
+
+    async def request(self, method: str, path: str, payload: dict | None = None) -> Any:
+        if self.url is None:
+            raise OpenCodeServerError("OpenCode server is not started")
+        # A host wide server serves several projects, the directory selects the worktree
+        params = {"directory": str(self.target_path)}
+        try:
+            async with self.session.request(method, f"{self.url}{path}", params=params, json=payload) as response:
+                if response.status >= 400:
+                    raise OpenCodeServerError(f"OpenCode server error {response.status}: {await response.text()}")
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, TimeoutError) as e:
+            raise OpenCodeServerError(f"OpenCode server request failed: {e}") from e
+
+    async def list_sessions(self) -> list[dict[str, Any]]:
+        return await self.request("GET", "/session")
+
+    async def create_session(self, title: str | None = None) -> str:
+        session = await self.request("POST", "/session", {"title": title} if title else {})
+        return session["id"]
+
+    async def prompt(self, session_id: str, agent: str, text: str, model: str = OPENCODE_MODEL) -> str:
+        message = await self.request(
+            "POST",
+            f"/session/{session_id}/message",
+            {"agent": agent, "model": build_model(model), "parts": [{"type": "text", "text": text}]},
+        )
+        return extract_text(message)
+
+    async def stop(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self.process is not None:
+            await terminate_process_group(self.process)
+            self.process = None
+
+
+servers: dict[Path, OpenCodeServer] = {}
+# Start failures by configured URL or worktree, so later calls fall back to the CLI without waiting again
+failed_servers: dict[Path | str, str] = {}
+
+
+async def get_opencode_server(target_path: Path) -> OpenCodeServer:
+    if target_path not in servers:
+        failure_key = OPENCODE_SERVER_URL or target_path
+        if error := failed_servers.get(failure_key):
+            raise OpenCodeServerError(f"OpenCode server failed to start earlier: {error}")
+        server = OpenCodeServer(target_path=target_path, url=OPENCODE_SERVER_URL)
+        try:
+            await server.start()
+        except OpenCodeServerError as e:
+            failed_servers[failure_key] = str(e)
+            raise
+        servers[target_path] = server
+    return servers[target_path]
+
+
+async def stop_opencode_server(target_path: Path) -> None:
+    failed_servers.pop(target_path, None)
+    if server := servers.pop(target_path, None):
+        await server.stop()
+
+
+async def stop_opencode_servers() -> None:
+    for target_path in list(servers):
+        await stop_opencode_server(target_path)
+
+
+async def run_server_agent(
+    target_path: Path,
+    task: str,
+    agent: str,
+    session_id: str | None = None,
+    task_title: str | None = None,
+    priority: int = PRIORITY_DEFAULT,
+) -> tuple[int, str, str]:
+    server = await get_opencode_server(target_path)
+    log = await open_command_log([str(OPENCODE_PATH), "serve", "--agent", agent, str(server.url)])
+    exit_code, result = None, ""
+    try:
+        async with scheduler.slot(POOL_AGENT, priority=priority):
+            if session_id is None:
+                session_id = await server.create_session(title=task_title)
+            result = await server.prompt(session_id=session_id, agent=agent, text=task)
+        exit_code = 0
+    finally:
+        if log is not None:
+            log.write(result)
+            await log.finish(exit_code)
+
+    output.write(f"{result}\n")
+    return 0, result, ""
@@ -0,0 +1,162 @@
+import asyncio
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from demetra.exceptions import LinearError
+from demetra.models import OutboxMessage
+from demetra.services.database import (
+    count_pending_outbox_messages,
+    create_outbox_message,
+    list_outbox_heads,
+    update_outbox_message,
+)
+from demetra.services.graphql import graphql_mutation, queries, retry_delay
+from demetra.services.states import refresh_state_id
+from demetra.services.tui import print_message
+from demetra.settings import OUTBOX_DRAIN_TIMEOUT, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL
+
+
+async def enqueue_mutation(
+    operation: str, issue_id: str, variables: dict, idempotency_key: str | None = None
+) -> OutboxMessage:
+    message = await create_outbox_message(
+        idempotency_key=idempotency_key or str(uuid.uuid4()),
+        issue_id=issue_id,
+        operation=operation,
+        variables=variables,
+    )
+    outbox_worker.notify()
+    return message
+
+
+async def enqueue_status_update(task_id: str, state_id: str, idempotency_key: str | None = None) -> OutboxMessage:
+    return await enqueue_mutation(
+        operation="UpdateIssue",
+        issue_id=task_id,
+        variables={"issueId": task_id, "stateId": state_id},
+        idempotency_key=idempotency_key,
+    )
+
+
+async def enqueue_comment(task_id: str, body: str, idempotency_key: str | None = None) -> OutboxMessage:
+    idempotency_key = idempotency_key or str(uuid.uuid4())
+    # Linear accepts client generated comment ids, so a redelivered comment is not duplicated
+    comment_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"demetra:comment:{idempotency_key}"))
+    return await enqueue_mutation(
+        operation="CreateIssueComment",
+        issue_id=task_id,
+        variables={"issueId": task_id, "body": body, "commentId": comment_id},
+        idempotency_key=idempotency_key,
+    )
+
+
+def is_idempotent(message: OutboxMessage) -> bool:
+    # Status updates set an absolute state, comments can only be repeated with a client generated id
+    if message.operation == "CreateIssueComment":
+        return bool(message.variables.get("commentId"))
+    return message.operation == "UpdateIssue"
+
+
+def is_state_error(message: OutboxMessage, error: LinearError) -> bool:
+    # Linear names the workflow state when it rejects a stateId it does not know
+    return message.operation == "UpdateIssue" and "state" in str(error).lower()
+
+
+async def refresh_status_update(message: OutboxMessage) -> dict | None:
+    try:
+        state_id = await refresh_state_id(message.variables["stateId"])
+    except LinearError:
+        return None
+    return {**message.variables, "stateId": state_id} if state_id else None
+
+
+def check_mutation_result(result: dict) -> None:
+    if errors := result.get("errors"):
+        raise LinearError(f"Linear API error: {errors[0].get('message', errors[0])}")
+    for payload in (result.get("data") or {}).values():
+        if not (payload or {}).get("success", False):
+            raise LinearError("Linear API error: mutation was not successful")
+
+
+class OutboxWorker:
+    def __init__(self, poll_interval: float = OUTBOX_POLL_INTERVAL, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self, drain: bool = True, timeout: float = OUTBOX_DRAIN_TIMEOUT) -> None:
+        if drain:
+            try:
+                await asyncio.wait_for(self.drain(), timeout=timeout)
+            except TimeoutError:
+                print_message("Linear updates are still pending, they will be sent on the next run", style="error")
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def drain(self) -> None:
+        while await count_pending_outbox_messages():
+            if not await self.process():
+                await asyncio.sleep(min(self.poll_interval, 1))
+
+    async def run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if await self.process():
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except TimeoutError:
+                pass
+
+    async def process(self) -> int:
+        async with self._lock:
+            now = datetime.now(UTC).isoformat()
+            messages = [message for message in await list_outbox_heads() if message.available_at <= now]
+            # Messages of different issues are independent and delivered concurrently
+            await asyncio.gather(*(self.deliver(message) for message in messages))
+            return len(messages)
+
+    async def deliver(self, message: OutboxMessage) -> None:
+        attempts = message.attempts + 1
+        try:
+            check_mutation_result(
+                await graphql_mutation(queries[message.operation], message.variables, idempotent=is_idempotent(message))
+            )
+        except LinearError as e:
+            if attempts >= self.max_attempts:
+                print_message(f"Failed to deliver {message.operation} for {message.issue_id}: {e}", style="error")
+                await update_outbox_message(message.id, status="failed", attempts=attempts, last_error=str(e))
+                return
+
+            # The state ids may have changed since they were cached, they are fetched again once per message
+            variables = await refresh_status_update(message) if attempts == 1 and is_state_error(message, e) else None
+            available_at = datetime.now(UTC) + timedelta(seconds=retry_delay(attempts))
+            await update_outbox_message(
+                message.id,
+                status="pending",
+                attempts=attempts,
+                last_error=str(e),
+                available_at=available_at.isoformat(),
+                variables=variables,
+            )
+            return
+
+        await update_outbox_message(message.id, status="delivered", attempts=attempts)
+
+
+outbox_worker = OutboxWorker()
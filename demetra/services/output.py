@@ -0,0 +1,139 @@
+import asyncio
+import sys
+from collections import Counter
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import IO
+
+from demetra.settings import OUTPUT_REFRESH_INTERVAL
+
+
+current_channel: ContextVar[str | None] = ContextVar("current_channel", default=None)
+
+
+class LineSplitter:
+    def __init__(self):
+        self._pending: list[str] = []
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._pending)
+
+    def feed(self, text: str) -> list[str]:
+        if "\n" not in text:
+            self._pending.append(text)
+            return []
+
+        lines = text.split("\n")
+        lines[0] = "".join(self._pending) + lines[0]
+        remainder = lines.pop()
+        self._pending = [remainder] if remainder else []
+        return [f"{line}\n" for line in lines]
+
+    def flush(self) -> list[str]:
+        pending, self._pending = "".join(self._pending), []
+        return [pending] if pending else []
+
+
+class OutputMultiplexer:
+    def __init__(self, refresh_interval: float = OUTPUT_REFRESH_INTERVAL, stream: IO[str] | None = None):
+        self.refresh_interval = refresh_interval
+        self.stream = stream
+        self._pending: list[str] = []
+        self._splitters: dict[str, LineSplitter] = {}
+        self._roots: Counter[str] = Counter()
+        self._handle: asyncio.TimerHandle | None = None
+        self._handle_loop: asyncio.AbstractEventLoop | None = None
+        self._last_write: asyncio.Future | None = None
+        # A single worker keeps batches in order while the event loop never blocks on the terminal
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="demetra-output")
+
+    @property
+    def labelled(self) -> bool:
+        # Labels are only needed once output of several workflows can interleave
+        return len(self._roots) > 1
+
+    def open_channel(self, label: str) -> None:
+        self._roots[label.split("/")[0]] += 1
+
+    def close_channel(self, label: str) -> None:
+        if splitter := self._splitters.pop(label, None):
+            self._emit(label, splitter.flush())
+        root = label.split("/")[0]
+        self._roots[root] -= 1
+        if self._roots[root] <= 0:
+            del self._roots[root]
+        self._schedule()
+
+    def write(self, text: str, channel: str | None = None) -> None:
+        if not text:
+            return
+        channel = channel or current_channel.get()
+        if channel is None or (not self.labelled and channel not in self._splitters):
+            self._pending.append(text)
+        else:
+            # Labelled output is emitted in whole lines so concurrent channels do not split each other's lines
+            splitter = self._splitters.setdefault(channel, LineSplitter())
+            self._emit(channel, splitter.feed(text))
+            if not splitter.pending:
+                del self._splitters[channel]
+        self._schedule()
+
+    def _emit(self, channel: str, lines: list[str]) -> None:
+        prefix = f"[{channel}] " if self.labelled else ""
+        self._pending.extend(f"{prefix}{line}" if line.endswith("\n") else f"{prefix}{line}\n" for line in lines)
+
+    def _schedule(self) -> None:
+        if not self._pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(self._take())
+            return
+        if self._handle is None or self._handle_loop is not loop:
+            self._handle = loop.call_later(self.refresh_interval, self.flush)
+            self._handle_loop = loop
+
+    def _take(self) -> str:
+        data, self._pending = "".join(self._pending), []
+        return data
+
+    def _write(self, data: str) -> None:
+        stream = self.stream or sys.stdout
+        stream.write(data)
+        stream.flush()
+
+    def flush(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._pending:
+            return
+        loop = asyncio.get_running_loop()
+        self._last_write = loop.run_in_executor(self._executor, self._write, self._take())
+
+    async def drain(self) -> None:
+        self.flush()
+        if self._last_write is not None:
+            last_write, self._last_write = self._last_write, None
+            if last_write.get_loop() is asyncio.get_running_loop():
+                await last_write
+
+
+@contextmanager
+def output_channel(label: str) -> Iterator[str]:
+    parent = current_channel.get()
+    label = f"{parent}/{label}" if parent else label
+    output.open_channel(label)
+    token = current_channel.set(label)
+    try:
+        yield label
+    finally:
+        current_channel.reset(token)
+        output.close_channel(label)
+
+
+output = OutputMultiplexer()
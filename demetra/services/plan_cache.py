@@ -0,0 +1,48 @@
+import hashlib
+import json
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+from demetra.services.database import evict_cached_plans, get_cached_plan, store_cached_plan
+from demetra.services.git import git_head
+from demetra.settings import OPENCODE_MODEL, PLAN_CACHE_ENABLED, PLAN_CACHE_MAX_AGE, PLAN_CACHE_MAX_SIZE
+
+
+PLAN_AGENT = "plan"
+
+
+def build_plan_cache_key(
+    task_id: str, task: str, previous_plan: str | None, agent: str, model: str, base_commit: str
+) -> str:
+    # A re-plan only sends the comment, so the issue and the plan it amends are part of the request. The session
+    # is left out, a rerun of the task resumes the session the first run created.
+    payload = json.dumps([task_id, task, previous_plan, agent, model, base_commit])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def get_plan_cache_key(target_path: Path, task_id: str, task: str, previous_plan: str | None) -> str | None:
+    if not PLAN_CACHE_ENABLED:
+        return None
+    if (base_commit := await git_head(target_path=target_path)) is None:
+        return None
+    return build_plan_cache_key(
+        task_id=task_id,
+        task=task,
+        previous_plan=previous_plan,
+        agent=PLAN_AGENT,
+        model=OPENCODE_MODEL,
+        base_commit=base_commit,
+    )
+
+
+def cache_cutoff() -> str:
+    return (datetime.now(UTC) - timedelta(seconds=PLAN_CACHE_MAX_AGE)).isoformat()
+
+
+async def load_plan(key: str) -> str | None:
+    return await get_cached_plan(key=key, created_after=cache_cutoff())
+
+
+async def save_plan(key: str, plan: str) -> None:
+    await store_cached_plan(key=key, plan=plan)
+    await evict_cached_plans(created_before=cache_cutoff(), max_size=PLAN_CACHE_MAX_SIZE)
@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from demetra.models import PoolStats
+from demetra.settings import (
+    SCHEDULER_AGENT_LIMIT,
+    SCHEDULER_COMMAND_LIMIT,
+    SCHEDULER_LINT_LIMIT,
+    SCHEDULER_TEST_LIMIT,
+)
+
+
+POOL_AGENT = "agent"
+POOL_TEST = "test"
+POOL_LINT = "lint"
+POOL_GIT = "git"
+POOL_COMMAND = "command"
+
+# Lower priorities run first. Planning a new task waits for the agents of tasks that are already building or
+# reviewing, so started tasks finish instead of all of them waiting halfway
+PRIORITY_DEFAULT = 0
+PRIORITY_PLAN = 1
+
+POOL_LIMITS = {
+    POOL_AGENT: SCHEDULER_AGENT_LIMIT,
+    POOL_TEST: SCHEDULER_TEST_LIMIT,
+    POOL_LINT: SCHEDULER_LINT_LIMIT,
+    # Git takes repository wide locks, so every repository gets its own pool with a single slot
+    POOL_GIT: 1,
+    POOL_COMMAND: SCHEDULER_COMMAND_LIMIT,
+}
+
+
+def repository_key(target_path: Path) -> str:
+    # Worktrees share the repository of the project, their .git file points into its .git/worktrees directory
+    git_path = target_path / ".git"
+    try:
+        if git_path.is_file():
+            gitdir = Path(git_path.read_text().removeprefix("gitdir:").strip())
+            if gitdir.parent.name == "worktrees":
+                return str(gitdir.parent.parent.resolve())
+            return str(gitdir.resolve())
+    except OSError:
+        pass
+    return str(git_path.resolve())
+
+
+def git_pool(target_path: Path) -> str:
+    return f"{POOL_GIT}:{repository_key(target_path)}"
+
+
+class Pool:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(limit, 1)
+        self.active = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = 0) -> float:
+        started_at = time.monotonic()
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+        else:
+            # Lower priority values run first, equal priorities keep their arrival order
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._counter), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+
+        waited = time.monotonic() - started_at
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # The slot is handed over to the next waiter, so the active count stays the same
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> PoolStats:
+        return PoolStats(
+            name=self.name,
+            limit=self.limit,
+            active=self.active,
+            queued=self.queued,
+            acquired=self.acquired,
+            total_wait=self.total_wait,
+            max_wait=self.max_wait,
+        )
+
+
+class Scheduler:
+    def __init__(self, limits: dict[str, int] | None = None):
+        self.limits = POOL_LIMITS if limits is None else limits
+        self.pools: dict[str, Pool] = {}
+
+    def pool(self, name: str) -> Pool:
+        if name not in self.pools:
+            # Keyed pools like "git:<repository>" take the limit of their family
+            family = name.split(":")[0]
+            self.pools[name] = Pool(name=name, limit=self.limits.get(family, self.limits[POOL_COMMAND]))
+        return self.pools[name]
+
+    @asynccontextmanager
+    async def slot(self, name: str, priority: int = 0) -> AsyncGenerator[float]:
+        pool = self.pool(name)
+        waited = await pool.acquire(priority=priority)
+        try:
+            yield waited
+        finally:
+            pool.release()
+
+    def stats(self) -> list[PoolStats]:
+        return [pool.stats() for pool in self.pools.values()]
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{stats.name} {stats.active}/{stats.limit} ({stats.queued} queued, {stats.average_wait:.1f}s average wait)"
+            for stats in self.stats()
+            if stats.acquired or stats.queued
+        )
+
+
+scheduler = Scheduler()
@@ -0,0 +1,113 @@
+import json
+import time
+
+import aiofiles
+
+from demetra.exceptions import LinearError
+from demetra.services.graphql import graphql_request, queries
+from demetra.services.tui import print_message
+from demetra.settings import (
+    LINEAR_STATE_AWAITING_INPUT_ID,
+    LINEAR_STATE_IN_PROGRESS_ID,
+    LINEAR_STATE_IN_REVIEW_ID,
+    LINEAR_STATE_TODO_ID,
+    LINEAR_STATES_CACHE_PATH,
+    LINEAR_STATES_CACHE_TTL,
+    LINEAR_TEAM_ID,
+)
+
+
+STATE_TODO = "todo"
+STATE_IN_PROGRESS = "in progress"
+STATE_IN_REVIEW = "in review"
+STATE_AWAITING_INPUT = "awaiting input"
+
+# Used when the team has no state with the expected name
+STATE_TYPES = {STATE_TODO: "unstarted", STATE_IN_PROGRESS: "started"}
+STATE_DEFAULTS = {
+    STATE_TODO: LINEAR_STATE_TODO_ID,
+    STATE_IN_PROGRESS: LINEAR_STATE_IN_PROGRESS_ID,
+    STATE_IN_REVIEW: LINEAR_STATE_IN_REVIEW_ID,
+    STATE_AWAITING_INPUT: LINEAR_STATE_AWAITING_INPUT_ID,
+}
+
+# Keeps the fetch time next to the states, so a long-running process expires them like the file cache
+_states_cache: dict[str, tuple[float, list[dict[str, str]]]] = {}
+
+
+def is_fresh(fetched_at: float) -> bool:
+    return time.time() - fetched_at <= LINEAR_STATES_CACHE_TTL
+
+
+async def read_states_cache() -> tuple[float, list[dict[str, str]]] | None:
+    try:
+        async with aiofiles.open(LINEAR_STATES_CACHE_PATH) as file:
+            cache = json.loads(await file.read())
+    except (OSError, ValueError):
+        return None
+
+    fetched_at = cache.get("fetched_at", 0)
+    if cache.get("team_id") != LINEAR_TEAM_ID or not is_fresh(fetched_at) or cache.get("states") is None:
+        return None
+    return fetched_at, cache["states"]
+
+
+async def write_states_cache(states: list[dict[str, str]], fetched_at: float) -> None:
+    LINEAR_STATES_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    async with aiofiles.open(LINEAR_STATES_CACHE_PATH, "w") as file:
+        await file.write(json.dumps({"team_id": LINEAR_TEAM_ID, "fetched_at": fetched_at, "states": states}))
+
+
+async def fetch_states() -> list[dict[str, str]]:
+    result = await graphql_request(queries["ListStates"], {"teamId": LINEAR_TEAM_ID})
+    nodes = ((result.get("data") or {}).get("team") or {}).get("states", {}).get("nodes", [])
+    return [{"id": node["id"], "name": node["name"], "type": node.get("type", "")} for node in nodes]
+
+
+async def get_states(refresh: bool = False) -> list[dict[str, str]]:
+    if not refresh:
+        cached = _states_cache.get(LINEAR_TEAM_ID or "")
+        if cached is None or not is_fresh(cached[0]):
+            cached = await read_states_cache()
+        if cached is not None:
+            _states_cache[LINEAR_TEAM_ID or ""] = cached
+            return cached[1]
+
+    states = await fetch_states()
+    fetched_at = time.time()
+    await write_states_cache(states, fetched_at)
+    _states_cache[LINEAR_TEAM_ID or ""] = (fetched_at, states)
+    return states
+
+
+def resolve_state_id(states: list[dict[str, str]], name: str) -> str | None:
+    for state in states:
+        if state["name"].lower() == name:
+            return state["id"]
+    if state_type := STATE_TYPES.get(name):
+        for state in states:
+            if state["type"] == state_type:
+                return state["id"]
+    return None
+
+
+async def get_state_id(name: str) -> str:
+    try:
+        states = await get_states()
+    except LinearError:
+        print_message(f"Failed to load Linear states, using default '{name}' state", style="error")
+        return STATE_DEFAULTS[name]
+    return resolve_state_id(states, name) or STATE_DEFAULTS[name]
+
+
+async def refresh_state_id(state_id: str) -> str | None:
+    # A rejected id came from stale states or the defaults, so it is matched back to its state name first
+    cached = _states_cache.get(LINEAR_TEAM_ID or "")
+    stale_states = cached[1] if cached else []
+    names = [
+        name for name, default in STATE_DEFAULTS.items() if state_id in (default, resolve_state_id(stale_states, name))
+    ]
+    states = await get_states(refresh=True)
+    if not names or (new_state_id := resolve_state_id(states, names[0])) in (None, state_id):
+        return None
+    return new_state_id
@@ -1,22 +1,173 @@
 import asyncio
+import contextlib
+import os
+import signal
+import time
+from collections.abc import AsyncGenerator, Callable
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from demetra.services.utils import live_stream
+from demetra.exceptions import CommandTimeoutError
+from demetra.services.logs import open_command_log
+from demetra.services.scheduler import POOL_COMMAND, scheduler
+from demetra.services.utils import OutputBuffer, live_stream
+from demetra.settings import COMMAND_IDLE_TIMEOUT, COMMAND_KILL_GRACE, COMMAND_TIMEOUT, OUTPUT_BUFFER_MAX_MEMORY
 
 
-async def run_command(command: list, target_path: Path, disable_stdio: bool = False) -> tuple[int, str, str]:
-    process = await asyncio.create_subprocess_exec(
-        *command, cwd=target_path, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
-    if not process.stdout or not process.stderr:
-        process.kill()
-        raise AttributeError("stdout/stderr is None")
+STOPPED = "stopped"
 
-    result, error = [], []
-    await asyncio.gather(
-        live_stream(process.stdout, result=result, disable_stdio=disable_stdio),
-        live_stream(process.stderr, result=error, disable_stdio=disable_stdio),
-    )
 
-    exit_code = await process.wait()
-    return exit_code, "\n".join(result) if result else "", "\n".join(error) if error else ""
+async def terminate_process_group(process: asyncio.subprocess.Process, grace: float = COMMAND_KILL_GRACE) -> None:
+    # The command runs in its own session, so the group id is its pid and includes every grandchild
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), timeout=grace)
+    except TimeoutError:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await process.wait()
+
+
+async def stop_command(process: asyncio.subprocess.Process, task: asyncio.Future) -> None:
+    await terminate_process_group(process)
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+async def watch_command(
+    task: asyncio.Future,
+    buffers: tuple[OutputBuffer, ...],
+    timeout: float | None,
+    idle_timeout: float | None,
+    stop_event: asyncio.Event | None = None,
+) -> str | None:
+    started_at = time.monotonic()
+    stop_task = asyncio.ensure_future(stop_event.wait()) if stop_event is not None else None
+    try:
+        while True:
+            now = time.monotonic()
+            last_output_at = max(buffer.updated_at for buffer in buffers)
+            deadlines = []
+            if timeout:
+                deadlines.append(started_at + timeout - now)
+            if idle_timeout:
+                deadlines.append(last_output_at + idle_timeout - now)
+
+            done, _ = await asyncio.wait(
+                {task} if stop_task is None else {task, stop_task},
+                timeout=max(min(deadlines), 0) if deadlines else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if task in done:
+                return None
+            if stop_task is not None and stop_task in done:
+                return STOPPED
+
+            now = time.monotonic()
+            if timeout and now - started_at >= timeout:
+                return "wall-clock"
+            if idle_timeout and now - max(buffer.updated_at for buffer in buffers) >= idle_timeout:
+                return "idle"
+    finally:
+        if stop_task is not None:
+            stop_task.cancel()
+
+
+@asynccontextmanager
+async def capture_command(
+    command: list,
+    target_path: Path,
+    disable_stdio: bool = False,
+    max_memory: int = OUTPUT_BUFFER_MAX_MEMORY,
+    timeout: float | None = COMMAND_TIMEOUT,
+    idle_timeout: float | None = COMMAND_IDLE_TIMEOUT,
+    pool: str = POOL_COMMAND,
+    priority: int = 0,
+    on_line: Callable[[str], None] | None = None,
+    stop_event: asyncio.Event | None = None,
+) -> AsyncGenerator[tuple[int, OutputBuffer, OutputBuffer]]:
+    async with scheduler.slot(pool, priority=priority):
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=target_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        if not process.stdout or not process.stderr:
+            process.kill()
+            raise AttributeError("stdout/stderr is None")
+
+        log = await open_command_log(command)
+        on_chunk = log.write if log is not None else None
+        exit_code: int | None = None
+        result, error = OutputBuffer(max_memory=max_memory), OutputBuffer(max_memory=max_memory)
+        task = asyncio.gather(
+            live_stream(process.stdout, result=result, disable_stdio=disable_stdio, on_line=on_line, on_chunk=on_chunk),
+            live_stream(process.stderr, result=error, disable_stdio=disable_stdio, on_chunk=on_chunk),
+            process.wait(),
+        )
+        try:
+            try:
+                reason = await watch_command(
+                    task, (result, error), timeout=timeout, idle_timeout=idle_timeout, stop_event=stop_event
+                )
+            except asyncio.CancelledError:
+                await stop_command(process, task)
+                raise
+
+            if reason == STOPPED:
+                # The caller already has the output it waited for, the rest of the run is not needed
+                await stop_command(process, task)
+                exit_code = 0
+            elif reason is not None:
+                await stop_command(process, task)
+                raise CommandTimeoutError(
+                    command=command,
+                    reason=reason,
+                    timeout=(timeout if reason == "wall-clock" else idle_timeout) or 0,
+                    stdout=result.text(),
+                    stderr=error.text(),
+                )
+            else:
+                _, _, exit_code = task.result()
+            yield exit_code, result, error
+        finally:
+            result.close()
+            error.close()
+            if log is not None:
+                await log.finish(exit_code)
+
+
+async def run_command(
+    command: list,
+    target_path: Path,
+    disable_stdio: bool = False,
+    max_memory: int = OUTPUT_BUFFER_MAX_MEMORY,
+    timeout: float | None = COMMAND_TIMEOUT,
+    idle_timeout: float | None = COMMAND_IDLE_TIMEOUT,
+    pool: str = POOL_COMMAND,
+    priority: int = 0,
+    on_line: Callable[[str], None] | None = None,
+    stop_event: asyncio.Event | None = None,
+) -> tuple[int, str, str]:
+    async with capture_command(
+        command=command,
+        target_path=target_path,
+        disable_stdio=disable_stdio,
+        max_memory=max_memory,
+        timeout=timeout,
+        idle_timeout=idle_timeout,
+        pool=pool,
+        priority=priority,
+        on_line=on_line,
+        stop_event=stop_event,
+    ) as (exit_code, result, error):
+        return exit_code, result.text(), error.text()
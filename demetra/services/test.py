@@ -1,9 +1,12 @@
 from pathlib import Path
 
+from demetra.services.scheduler import POOL_TEST
 from demetra.services.subprocess import run_command
 
 
 async def run_pytests(target_path: Path, session_id: str | None = None) -> tuple[int, str, str]:
     return await run_command(
-        command=["uv", "run", "--active", "pytest", "--lf", "--quiet", "--color=no"], target_path=target_path
+        command=["uv", "run", "--active", "pytest", "--lf", "--quiet", "--color=no"],
+        target_path=target_path,
+        pool=POOL_TEST,
     )
@@ -2,6 +2,7 @@ import aiofiles
 from rich.console import Console
 from rich.text import Text
 
+from demetra.services.output import output
 from demetra.settings import BASE_PATH
 
 
@@ -9,6 +10,13 @@ console = Console()
 
 
 def print_message(message: str, style: str | None = None):
+    # Rendered off the terminal, so the multiplexer can batch and label it with command output
+    with console.capture() as capture:
+        render_message(message, style=style)
+    output.write(capture.get())
+
+
+def render_message(message: str, style: str | None = None):
     if style == "heading":
         console.print("\n\u25cf ", style="bold bright_green", end="")
         console.print(message, style="bold bright_white")
@@ -34,5 +42,7 @@ async def print_heading():
     text.stylize("cyan", 150, 250)
     text.stylize("blue", 250, 350)
 
-    console.print()
-    console.print(text, end="")
+    with console.capture() as capture:
+        console.print()
+        console.print(text, end="")
+    output.write(capture.get())
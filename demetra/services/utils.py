@@ -1,22 +1,135 @@
 import asyncio
-import sys
+import codecs
+import tempfile
+import time
+from collections import deque
+from collections.abc import Callable
 from pathlib import Path
+from typing import IO
+
+from demetra.services.output import LineSplitter, output
+from demetra.settings import (
+    OUTPUT_BUFFER_HEAD_SIZE,
+    OUTPUT_BUFFER_MAX_MEMORY,
+    OUTPUT_BUFFER_TAIL_SIZE,
+    STREAM_CHUNK_SIZE,
+)
+
+
+class OutputBuffer:
+    def __init__(
+        self,
+        max_memory: int | None = None,
+        head_size: int | None = None,
+        tail_size: int | None = None,
+    ):
+        # Settings are read here rather than as defaults, so patching them takes effect
+        self.max_memory = OUTPUT_BUFFER_MAX_MEMORY if max_memory is None else max_memory
+        self.head_size = OUTPUT_BUFFER_HEAD_SIZE if head_size is None else head_size
+        self.tail_size = OUTPUT_BUFFER_TAIL_SIZE if tail_size is None else tail_size
+        self.size = 0
+        self.updated_at = time.monotonic()
+        self._chunks: list[str] = []
+        self._memory = 0
+        self._head: list[str] = []
+        self._head_length = 0
+        self._tail: deque[str] = deque()
+        self._tail_length = 0
+        self._file: IO[str] | None = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, text: str) -> None:
+        self.size += len(text)
+        self.updated_at = time.monotonic()
+
+        if self._head_length < self.head_size:
+            chunk = text[: self.head_size - self._head_length]
+            self._head.append(chunk)
+            self._head_length += len(chunk)
+
+        self._tail.append(text)
+        self._tail_length += len(text)
+        while self._tail_length - len(self._tail[0]) >= self.tail_size:
+            self._tail_length -= len(self._tail.popleft())
+
+        if self._file is not None:
+            self._file.write(text)
+            return
+
+        self._chunks.append(text)
+        self._memory += len(text)
+        if self._memory > self.max_memory:
+            # Past the limit everything goes to a temporary file, only head and tail stay in memory
+            self._file = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+            self._file.writelines(self._chunks)
+            self._chunks, self._memory = [], 0
+
+    def head(self, size: int | None = None) -> str:
+        return "".join(self._head)[: size or self.head_size]
+
+    def tail(self, size: int | None = None) -> str:
+        return "".join(self._tail)[-(size or self.tail_size) :]
+
+    def read(self) -> str:
+        if self._file is None:
+            return "".join(self._chunks)
+        self._file.flush()
+        self._file.seek(0)
+        content = self._file.read()
+        self._file.seek(0, 2)
+        return content
+
+    def text(self) -> str:
+        omitted = self.size - self._head_length - self.tail_size
+        if self._file is None or omitted <= 0:
+            # Head and tail would overlap, the whole output is at most their size
+            return self.read()
+        return f"{self.head()}\n... [{omitted} characters truncated] ...\n{self.tail()}"
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._chunks, self._memory = [], 0
 
 
 async def live_stream(
-    stream: asyncio.StreamReader, result: list[str] | None = None, disable_stdio: bool = False
+    stream: asyncio.StreamReader,
+    result: list[str] | OutputBuffer | None = None,
+    disable_stdio: bool = False,
+    on_line: Callable[[str], None] | None = None,
+    on_chunk: Callable[[str], None] | None = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
 ) -> None:
-    while True:
-        if not (line := await stream.readline()):
-            break
+    # Reading fixed-size chunks avoids the StreamReader line length limit and per-line overhead
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    splitter = LineSplitter() if on_line is not None else None
 
-        decoded = line.decode()
+    def process(text: str) -> None:
+        if not text:
+            return
         if result is not None:
-            result.append(decoded)
-
+            result.append(text)
         if not disable_stdio:
-            sys.stdout.write(decoded)
-            sys.stdout.flush()
+            output.write(text)
+        if on_chunk is not None:
+            on_chunk(text)
+        if splitter is not None and on_line is not None:
+            for line in splitter.feed(text):
+                on_line(line)
+
+    while chunk := await stream.read(chunk_size):
+        process(decoder.decode(chunk))
+    process(decoder.decode(b"", final=True))
+    if splitter is not None and on_line is not None:
+        for line in splitter.flush():
+            on_line(line)
 
 
 async def is_package_installed(target_path: Path, package_name: str) -> bool:
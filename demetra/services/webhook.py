@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import time
+from datetime import datetime
+
+from aiohttp import web
+
+from demetra.exceptions import SettingsError
+from demetra.models import LinearIssue
+from demetra.services.database import delete_issues, upsert_issues
+from demetra.services.linear import TODO_STATE_NAME, build_linear_issue, claim_linear_task
+from demetra.services.tui import print_message
+from demetra.settings import LINEAR_TEAM_ID, LINEAR_WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT
+
+
+WEBHOOK_PATH = "/webhooks/linear"
+WEBHOOK_SIGNATURE_HEADER = "Linear-Signature"
+WEBHOOK_MAX_AGE = 60
+
+
+def verify_signature(body: bytes, signature: str, secret: str) -> bool:
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def issue_sort_key(issue: LinearIssue) -> tuple[int, float]:
+    # Same order as the local mirror: priority first, then the newest issue
+    try:
+        created_at = datetime.fromisoformat(issue.created_at).timestamp()
+    except ValueError:
+        created_at = 0.0
+    return int(issue.priority or 0), -created_at
+
+
+class IssueQueue:
+    def __init__(self):
+        self._queue: asyncio.PriorityQueue[tuple[tuple[int, float], int, LinearIssue]] = asyncio.PriorityQueue()
+        self._latest: dict[str, LinearIssue] = {}
+        self._counter = itertools.count()
+
+    def put(self, issue: LinearIssue) -> None:
+        # Re-prioritised issues are pushed again, older entries are skipped on get()
+        self._latest[issue.id] = issue
+        self._queue.put_nowait((issue_sort_key(issue), next(self._counter), issue))
+
+    def discard(self, issue_id: str) -> None:
+        self._latest.pop(issue_id, None)
+
+    def __contains__(self, issue_id: str) -> bool:
+        return issue_id in self._latest
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+    async def get(self) -> LinearIssue:
+        while True:
+            _, _, issue = await self._queue.get()
+            if self._latest.get(issue.id) is issue:
+                del self._latest[issue.id]
+                return issue
+
+
+class WebhookReceiver:
+    def __init__(self, queue: IssueQueue, projects: list[str], secret: str | None = LINEAR_WEBHOOK_SECRET):
+        if not secret:
+            raise SettingsError("LINEAR_WEBHOOK_SECRET is not set")
+        self.queue = queue
+        self.projects = {project.lower() for project in projects}
+        self.secret = secret
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not verify_signature(body, request.headers.get(WEBHOOK_SIGNATURE_HEADER, ""), self.secret):
+            return web.Response(status=401, text="Invalid signature")
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.Response(status=400, text="Invalid payload")
+
+        # Reject replayed deliveries, Linear signs the timestamp as part of the body
+        if abs(time.time() * 1000 - payload.get("webhookTimestamp", 0)) > WEBHOOK_MAX_AGE * 1000:
+            return web.Response(status=401, text="Stale webhook")
+
+        if payload.get("type") == "Issue":
+            await self.process_issue(action=payload.get("action", ""), data=payload.get("data") or {})
+        return web.Response(text="OK")
+
+    async def process_issue(self, action: str, data: dict) -> None:
+        if LINEAR_TEAM_ID and data.get("teamId", LINEAR_TEAM_ID) != LINEAR_TEAM_ID:
+            return
+
+        if action == "remove":
+            self.queue.discard(data["id"])
+            await delete_issues([data["id"]])
+            return
+
+        issue = build_linear_issue(data)
+        await upsert_issues([issue])
+
+        if issue.state_name.lower() == TODO_STATE_NAME and issue.project_name.lower() in self.projects:
+            print_message(f"Received task: {issue.identifier} - {issue.title}", style="result")
+            self.queue.put(issue)
+        else:
+            self.queue.discard(issue.id)
+
+
+async def start_webhook_server(
+    receiver: WebhookReceiver, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT
+) -> web.AppRunner:
+    runner = web.AppRunner(receiver.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    print_message(f"Listening for Linear webhooks on http://{host}:{port}{WEBHOOK_PATH}", style="result")
+    return runner
+
+
+async def wait_for_webhook_task(project_name: str) -> LinearIssue:
+    queue = IssueQueue()
+    runner = await start_webhook_server(WebhookReceiver(queue=queue, projects=[project_name]))
+    try:
+        while True:
+            issue = await queue.get()
+            # A concurrent run or the daemon may have taken the issue since it was delivered
+            if await claim_linear_task(issue.id):
+                return issue
+            print_message(f"{issue.identifier} is already claimed, waiting for the next task", style="error")
+    finally:
+        await runner.cleanup()
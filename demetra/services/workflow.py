@@ -0,0 +1,466 @@
+from pathlib import Path
+
+from demetra.exceptions import CommandTimeoutError, DemetraError, InfiniteLoopError
+from demetra.models import Checkpoint, LinearIssue
+from demetra.services.approvals import (
+    APPROVE,
+    COMMENT,
+    EXIT,
+    KIND_PLAN,
+    KIND_REVIEW,
+    PLAN_OPTIONS,
+    REVIEW_OPTIONS,
+    request_approval,
+)
+from demetra.services.cursor import review_agent
+from demetra.services.dag import Loop, Step, StepResult, Stop, Workflow, WorkflowRun
+from demetra.services.database import (
+    create_session,
+    delete_checkpoint,
+    get_checkpoint,
+    get_issue,
+    get_session,
+    list_checkpoints,
+    save_checkpoint,
+)
+from demetra.services.git import git_add_all, git_cleanup, git_commit, git_push, git_worktree_create
+from demetra.services.github import create_pull_request
+from demetra.services.linear import claim_linear_task, linear_cleanup, release_linear_task
+from demetra.services.lint import run_ruff_checks, run_ruff_format
+from demetra.services.logs import log_run, set_log_step
+from demetra.services.opencode import PlanStream, build_agent, extract_plan, get_opencode_session_id, plan_agent
+from demetra.services.opencode_server import stop_opencode_server
+from demetra.services.outbox import enqueue_comment, enqueue_status_update
+from demetra.services.output import output_channel
+from demetra.services.plan_cache import get_plan_cache_key, load_plan, save_plan
+from demetra.services.states import STATE_IN_PROGRESS, STATE_IN_REVIEW, get_state_id
+from demetra.services.test import run_pytests
+from demetra.services.tui import print_message
+from demetra.services.utils import is_package_installed
+from demetra.settings import WORKFLOW_CONCURRENT_CHECKS
+
+
+async def run_workflow(task: LinearIssue, project_path: Path) -> bool:
+    with output_channel(task.identifier), log_run(task):
+        try:
+            return await run_task(task=task, project_path=project_path)
+        except BaseException:
+            # Failures before the workflow's own cleanup would leave the task claimed
+            await release_linear_task(task.id)
+            raise
+
+
+async def create_worktree(task: LinearIssue, project_path: Path) -> StepResult:
+    print_message("Creating feature worktree", style="heading")
+    print_message("")
+    branch_name = f"opencode/feature/{task.slug}"
+    worktree_path = await git_worktree_create(target_path=project_path, branch_name=branch_name)
+    print_message("")
+    print_message(f"Created worktree at: {worktree_path}", style="result")
+    return {"worktree_path": worktree_path, "branch_name": branch_name}
+
+
+async def load_session(task: LinearIssue) -> StepResult:
+    session = await get_session(task_id=task.id)
+    return {"session_id": session.session_id if session else None}
+
+
+async def mark_in_progress(task: LinearIssue) -> StepResult:
+    await enqueue_status_update(task_id=task.id, state_id=await get_state_id(STATE_IN_PROGRESS))
+
+
+async def plan(
+    task: LinearIssue, worktree_path: Path, session_id: str | None, plan_task: str, build_plan: str | None
+) -> StepResult:
+    cache_key = await get_plan_cache_key(
+        target_path=worktree_path, task_id=task.id, task=plan_task, previous_plan=build_plan
+    )
+    stream = PlanStream()
+    if cache_key and (build_plan := await load_plan(cache_key)):
+        print_message("Using cached plan for the same task and commit", style="heading")
+    else:
+        print_message("Running PLAN agent", style="heading")
+        _, plan_output, _ = await plan_agent(
+            target_path=worktree_path,
+            task=plan_task,
+            session_id=session_id,
+            task_title=task.full_title,
+            stream=stream,
+        )
+        build_plan = await extract_plan(plan_output=plan_output)
+        if cache_key and build_plan:
+            await save_plan(cache_key, build_plan)
+
+    if not build_plan:
+        print_message("Plan is empty, exiting the workflow.", style="error")
+        return Stop("empty plan")
+
+    if session_id is None:
+        # The plan run reports its session, the sessions are only listed after a cached plan
+        session_id = stream.session_id or await get_opencode_session_id(
+            target_path=worktree_path, task_title=task.full_title
+        )
+        if session_id:
+            await create_session(task_id=task.id, session_id=session_id)
+
+    print_message("Plan step is completed", style="heading")
+    print_message(f"Plan output:\n{build_plan}")
+    return {"build_plan": build_plan, "session_id": session_id}
+
+
+async def approve_plan(task: LinearIssue, build_plan: str) -> StepResult:
+    result, comment = await request_approval(task=task, kind=KIND_PLAN, body=build_plan, options=PLAN_OPTIONS)
+    if result == EXIT:
+        print_message("Cancelled, exiting the workflow.", style="error")
+        return Stop("plan rejected")
+    if result == COMMENT and comment:
+        return Loop("plan", {"plan_task": comment})
+    return None
+
+
+async def post_plan(task: LinearIssue, build_plan: str) -> StepResult:
+    print_message("Posting build plan to Linear ticket", style="heading")
+    await enqueue_comment(task_id=task.id, body=build_plan)
+
+
+async def build_changes(
+    task: LinearIssue, worktree_path: Path, session_id: str | None, build_plan: str, feedback: str | None
+) -> StepResult:
+    print_message("Running BUILD agent", style="heading")
+    await build_agent(
+        target_path=worktree_path, task=feedback or build_plan, session_id=session_id, task_title=task.full_title
+    )
+
+
+async def review_findings(task: LinearIssue, worktree_path: Path, session_id: str | None) -> str | None:
+    print_message("Running CODE REVIEW agent", style="heading")
+    _, review_comments, _ = await review_agent(target_path=worktree_path, session_id=session_id)
+    if not review_comments:
+        print_message("No comments from review agent, continuing the workflow.", style="result")
+        return None
+    result, _ = await request_approval(task=task, kind=KIND_REVIEW, body=review_comments, options=REVIEW_OPTIONS)
+    if result == APPROVE:
+        print_message("Applying proposed changes.")
+        return review_comments
+    print_message("Continuing the workflow.", style="result")
+    return None
+
+
+async def lint_findings(worktree_path: Path, session_id: str | None) -> str | None:
+    ruff_exit_code, ruff_result, _ = await run_ruff_checks(target_path=worktree_path, session_id=session_id)
+    if ruff_exit_code:
+        print_message("Processing RUFF comments.", style="result")
+        return ruff_result
+    return None
+
+
+async def test_findings(worktree_path: Path, session_id: str | None) -> str | None:
+    print_message("Running PYTESTs", style="heading")
+    pytest_exit_code, pytest_result, _ = await run_pytests(target_path=worktree_path, session_id=session_id)
+    if pytest_exit_code:
+        print_message("Processing PYTEST errors.", style="result")
+        return pytest_result
+    return None
+
+
+def combine_feedback(review_feedback: str | None, lint_feedback: str | None, test_feedback: str | None) -> str | None:
+    # Failing tests come first, they usually explain part of the lint and review findings
+    sections = [
+        ("Failing tests", test_feedback),
+        ("Lint errors", lint_feedback),
+        ("Review comments", review_feedback),
+    ]
+    feedback = [f"## {title}\n\n{findings.strip()}" for title, findings in sections if findings]
+    return "\n\n".join(feedback) or None
+
+
+async def has_ruff(worktree_path: Path, session_id: str | None = None) -> bool:
+    return await is_package_installed(target_path=worktree_path, package_name="ruff")
+
+
+async def has_pytest(worktree_path: Path, session_id: str | None = None) -> bool:
+    return await is_package_installed(target_path=worktree_path, package_name="pytest")
+
+
+async def review_changes(task: LinearIssue, worktree_path: Path, session_id: str | None) -> StepResult:
+    if review_feedback := await review_findings(task=task, worktree_path=worktree_path, session_id=session_id):
+        return Loop("build", {"feedback": review_feedback})
+    return None
+
+
+async def lint_changes(worktree_path: Path, session_id: str | None) -> StepResult:
+    await format_changes(worktree_path=worktree_path, session_id=session_id)
+    if lint_feedback := await lint_findings(worktree_path=worktree_path, session_id=session_id):
+        return Loop("build", {"feedback": lint_feedback})
+    return None
+
+
+async def test_changes(worktree_path: Path, session_id: str | None) -> StepResult:
+    if test_feedback := await test_findings(worktree_path=worktree_path, session_id=session_id):
+        return Loop("build", {"feedback": test_feedback})
+    return None
+
+
+async def format_changes(worktree_path: Path, session_id: str | None) -> StepResult:
+    print_message("Running RUFF linter", style="heading")
+    await run_ruff_format(target_path=worktree_path, session_id=session_id)
+
+
+async def check_review(task: LinearIssue, worktree_path: Path, session_id: str | None) -> StepResult:
+    review_feedback = await review_findings(task=task, worktree_path=worktree_path, session_id=session_id)
+    return {"review_feedback": review_feedback}
+
+
+async def check_lint(worktree_path: Path, session_id: str | None) -> StepResult:
+    return {"lint_feedback": await lint_findings(worktree_path=worktree_path, session_id=session_id)}
+
+
+async def check_tests(worktree_path: Path, session_id: str | None) -> StepResult:
+    return {"test_feedback": await test_findings(worktree_path=worktree_path, session_id=session_id)}
+
+
+async def collect_feedback(
+    review_feedback: str | None, lint_feedback: str | None, test_feedback: str | None
+) -> StepResult:
+    if feedback := combine_feedback(review_feedback, lint_feedback, test_feedback):
+        return Loop("build", {"feedback": feedback})
+    return None
+
+
+async def commit(task: LinearIssue, worktree_path: Path) -> StepResult:
+    print_message("Committing changes", style="heading")
+    await git_add_all(target_path=worktree_path)
+    await git_commit(target_path=worktree_path, message=task.full_title)
+
+
+async def push(worktree_path: Path, branch_name: str) -> StepResult:
+    print_message("Pushing changes", style="heading")
+    await git_push(target_path=worktree_path, branch_name=branch_name)
+
+
+async def pull_request(task: LinearIssue, worktree_path: Path, branch_name: str) -> StepResult:
+    print_message("Creating GitHub PR", style="heading")
+    await create_pull_request(target_path=worktree_path, branch_name=branch_name, title=task.full_title)
+
+
+async def mark_in_review(task: LinearIssue) -> StepResult:
+    await enqueue_status_update(task_id=task.id, state_id=await get_state_id(STATE_IN_REVIEW))
+
+
+def sequential_checks() -> list[Step]:
+    inputs, outputs, loops = ("worktree_path", "session_id"), ("feedback",), ("build",)
+    return [
+        Step("review", review_changes, needs=("build",), inputs=("task", *inputs), outputs=outputs, loops=loops),
+        Step("lint", lint_changes, needs=("review",), inputs=inputs, outputs=outputs, loops=loops, when=has_ruff),
+        Step("test", test_changes, needs=("lint",), inputs=inputs, outputs=outputs, loops=loops, when=has_pytest),
+    ]
+
+
+def concurrent_checks() -> list[Step]:
+    inputs = ("worktree_path", "session_id")
+    return [
+        # Formatting rewrites files, so it has to finish before anything reads them
+        Step("format", format_changes, needs=("build",), inputs=inputs, when=has_ruff),
+        Step("review", check_review, needs=("format",), inputs=("task", *inputs), outputs=("review_feedback",)),
+        Step("lint", check_lint, needs=("format",), inputs=inputs, outputs=("lint_feedback",), when=has_ruff),
+        Step("test", check_tests, needs=("format",), inputs=inputs, outputs=("test_feedback",), when=has_pytest),
+        Step(
+            "feedback",
+            collect_feedback,
+            needs=("review", "lint", "test"),
+            inputs=("review_feedback", "lint_feedback", "test_feedback"),
+            outputs=("feedback",),
+            loops=("build",),
+        ),
+    ]
+
+
+def build_workflow(concurrent: bool = WORKFLOW_CONCURRENT_CHECKS) -> Workflow:
+    checks = concurrent_checks() if concurrent else sequential_checks()
+    return Workflow(
+        [
+            Step(
+                "worktree", create_worktree, inputs=("task", "project_path"), outputs=("worktree_path", "branch_name")
+            ),
+            Step("session", load_session, inputs=("task",), outputs=("session_id",)),
+            # Failed runs move the task back to TODO, so a resumed run has to mark it again
+            Step("in-progress", mark_in_progress, inputs=("task",), checkpoint=False),
+            Step(
+                "plan",
+                plan,
+                needs=("worktree", "session", "in-progress"),
+                inputs=("task", "worktree_path", "session_id", "plan_task", "build_plan"),
+                outputs=("build_plan", "session_id"),
+                # Every human comment sends the plan back to the agent
+                max_loops=None,
+            ),
+            Step(
+                "approve-plan",
+                approve_plan,
+                needs=("plan",),
+                inputs=("task", "build_plan"),
+                outputs=("plan_task",),
+                loops=("plan",),
+            ),
+            Step("post-plan", post_plan, needs=("approve-plan",), inputs=("task", "build_plan")),
+            Step(
+                "build",
+                build_changes,
+                needs=("approve-plan",),
+                inputs=("task", "worktree_path", "session_id", "build_plan", "feedback"),
+                max_loops=1,
+            ),
+            *checks,
+            Step("commit", commit, needs=(checks[-1].name, "post-plan"), inputs=("task", "worktree_path")),
+            Step("push", push, needs=("commit",), inputs=("worktree_path", "branch_name"), retries=1),
+            Step(
+                "pull-request",
+                pull_request,
+                needs=("push",),
+                inputs=("task", "worktree_path", "branch_name"),
+                retries=1,
+            ),
+            Step("in-review", mark_in_review, needs=("pull-request",), inputs=("task",)),
+        ]
+    )
+
+
+WORKFLOW = build_workflow()
+
+
+# The task and project are stored in their own columns, the rest of the state is plain JSON
+CHECKPOINT_EXCLUDED_KEYS = ("task", "project_path")
+CHECKPOINT_PATH_KEYS = ("worktree_path",)
+
+
+async def save_progress(run: WorkflowRun, stage: str) -> None:
+    task: LinearIssue = run.state["task"]
+    state = {
+        key: str(value) if isinstance(value, Path) else value
+        for key, value in run.state.items()
+        if key not in CHECKPOINT_EXCLUDED_KEYS
+    }
+    await save_checkpoint(
+        task_id=task.id,
+        task_identifier=task.identifier,
+        project_path=str(run.state["project_path"]),
+        stage=stage,
+        completed_steps=sorted(run.done),
+        loops=dict(run.loops),
+        state=state,
+    )
+
+
+def restore_state(checkpoint: Checkpoint) -> dict:
+    return {
+        key: Path(value) if key in CHECKPOINT_PATH_KEYS and value is not None else value
+        for key, value in checkpoint.state.items()
+    }
+
+
+async def load_checkpoint(task: LinearIssue) -> Checkpoint | None:
+    if (checkpoint := await get_checkpoint(task_id=task.id)) is None:
+        return None
+    worktree_path = checkpoint.state.get("worktree_path")
+    if worktree_path is not None and not Path(worktree_path).exists():
+        print_message(f"Worktree {worktree_path} of the last run is gone, starting over", style="error")
+        await delete_checkpoint(task.id)
+        return None
+    print_message(f"Resuming after the {checkpoint.stage} step", style="heading")
+    return checkpoint
+
+
+async def run_task(task: LinearIssue, project_path: Path) -> bool:
+    state = {
+        "task": task,
+        "project_path": project_path,
+        "plan_task": task.text,
+        "build_plan": None,
+        "feedback": None,
+        "review_feedback": None,
+        "lint_feedback": None,
+        "test_feedback": None,
+    }
+    checkpoint = await load_checkpoint(task)
+    if checkpoint is not None:
+        state |= restore_state(checkpoint)
+    run = WorkflowRun(
+        WORKFLOW,
+        state,
+        completed_steps=checkpoint.completed_steps if checkpoint else (),
+        loops=checkpoint.loops if checkpoint else None,
+        on_progress=save_progress,
+    )
+
+    # Crashes and interruptions keep the worktree and checkpoint, finished and cancelled runs do not
+    resumable = True
+    try:
+        if await run.execute():
+            print_message("Workflow complete", style="heading")
+        resumable = False
+
+    except InfiniteLoopError:
+        resumable = False
+        print_message("Infinite loop detected, exiting.", style="error")
+
+    except CommandTimeoutError as e:
+        print_message(f"{e}, exiting.", style="error")
+
+    except DemetraError as e:
+        print_message(f"Workflow failed: {e}", style="error")
+
+    except OSError as e:
+        print_message(f"OS Error: {e}", style="error")
+
+    finally:
+        set_log_step("cleanup")
+        if run.durations:
+            timings = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in run.durations.items())
+            print_message(f"Step timings: {timings}", style="result")
+        is_error = not run.completed
+        worktree_path = run.state.get("worktree_path")
+        if worktree_path is not None:
+            await stop_opencode_server(worktree_path)
+        if resumable and "worktree" in run.done:
+            print_message(f"Kept worktree at {worktree_path}, continue with: uv run main.py resume {task.identifier}")
+        else:
+            if worktree_path is not None:
+                await git_cleanup(
+                    target_path=project_path,
+                    worktree_path=worktree_path,
+                    branch_name=run.state["branch_name"],
+                    is_error=is_error,
+                )
+            await delete_checkpoint(task.id)
+        await linear_cleanup(task_id=task.id, is_error=is_error)
+    return run.completed
+
+
+async def resume_workflow(task_identifier: str) -> None:
+    checkpoint = await get_checkpoint(task_identifier=task_identifier)
+    if checkpoint is None:
+        print_message(f"No checkpoint found for {task_identifier}", style="error")
+        return
+    task = await get_issue(checkpoint.task_id)
+    if task is None:
+        print_message(f"{checkpoint.task_identifier} is missing from the local issue mirror", style="error")
+        return
+
+    print_message(f"Resuming task: {task.identifier} - {task.title}", style="heading")
+    # A crashed run can leave its claim behind, so resuming does not depend on getting the claim
+    await claim_linear_task(task.id)
+    await run_workflow(task=task, project_path=Path(checkpoint.project_path))
+
+
+async def show_checkpoints() -> None:
+    if not (checkpoints := await list_checkpoints()):
+        print_message("No resumable workflows", style="error")
+        return
+    print_message("Resumable workflows", style="heading")
+    for checkpoint in checkpoints:
+        iteration = checkpoint.loops.get("build", 0) + 1
+        print_message(
+            f"{checkpoint.task_identifier}: after {checkpoint.stage}, build iteration {iteration}, "
+            f"worktree {checkpoint.state.get('worktree_path')} ({checkpoint.updated_at})",
+            style="result",
+        )
@@ -13,6 +13,22 @@ LINEAR_API_URL = "https://api.linear.app/graphql"
 LINEAR_API_KEY = os.environ.get("LINEAR_API_KEY")
 LINEAR_TEAM_ID = os.environ.get("LINEAR_TEAM_ID")
 
+LINEAR_ISSUES_LIMIT = int(os.environ.get("LINEAR_ISSUES_LIMIT", 50))
+
+LINEAR_BATCH_WINDOW = float(os.environ.get("LINEAR_BATCH_WINDOW", 0.05))
+LINEAR_BATCH_SIZE = int(os.environ.get("LINEAR_BATCH_SIZE", 20))
+LINEAR_PERSISTED_QUERIES = os.environ.get("LINEAR_PERSISTED_QUERIES", "false").lower() == "true"
+LINEAR_REQUEST_TIMEOUT = float(os.environ.get("LINEAR_REQUEST_TIMEOUT", 10))
+LINEAR_MAX_RETRIES = int(os.environ.get("LINEAR_MAX_RETRIES", 4))
+LINEAR_RETRY_BACKOFF = float(os.environ.get("LINEAR_RETRY_BACKOFF", 0.5))
+LINEAR_RETRY_BACKOFF_MAX = float(os.environ.get("LINEAR_RETRY_BACKOFF_MAX", 30))
+LINEAR_RATE_LIMIT = int(os.environ.get("LINEAR_RATE_LIMIT", 1500))
+LINEAR_RATE_LIMIT_WINDOW = float(os.environ.get("LINEAR_RATE_LIMIT_WINDOW", 3600))
+LINEAR_POOL_LIMIT = int(os.environ.get("LINEAR_POOL_LIMIT", 20))
+LINEAR_POOL_LIMIT_PER_HOST = int(os.environ.get("LINEAR_POOL_LIMIT_PER_HOST", 10))
+LINEAR_DNS_CACHE_TTL = int(os.environ.get("LINEAR_DNS_CACHE_TTL", 300))
+LINEAR_KEEPALIVE_TIMEOUT = float(os.environ.get("LINEAR_KEEPALIVE_TIMEOUT", 60))
+
 LINEAR_STATE_TODO_ID = os.environ.get("LINEAR_STATE_TODO_ID", "9f3c586f-640a-4f78-8170-90217270a0c5")
 LINEAR_STATE_IN_PROGRESS_ID = os.environ.get("LINEAR_STATE_IN_PROGRESS_ID", "ded08079-9ddf-43cb-8aa8-722ba107b691")
 LINEAR_STATE_IN_REVIEW_ID = os.environ.get("LINEAR_STATE_IN_REVIEW_ID", "34829892-5ab6-40a4-af4e-7a73636a78a4")
@@ -20,13 +36,73 @@ LINEAR_STATE_AWAITING_INPUT_ID = os.environ.get(
     "LINEAR_STATE_AWAITING_INPUT_ID", "e733f22b-fe21-401a-bf68-d2d374507f06"
 )
 
+LINEAR_STATES_CACHE_PATH = Path(os.environ.get("LINEAR_STATES_CACHE_PATH", HOME_PATH / ".demetra/states.json"))
+LINEAR_STATES_CACHE_TTL = int(os.environ.get("LINEAR_STATES_CACHE_TTL", 86400))
+
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_DRAIN_TIMEOUT = float(os.environ.get("OUTBOX_DRAIN_TIMEOUT", 30))
+
+LINEAR_WEBHOOK_SECRET = os.environ.get("LINEAR_WEBHOOK_SECRET")
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", 8765))
+
+DAEMON_POLL_INTERVAL = float(os.environ.get("DAEMON_POLL_INTERVAL", 60))
+DAEMON_CONCURRENCY = int(os.environ.get("DAEMON_CONCURRENCY", 1))
+
+APPROVAL_POLICIES = [
+    policy.strip().lower() for policy in os.environ.get("APPROVAL_POLICIES", "terminal").split(",") if policy.strip()
+]
+APPROVAL_AUTO_MAX_LINES = int(os.environ.get("APPROVAL_AUTO_MAX_LINES", 30))
+APPROVAL_RISK_PATTERNS = [
+    pattern.strip().lower()
+    for pattern in os.environ.get(
+        "APPROVAL_RISK_PATTERNS", "migration,drop table,delete,secret,credential,password,force push"
+    ).split(",")
+    if pattern.strip()
+]
+APPROVAL_SOCKET_PATH = Path(os.environ.get("APPROVAL_SOCKET_PATH", HOME_PATH / ".demetra/approvals.sock"))
+APPROVAL_LINEAR_POLL_INTERVAL = float(os.environ.get("APPROVAL_LINEAR_POLL_INTERVAL", 30))
+
+PLAN_CACHE_ENABLED = os.environ.get("PLAN_CACHE_ENABLED", "true").lower() == "true"
+PLAN_CACHE_MAX_AGE = float(os.environ.get("PLAN_CACHE_MAX_AGE", 7 * 24 * 3600))
+PLAN_CACHE_MAX_SIZE = int(os.environ.get("PLAN_CACHE_MAX_SIZE", 16 * 1024 * 1024))
+
+WORKFLOW_CONCURRENT_CHECKS = os.environ.get("WORKFLOW_CONCURRENT_CHECKS", "false").lower() == "true"
+
 OPENCODE_PATH = Path(os.environ.get("OPENCODE_PATH", HOME_PATH / ".opencode/bin/opencode"))
 OPENCODE_MODEL = os.environ.get("OPENCODE_MODEL", "opencode/minimax-m2.5-free")
+OPENCODE_BACKEND = os.environ.get("OPENCODE_BACKEND", "cli")
+OPENCODE_SERVER_URL = os.environ.get("OPENCODE_SERVER_URL")
+OPENCODE_SERVER_HOST = os.environ.get("OPENCODE_SERVER_HOST", "127.0.0.1")
+OPENCODE_SERVER_START_TIMEOUT = float(os.environ.get("OPENCODE_SERVER_START_TIMEOUT", 30))
 
 CURSOR_PATH = Path(os.environ.get("CURSOR_PATH", HOME_PATH / ".local/bin/cursor-agent"))
 
 CODERABBIT_PATH = Path(os.environ.get("CODERABBIT_PATH", HOME_PATH / ".local/bin/coderabbit"))
 
+COMMAND_TIMEOUT = float(os.environ.get("COMMAND_TIMEOUT", 900))
+COMMAND_IDLE_TIMEOUT = float(os.environ.get("COMMAND_IDLE_TIMEOUT", 300))
+COMMAND_KILL_GRACE = float(os.environ.get("COMMAND_KILL_GRACE", 5))
+AGENT_TIMEOUT = float(os.environ.get("AGENT_TIMEOUT", 3600))
+AGENT_IDLE_TIMEOUT = float(os.environ.get("AGENT_IDLE_TIMEOUT", 900))
+
+OUTPUT_BUFFER_MAX_MEMORY = int(os.environ.get("OUTPUT_BUFFER_MAX_MEMORY", 1024 * 1024))
+OUTPUT_BUFFER_HEAD_SIZE = int(os.environ.get("OUTPUT_BUFFER_HEAD_SIZE", 64 * 1024))
+OUTPUT_BUFFER_TAIL_SIZE = int(os.environ.get("OUTPUT_BUFFER_TAIL_SIZE", 256 * 1024))
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 64 * 1024))
+OUTPUT_REFRESH_INTERVAL = float(os.environ.get("OUTPUT_REFRESH_INTERVAL", 0.05))
+
+CPU_COUNT = os.cpu_count() or 1
+SCHEDULER_AGENT_LIMIT = int(os.environ.get("SCHEDULER_AGENT_LIMIT", 2))
+SCHEDULER_TEST_LIMIT = int(os.environ.get("SCHEDULER_TEST_LIMIT", CPU_COUNT))
+SCHEDULER_LINT_LIMIT = int(os.environ.get("SCHEDULER_LINT_LIMIT", CPU_COUNT))
+SCHEDULER_COMMAND_LIMIT = int(os.environ.get("SCHEDULER_COMMAND_LIMIT", CPU_COUNT * 2))
+
+LOGS_PATH = Path(os.environ.get("LOGS_PATH", HOME_PATH / ".demetra/logs"))
+LOGS_COMPRESSION_LEVEL = int(os.environ.get("LOGS_COMPRESSION_LEVEL", 6))
+LOGS_FLUSH_SIZE = int(os.environ.get("LOGS_FLUSH_SIZE", 64 * 1024))
+
 GIT_PATH = Path(os.environ.get("GIT_PATH", "/usr/bin/git"))
 GIT_WORKTREE_PATH = Path(os.environ.get("GIT_WORKTREE_PATH", HOME_PATH / ".demetra/worktrees/"))
 
@@ -1,28 +1,53 @@
 import argparse
 import asyncio
+import signal
 
-from demetra.exceptions import DemetraError, InfiniteLoopError
-from demetra.services.cursor import review_agent
-from demetra.services.database import create_session, get_session, init_db
+from demetra.exceptions import ApprovalError
+from demetra.services.approvals import approvals, send_approval, show_approvals
+from demetra.services.daemon import Daemon
+from demetra.services.database import init_db
 from demetra.services.filesystem import get_project_root
-from demetra.services.flow import user_input
-from demetra.services.git import git_add_all, git_cleanup, git_commit, git_push, git_worktree_create
-from demetra.services.github import create_pull_request
-from demetra.services.linear import get_linear_task, linear_cleanup, post_comment, update_ticket_status
-from demetra.services.lint import run_ruff_checks, run_ruff_format
-from demetra.services.opencode import build_agent, extract_plan, get_opencode_session_id, plan_agent
-from demetra.services.test import run_pytests
+from demetra.services.graphql import client as graphql_client
+from demetra.services.linear import claim_linear_tasks
+from demetra.services.logs import show_logs
+from demetra.services.opencode_server import stop_opencode_servers
+from demetra.services.outbox import outbox_worker
+from demetra.services.output import output
 from demetra.services.tui import print_heading, print_message
-from demetra.services.utils import is_package_installed
-from demetra.settings import LINEAR_STATE_IN_PROGRESS_ID, LINEAR_STATE_IN_REVIEW_ID
+from demetra.services.webhook import wait_for_webhook_task
+from demetra.services.workflow import resume_workflow, run_workflow, show_checkpoints
+from demetra.settings import DAEMON_CONCURRENCY, DAEMON_POLL_INTERVAL
 
 
 parser = argparse.ArgumentParser(prog="demetra", description="Run implementation workflow.", add_help=True)
 parser.add_argument("-p", "--project-name", help="Project name to run workflow on", type=str)
-
-
-async def main(project_name: str):
-    await init_db()
+parser.add_argument(
+    "-w", "--webhook", help="Wait for new TODO tasks from Linear webhooks if none found", action="store_true"
+)
+parser.add_argument("-c", "--concurrency", help="Number of TODO tasks to work on in parallel", type=int, default=1)
+subparsers = parser.add_subparsers(dest="command")
+serve_parser = subparsers.add_parser("serve", help="Keep running and work on TODO tasks of the given projects")
+serve_parser.add_argument("projects", help="Project names to watch", nargs="+")
+serve_parser.add_argument(
+    "-c", "--concurrency", help="Number of tasks to work on in parallel", type=int, default=DAEMON_CONCURRENCY
+)
+serve_parser.add_argument(
+    "-i", "--interval", help="Seconds between polls for new tasks", type=float, default=DAEMON_POLL_INTERVAL
+)
+serve_parser.add_argument("-w", "--webhook", help="Also receive new tasks from Linear webhooks", action="store_true")
+resume_parser = subparsers.add_parser("resume", help="Continue an interrupted workflow from its last checkpoint")
+resume_parser.add_argument("task", help="Task identifier, lists resumable workflows if omitted", nargs="?")
+approve_parser = subparsers.add_parser("approve", help="Answer or list pending approvals of a running workflow")
+approve_parser.add_argument("task", help="Task identifier, lists pending approvals if omitted", nargs="?")
+approve_parser.add_argument("choice", help="Answer, e.g. approve, comment, exit or skip", nargs="?", default="approve")
+approve_parser.add_argument("-m", "--comment", help="Comment for the comment answer", type=str)
+logs_parser = subparsers.add_parser("logs", help="Show command logs of previous runs")
+logs_parser.add_argument("task", help="Task identifier, lists recorded runs if omitted", nargs="?")
+logs_parser.add_argument("-r", "--run", help="Run ID, defaults to the latest run of the task", type=str)
+logs_parser.add_argument("-s", "--step", help="Only show logs of this step", type=str)
+
+
+async def main(project_name: str, webhook: bool = False, concurrency: int = 1):
     await print_heading()
 
     print_message("Running workflow", style="heading")
@@ -30,137 +55,123 @@ async def main(project_name: str):
     project_path = get_project_root(project_name=project_name)
     print_message(f"Project root: {project_path}", style="result")
 
-    print_message("Retrieving latest linear task", style="heading")
-    task = await get_linear_task(project_name=project_name)
-    if not task:
+    print_message(
+        "Retrieving latest linear tasks" if concurrency > 1 else "Retrieving latest linear task", style="heading"
+    )
+    tasks = await claim_linear_tasks(project_name=project_name, limit=concurrency)
+    if not tasks and webhook:
+        print_message("Waiting for new tasks", style="heading")
+        tasks = [await wait_for_webhook_task(project_name=project_name)]
+    if not tasks:
         print_message("No TODO tasks found", style="error")
         return
-    print_message(f"Retrieved task: {task.identifier} - {task.title}", style="result")
-
-    print_message("Creating feature worktree", style="heading")
-    print_message("")
-    branch_name = f"opencode/feature/{task.slug}"
-    worktree_path = await git_worktree_create(target_path=project_path, branch_name=branch_name)
-    print_message("")
-    print_message(f"Created worktree at: {worktree_path}", style="result")
-
-    is_error = True
-    session = await get_session(task_id=task.id)
-    session_id = session.session_id if session else None
-    try:
-        await update_ticket_status(task_id=task.id, state_id=LINEAR_STATE_IN_PROGRESS_ID)
-
-        plan_output = None
-        current_task: str = task.text
-        while True:
-            print_message("Running PLAN agent", style="heading")
-            _, plan_output, _ = await plan_agent(
-                target_path=worktree_path, task=current_task, session_id=session_id, task_title=task.full_title
-            )
+    for task in tasks:
+        print_message(f"Retrieved task: {task.identifier} - {task.title}", style="result")
 
-            build_plan = await extract_plan(plan_output=plan_output)
-            if not build_plan:
-                print_message("Plan is empty, exiting the workflow.", style="error")
-                return
-
-            if session_id is None:
-                if session_id := await get_opencode_session_id(target_path=worktree_path, task_title=task.full_title):
-                    session = await create_session(task_id=task.id, session_id=session_id)
-
-            print_message("Plan step is completed", style="heading")
-            print_message(f"Plan output:\n{build_plan}")
-
-            result, comment = await user_input([("1", "approve"), ("2", "comment"), ("3", "exit")])
-            if result == "exit":
-                print_message("Cancelled, exiting the workflow.", style="error")
-                return
-            elif result == "comment" and comment:
-                current_task = comment
-                continue
-            else:
-                break
-
-        print_message("Posting build plan to Linear ticket", style="heading")
-        await post_comment(task_id=task.id, body=build_plan)
-
-        current_task = build_plan
-        for build_attempt in range(3):
-            build_attempt += 1
-            if build_attempt == 3:
-                raise InfiniteLoopError
-
-            print_message("Running BUILD agent", style="heading")
-            await build_agent(
-                target_path=worktree_path, task=current_task, session_id=session_id, task_title=task.full_title
-            )
+    # Every workflow runs as its own asyncio task, so its output channel and log run stay isolated
+    results = await asyncio.gather(
+        *(run_workflow(task=task, project_path=project_path) for task in tasks), return_exceptions=True
+    )
+    for task, result in zip(tasks, results, strict=True):
+        if isinstance(result, BaseException):
+            print_message(f"{task.identifier} failed: {result!r}", style="error")
 
-            print_message("Running CODE REVIEW agent", style="heading")
-            _, review_comments, _ = await review_agent(target_path=worktree_path, session_id=session_id)
-            if review_comments:
-                result, _ = await user_input([("1", "approve"), ("2", "skip")])
-                if result == "approve":
-                    print_message("Applying proposed changes.")
-                    current_task = review_comments
-                    continue
-                else:
-                    print_message("Continuing the workflow.", style="result")
-            else:
-                print_message("No comments from review agent, continuing the workflow.", style="result")
-
-            if await is_package_installed(target_path=worktree_path, package_name="ruff"):
-                print_message("Running RUFF linter", style="heading")
-                await run_ruff_format(target_path=worktree_path, session_id=session_id)
-
-                ruff_exit_code, ruff_result, _ = await run_ruff_checks(target_path=worktree_path, session_id=session_id)
-                if ruff_exit_code:
-                    print_message("Processing RUFF comments.", style="result")
-                    current_task = ruff_result
-                    continue
-
-            if await is_package_installed(target_path=worktree_path, package_name="pytest"):
-                print_message("Running PYTESTs", style="heading")
-                pytest_exit_code, pytest_result, _ = await run_pytests(target_path=worktree_path, session_id=session_id)
-                if pytest_exit_code:
-                    print_message("Processing PYTEST errors.", style="result")
-                    current_task = pytest_result
-                    continue
-
-            break
-
-        print_message("Committing changes", style="heading")
-        await git_add_all(target_path=worktree_path)
-        await git_commit(target_path=worktree_path, message=task.full_title)
-
-        print_message("Pushing changes", style="heading")
-        await git_push(target_path=worktree_path, branch_name=branch_name)
-
-        print_message("Creating GitHub PR", style="heading")
-        await create_pull_request(target_path=worktree_path, branch_name=branch_name, title=task.full_title)
 
+async def logs(task_identifier: str | None, run_id: str | None, step: str | None):
+    await init_db()
+    try:
+        await show_logs(task_identifier=task_identifier, run_id=run_id, step=step)
+    finally:
+        await output.drain()
+
+
+async def resume(task_identifier: str | None):
+    await init_db()
+    if task_identifier is None:
         try:
-            await update_ticket_status(task_id=task.id, state_id=LINEAR_STATE_IN_REVIEW_ID)
-        except DemetraError:
-            print_message("Failed to update ticket status to In Review", style="error")
+            await show_checkpoints()
+        finally:
+            await output.drain()
+        return
+
+    await start()
+    try:
+        await print_heading()
+        await resume_workflow(task_identifier=task_identifier)
+    finally:
+        await shutdown()
+
+
+async def approve(task_identifier: str | None, choice: str, comment: str | None):
+    try:
+        if task_identifier is None:
+            await show_approvals()
+        else:
+            await send_approval(task_identifier=task_identifier, choice=choice, comment=comment)
+    except ApprovalError as e:
+        print_message(str(e), style="error")
+    finally:
+        await output.drain()
+
 
-        is_error = False
-        print_message("Workflow complete", style="heading")
+async def start():
+    await init_db()
+    await outbox_worker.start()
+    await approvals.start()
 
-    except InfiniteLoopError:
-        print_message("Infinite loop detected, exiting.", style="error")
 
-    except DemetraError:
-        print_message("Failed to update ticket status to In Progress", style="error")
+async def shutdown():
+    await approvals.stop()
+    await stop_opencode_servers()
+    await outbox_worker.stop()
+    await graphql_client.close()
+    await output.drain()
 
-    except OSError as e:
-        print_message(f"OS Error: {e}", style="error")
 
+async def run(project_name: str, webhook: bool = False, concurrency: int = 1):
+    await start()
+    try:
+        await main(project_name=project_name, webhook=webhook, concurrency=concurrency)
     finally:
-        await git_cleanup(
-            target_path=project_path, worktree_path=worktree_path, branch_name=branch_name, is_error=is_error
+        await shutdown()
+
+
+async def serve(project_names: list[str], concurrency: int, poll_interval: float, webhook: bool = False):
+    await start()
+    try:
+        await print_heading()
+        daemon = Daemon(
+            projects={name: get_project_root(project_name=name) for name in project_names},
+            concurrency=concurrency,
+            poll_interval=poll_interval,
+            webhook=webhook,
         )
-        await linear_cleanup(task_id=task.id, is_error=is_error)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, daemon.stop)
+
+        print_message(f"Watching {', '.join(project_names)} for TODO tasks", style="heading")
+        await daemon.serve()
+    finally:
+        await shutdown()
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    asyncio.run(main(project_name=args.project_name))
+    if args.command == "logs":
+        asyncio.run(logs(task_identifier=args.task, run_id=args.run, step=args.step))
+    elif args.command == "approve":
+        asyncio.run(approve(task_identifier=args.task, choice=args.choice, comment=args.comment))
+    elif args.command == "resume":
+        asyncio.run(resume(task_identifier=args.task))
+    elif args.command == "serve":
+        asyncio.run(
+            serve(
+                project_names=args.projects,
+                concurrency=args.concurrency,
+                poll_interval=args.interval,
+                webhook=args.webhook,
+            )
+        )
+    else:
+        asyncio.run(run(project_name=args.project_name, webhook=args.webhook, concurrency=max(args.concurrency, 1)))
@@ -0,0 +1,37 @@
+from unittest.mock import patch
+
+import pytest
+
+from demetra.models import LinearIssue
+
+
+def make_issue(
+    identifier: str = "DEMETRA-1",
+    issue_id: str | None = None,
+    title: str = "Title",
+    description: str = "",
+    priority: str = "1",
+    project_name: str = "demetra",
+    state_name: str = "Todo",
+) -> LinearIssue:
+    return LinearIssue(
+        id=issue_id or f"id-{identifier}",
+        identifier=identifier,
+        title=title,
+        description=description,
+        priority=priority,
+        created_at="2026-01-01T00:00:00+00:00",
+        branch_name="",
+        updated_at="2026-01-01T00:00:00+00:00",
+        project_name=project_name,
+        state_name=state_name,
+    )
+
+
+@pytest.fixture
+async def database(tmp_path):
+    from demetra.services.database import init_db
+
+    with patch("demetra.services.database.DB_PATH", tmp_path / "demetra.sqlite3"):
+        await init_db()
+        yield
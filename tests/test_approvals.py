@@ -0,0 +1,232 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from tests.conftest import make_issue
+
+from demetra.exceptions import ApprovalError, SettingsError
+from demetra.models import ApprovalRequest
+
+
+def make_request(body: str, options: list[str] | None = None) -> ApprovalRequest:
+    return ApprovalRequest(
+        id="request-1",
+        task_id="id-DEMETRA-1",
+        task_identifier="DEMETRA-1",
+        kind="plan",
+        body=body,
+        options=options or ["approve", "comment", "exit"],
+        created_at="2026-01-01T00:00:00+00:00",
+    )
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with patch("demetra.services.approvals.print_message"):
+        yield
+
+
+@pytest.mark.asyncio
+class TestAutoApprovalPolicy:
+    async def test_approves_small_plans(self):
+        from demetra.services.approvals import AutoApprovalPolicy
+
+        policy = AutoApprovalPolicy(max_lines=3, risk_patterns=["migration"])
+
+        assert await policy.decide(make_request("1. Rename a variable\n2. Add a test")) == ("approve", None)
+
+    async def test_leaves_large_plans_to_people(self):
+        from demetra.services.approvals import AutoApprovalPolicy
+
+        policy = AutoApprovalPolicy(max_lines=3, risk_patterns=[])
+
+        assert await policy.decide(make_request("\n".join(f"{i}. Step" for i in range(4)))) is None
+
+    async def test_leaves_risky_plans_to_people(self):
+        from demetra.services.approvals import AutoApprovalPolicy
+
+        policy = AutoApprovalPolicy(max_lines=10, risk_patterns=["migration"])
+
+        assert await policy.decide(make_request("1. Add a Migration for the users table")) is None
+
+    async def test_leaves_reviews_to_people(self):
+        from demetra.services.approvals import AutoApprovalPolicy
+
+        policy = AutoApprovalPolicy(max_lines=10, risk_patterns=[])
+        request = make_request("Rename x", options=["approve", "skip"])
+        request.kind = "review"
+
+        assert await policy.decide(request) is None
+
+
+class TestParseLinearReply:
+    @pytest.mark.parametrize(
+        ("body", "expected"),
+        [
+            ("/approve", ("approve", None)),
+            ("  /Exit ", ("exit", None)),
+            ("/comment Use a queue\nand retries", ("comment", "Use a queue\nand retries")),
+            ("/comment", None),
+            ("/skip", None),
+            ("Looks good", None),
+        ],
+    )
+    def test_parses_commands(self, body, expected):
+        from demetra.services.approvals import parse_linear_reply
+
+        assert parse_linear_reply(body, ["approve", "comment", "exit"]) == expected
+
+
+class TestBuildPolicies:
+    def test_rejects_unknown_policies(self):
+        from demetra.services.approvals import build_policies
+
+        with pytest.raises(SettingsError, match="Unknown approval policies: email"):
+            build_policies(["auto", "email"])
+
+    def test_adds_terminal_when_nobody_can_answer(self):
+        from demetra.services.approvals import AutoApprovalPolicy, TerminalApprovalPolicy, build_policies
+
+        policies = build_policies(["auto"])
+
+        assert [type(policy) for policy in policies] == [AutoApprovalPolicy, TerminalApprovalPolicy]
+
+
+@pytest.mark.asyncio
+class TestApprovalQueue:
+    async def test_auto_policy_answers_without_waiting(self):
+        from demetra.services.approvals import ApprovalQueue
+
+        queue = ApprovalQueue(policy_names=["auto", "terminal"])
+
+        with patch("demetra.services.approvals.user_input", new_callable=AsyncMock) as mock_input:
+            decision = await queue.request(make_issue(), kind="plan", body="1. Small change", options=["approve"])
+
+        assert decision == ("approve", None)
+        mock_input.assert_not_awaited()
+
+    async def test_terminal_policy_asks_with_numbered_options(self):
+        from demetra.services.approvals import ApprovalQueue
+
+        queue = ApprovalQueue(policy_names=["terminal"])
+
+        with patch(
+            "demetra.services.approvals.user_input", new_callable=AsyncMock, return_value=("skip", None)
+        ) as mock_input:
+            decision = await queue.request(make_issue(), kind="review", body="Comments", options=["approve", "skip"])
+
+        assert decision == ("skip", None)
+        mock_input.assert_awaited_once_with([("1", "approve"), ("2", "skip")])
+
+    async def test_only_waiting_workflows_block(self):
+        from demetra.services.approvals import ApprovalQueue, AutoApprovalPolicy, SocketApprovalPolicy
+
+        queue = ApprovalQueue(policy_names=["auto", "socket"])
+        queue._policies = [AutoApprovalPolicy(max_lines=1, risk_patterns=[]), SocketApprovalPolicy()]
+
+        waiting = asyncio.create_task(
+            queue.request(make_issue("DEMETRA-1"), kind="plan", body="1. Big\n2. Change", options=["approve", "exit"])
+        )
+        await asyncio.sleep(0)
+        decision = await queue.request(make_issue("DEMETRA-2"), kind="plan", body="1. Small", options=["approve"])
+
+        assert decision == ("approve", None)
+        assert [request.task_identifier for request in queue.pending] == ["DEMETRA-1"]
+
+        queue.answer("demetra-1", "exit")
+        assert await waiting == ("exit", None)
+        assert queue.pending == []
+
+    async def test_answer_validates_choice(self):
+        from demetra.services.approvals import ApprovalQueue
+
+        queue = ApprovalQueue(policy_names=["socket"])
+        waiting = asyncio.create_task(
+            queue.request(make_issue(), kind="plan", body="Plan", options=["approve", "comment", "exit"])
+        )
+        await asyncio.sleep(0)
+
+        with pytest.raises(ApprovalError, match="Invalid choice 'skip'"):
+            queue.answer("DEMETRA-1", "skip")
+        with pytest.raises(ApprovalError, match="A comment is required"):
+            queue.answer("DEMETRA-1", "comment")
+        with pytest.raises(ApprovalError, match="No pending approval for DEMETRA-2"):
+            queue.answer("DEMETRA-2", "approve")
+
+        queue.answer("DEMETRA-1", "comment", "Use a queue")
+        assert await waiting == ("comment", "Use a queue")
+
+    async def test_linear_policy_waits_for_a_reply(self):
+        from demetra.services.approvals import ApprovalQueue, LinearApprovalPolicy
+
+        queue = ApprovalQueue(policy_names=["linear"])
+        queue._policies = [LinearApprovalPolicy(poll_interval=0)]
+        replies = [[], [{"body": "Looks good"}, {"body": "/approve"}]]
+
+        with (
+            patch("demetra.services.approvals.enqueue_comment", new_callable=AsyncMock) as mock_comment,
+            patch("demetra.services.approvals.list_issue_comments", new_callable=AsyncMock, side_effect=replies),
+        ):
+            decision = await queue.request(make_issue(), kind="plan", body="The plan", options=["approve", "exit"])
+
+        assert decision == ("approve", None)
+        assert mock_comment.await_args is not None
+        assert "The plan" in mock_comment.await_args.kwargs["body"]
+        assert "`/approve`, `/exit`" in mock_comment.await_args.kwargs["body"]
+
+    async def test_first_answer_cancels_other_policies(self):
+        from demetra.services.approvals import ApprovalQueue
+
+        queue = ApprovalQueue(policy_names=["terminal", "socket"])
+        cancelled = asyncio.Event()
+
+        async def user_input(options):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with patch("demetra.services.approvals.user_input", side_effect=user_input):
+            waiting = asyncio.create_task(queue.request(make_issue(), kind="plan", body="Plan", options=["approve"]))
+            await asyncio.sleep(0.01)
+            queue.answer("DEMETRA-1", "approve")
+
+            assert await waiting == ("approve", None)
+        assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+class TestApprovalServer:
+    async def test_lists_and_answers_pending_approvals(self, tmp_path):
+        from demetra.services.approvals import ApprovalQueue, send_approval, show_approvals
+
+        socket_path = tmp_path / "approvals.sock"
+        queue = ApprovalQueue(policy_names=["socket"], socket_path=socket_path)
+        await queue.start()
+        try:
+            waiting = asyncio.create_task(
+                queue.request(make_issue(), kind="plan", body="The plan", options=["approve", "exit"])
+            )
+            await asyncio.sleep(0)
+
+            with patch("demetra.services.approvals.print_message") as mock_print:
+                await show_approvals(socket_path=socket_path)
+            assert "DEMETRA-1: plan [approve | exit]" in [call.args[0] for call in mock_print.call_args_list]
+
+            await send_approval("DEMETRA-1", "approve", socket_path=socket_path)
+            assert await waiting == ("approve", None)
+
+            with pytest.raises(ApprovalError, match="No pending approval"):
+                await send_approval("DEMETRA-1", "approve", socket_path=socket_path)
+        finally:
+            await queue.stop()
+
+        assert not socket_path.exists()
+
+    async def test_reports_missing_server(self, tmp_path):
+        from demetra.services.approvals import show_approvals
+
+        with pytest.raises(ApprovalError, match="No Demetra run is listening"):
+            await show_approvals(socket_path=tmp_path / "missing.sock")
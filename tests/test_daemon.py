@@ -0,0 +1,149 @@
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from tests.conftest import make_issue
+
+
+@pytest.mark.asyncio
+class TestDaemon:
+    @pytest.fixture(autouse=True)
+    async def setup(self, database):
+        from demetra.services.database import upsert_issues
+
+        with (
+            patch("demetra.services.daemon.sync_issues", new_callable=AsyncMock),
+            patch("demetra.services.daemon.print_message"),
+        ):
+            await upsert_issues(
+                [
+                    make_issue("DEMETRA-1", priority="2"),
+                    make_issue("DEMETRA-2"),
+                    make_issue("OTHER-1", project_name="other"),
+                ]
+            )
+            yield
+
+    async def test_poll_queues_todo_issues_of_watched_projects(self):
+        from demetra.services.daemon import Daemon
+
+        daemon = Daemon(projects={"Demetra": Path("/projects/demetra")})
+
+        assert await daemon.poll() == 2
+        assert await daemon.poll() == 0
+        assert (await daemon.queue.get()).identifier == "DEMETRA-2"
+        assert "id-OTHER-1" not in daemon.queue
+
+    async def test_status_shows_queue_and_pools(self):
+        from demetra.services.daemon import Daemon
+        from demetra.services.scheduler import Scheduler
+
+        daemon = Daemon(projects={"demetra": Path("/projects/demetra")})
+        await daemon.poll()
+        scheduler = Scheduler(limits={"agent": 2, "command": 4})
+        scheduler.pool("agent").acquired = 1
+
+        with (
+            patch("demetra.services.daemon.scheduler", scheduler),
+            patch("demetra.services.daemon.print_message") as mock_print,
+        ):
+            daemon.print_status()
+
+        mock_print.assert_called_once_with(
+            "0 running, 2 queued | agent 0/2 (0 queued, 0.0s average wait)", style="result"
+        )
+
+    async def test_workers_claim_and_run_each_issue_once(self):
+        from demetra.services.daemon import Daemon
+        from demetra.services.database import list_issues
+
+        started = []
+
+        async def run_workflow(task, project_path):
+            started.append((task.identifier, project_path))
+            if len(started) == 2:
+                daemon.stop()
+            return True
+
+        daemon = Daemon(projects={"demetra": Path("/projects/demetra")}, concurrency=2, poll_interval=60)
+        await daemon.poll()
+        # A duplicate delivery, e.g. from a webhook, must not start a second workflow
+        daemon.queue.put(make_issue("DEMETRA-2"))
+
+        with patch("demetra.services.daemon.run_workflow", side_effect=run_workflow):
+            await asyncio.wait_for(daemon.serve(), timeout=5)
+
+        assert sorted(started) == [("DEMETRA-1", Path("/projects/demetra")), ("DEMETRA-2", Path("/projects/demetra"))]
+        assert await list_issues(project_name="demetra", state_name="todo", limit=10) == []
+
+    async def test_failed_issues_are_not_run_again(self):
+        from demetra.services.daemon import Daemon
+        from demetra.services.linear import release_linear_task
+
+        started = []
+
+        async def run_workflow(task, project_path):
+            started.append(task.identifier)
+            # Like linear_cleanup, a failed workflow moves its issue back to TODO
+            await release_linear_task(task.id)
+            if len(started) == 2:
+                daemon.stop()
+            return False
+
+        daemon = Daemon(projects={"demetra": Path("/projects/demetra")}, poll_interval=60)
+        await daemon.poll()
+
+        with patch("demetra.services.daemon.run_workflow", side_effect=run_workflow):
+            await asyncio.wait_for(daemon.serve(), timeout=5)
+
+        assert started == ["DEMETRA-2", "DEMETRA-1"]
+        assert daemon.failed == {"id-DEMETRA-1", "id-DEMETRA-2"}
+        assert await daemon.poll() == 0
+
+    async def test_stop_waits_for_running_workflows(self):
+        from demetra.services.daemon import Daemon
+
+        finished = asyncio.Event()
+        started = asyncio.Event()
+
+        async def run_workflow(task, project_path):
+            started.set()
+            await asyncio.sleep(0.1)
+            finished.set()
+            return True
+
+        daemon = Daemon(projects={"demetra": Path("/projects/demetra")}, poll_interval=60)
+        with patch("demetra.services.daemon.run_workflow", side_effect=run_workflow):
+            serving = asyncio.create_task(daemon.serve())
+            await started.wait()
+            daemon.stop()
+            await asyncio.wait_for(serving, timeout=5)
+
+        assert finished.is_set()
+        assert len(daemon.queue) == 1
+
+    async def test_second_stop_cancels_running_workflows(self):
+        from demetra.services.daemon import Daemon
+
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def run_workflow(task, project_path):
+            started.set()
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        daemon = Daemon(projects={"demetra": Path("/projects/demetra")}, poll_interval=60)
+        with patch("demetra.services.daemon.run_workflow", side_effect=run_workflow):
+            serving = asyncio.create_task(daemon.serve())
+            await started.wait()
+            daemon.stop()
+            daemon.stop()
+            await asyncio.wait_for(serving, timeout=5)
+
+        assert cancelled.is_set()
@@ -0,0 +1,263 @@
+import asyncio
+
+import pytest
+
+from demetra.exceptions import InfiniteLoopError, StepTimeoutError, WorkflowGraphError
+
+
+def record(calls: list, name: str, result=None, delay: float = 0):
+    async def action(**inputs):
+        calls.append(name)
+        await asyncio.sleep(delay)
+        return result
+
+    return action
+
+
+class TestWorkflow:
+    def test_orders_steps_by_dependencies(self):
+        from demetra.services.dag import Step, Workflow
+
+        workflow = Workflow([Step("b", record([], "b"), needs=("a",)), Step("a", record([], "a"))])
+
+        assert workflow.order == ["a", "b"]
+        assert workflow.descendants["a"] == {"b"}
+
+    def test_rejects_unknown_dependencies(self):
+        from demetra.services.dag import Step, Workflow
+
+        with pytest.raises(WorkflowGraphError, match="unknown steps: missing"):
+            Workflow([Step("a", record([], "a"), needs=("missing",))])
+
+    def test_rejects_cycles(self):
+        from demetra.services.dag import Step, Workflow
+
+        with pytest.raises(WorkflowGraphError, match="cycle"):
+            Workflow([Step("a", record([], "a"), needs=("b",)), Step("b", record([], "b"), needs=("a",))])
+
+    def test_rejects_loops_to_non_ancestors(self):
+        from demetra.services.dag import Step, Workflow
+
+        with pytest.raises(WorkflowGraphError, match="non-ancestors: b"):
+            Workflow([Step("a", record([], "a"), loops=("b",)), Step("b", record([], "b"))])
+
+    def test_rejects_inputs_without_source(self):
+        from demetra.services.dag import Step, Workflow
+
+        workflow = Workflow([Step("a", record([], "a"), inputs=("value",))])
+
+        with pytest.raises(WorkflowGraphError, match="no source for inputs: value"):
+            workflow.check_inputs({})
+        workflow.check_inputs({"value": 1})
+
+
+@pytest.mark.asyncio
+class TestWorkflowRun:
+    async def test_runs_independent_steps_concurrently(self):
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        calls = []
+        workflow = Workflow(
+            [
+                Step("a", record(calls, "a", delay=0.1)),
+                Step("b", record(calls, "b", delay=0.1)),
+                Step("c", record(calls, "c"), needs=("a", "b")),
+            ]
+        )
+        run = WorkflowRun(workflow, {})
+
+        started_at = asyncio.get_running_loop().time()
+        assert await run.execute() is True
+        assert asyncio.get_running_loop().time() - started_at < 0.19
+        assert calls == ["a", "b", "c"]
+        assert set(run.durations) == {"a", "b", "c"}
+
+    async def test_passes_declared_inputs_and_outputs(self):
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        async def double(value):
+            return {"doubled": value * 2}
+
+        async def check(doubled):
+            assert doubled == 4
+
+        workflow = Workflow(
+            [
+                Step("double", double, inputs=("value",), outputs=("doubled",)),
+                Step("check", check, needs=("double",), inputs=("doubled",)),
+            ]
+        )
+        run = WorkflowRun(workflow, {"value": 2})
+
+        assert await run.execute() is True
+        assert run.state == {"value": 2, "doubled": 4}
+
+    async def test_rejects_undeclared_outputs(self):
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        workflow = Workflow([Step("a", record([], "a", result={"value": 1}))])
+
+        with pytest.raises(WorkflowGraphError, match="undeclared outputs: value"):
+            await WorkflowRun(workflow, {}).execute()
+
+    async def test_loop_back_reruns_target_and_descendants(self):
+        from demetra.services.dag import Loop, Step, Workflow, WorkflowRun
+
+        calls = []
+
+        async def check(feedback):
+            calls.append(("check", feedback))
+            if feedback is None:
+                return Loop("build", {"feedback": "fix it"})
+            return None
+
+        workflow = Workflow(
+            [
+                Step("setup", record(calls, "setup")),
+                Step("build", record(calls, "build"), needs=("setup",), max_loops=1),
+                Step("check", check, needs=("build",), inputs=("feedback",), outputs=("feedback",), loops=("build",)),
+            ]
+        )
+        run = WorkflowRun(workflow, {"feedback": None})
+
+        assert await run.execute() is True
+        assert calls == ["setup", "build", ("check", None), "build", ("check", "fix it")]
+        assert run.loops["build"] == 1
+
+    async def test_loop_back_limit_raises(self):
+        from demetra.services.dag import Loop, Step, Workflow, WorkflowRun
+
+        workflow = Workflow(
+            [
+                Step("build", record([], "build"), max_loops=1),
+                Step("check", record([], "check", result=Loop("build")), needs=("build",), loops=("build",)),
+            ]
+        )
+
+        with pytest.raises(InfiniteLoopError):
+            await WorkflowRun(workflow, {}).execute()
+
+    async def test_loop_back_cancels_running_descendants(self):
+        from demetra.services.dag import Loop, Step, Stop, Workflow, WorkflowRun
+
+        cancelled = asyncio.Event()
+        attempts = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def fast():
+            attempts.append("fast")
+            return Loop("build") if len(attempts) == 1 else Stop("done")
+
+        workflow = Workflow(
+            [
+                Step("build", record([], "build"), max_loops=1),
+                Step("slow", slow, needs=("build",)),
+                Step("fast", fast, needs=("build",), loops=("build",)),
+            ]
+        )
+        run = WorkflowRun(workflow, {})
+
+        assert await asyncio.wait_for(run.execute(), timeout=5) is False
+        assert cancelled.is_set()
+        assert run.stopped == Stop("done")
+
+    async def test_stop_ends_the_run(self):
+        from demetra.services.dag import Step, Stop, Workflow, WorkflowRun
+
+        calls = []
+        workflow = Workflow(
+            [Step("a", record(calls, "a", result=Stop("empty plan"))), Step("b", record(calls, "b"), needs=("a",))]
+        )
+        run = WorkflowRun(workflow, {})
+
+        assert await run.execute() is False
+        assert run.completed is False
+        assert calls == ["a"]
+
+    async def test_skips_steps_when_condition_is_false(self):
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        calls = []
+
+        async def never():
+            return False
+
+        workflow = Workflow([Step("a", record(calls, "a"), when=never), Step("b", record(calls, "b"), needs=("a",))])
+        run = WorkflowRun(workflow, {})
+
+        assert await run.execute() is True
+        assert calls == ["b"]
+        assert run.skipped == {"a"}
+
+    async def test_retries_failed_steps(self):
+        from demetra.exceptions import DemetraError
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise DemetraError("push failed")
+
+        workflow = Workflow([Step("push", flaky, retries=1, retry_delay=0)])
+
+        assert await WorkflowRun(workflow, {}).execute() is True
+        assert len(attempts) == 2
+
+    async def test_step_timeout(self):
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        workflow = Workflow([Step("slow", record([], "slow", delay=1), timeout=0.01)])
+
+        with pytest.raises(StepTimeoutError, match="Step 'slow' hit timeout"):
+            await WorkflowRun(workflow, {}).execute()
+
+    async def test_failure_cancels_running_steps(self):
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def broken():
+            raise ValueError("boom")
+
+        workflow = Workflow([Step("slow", slow), Step("broken", broken)])
+
+        with pytest.raises(ValueError, match="boom"):
+            await WorkflowRun(workflow, {}).execute()
+        assert cancelled.is_set()
+
+    async def test_resumes_after_completed_steps(self):
+        from demetra.services.dag import Step, Workflow, WorkflowRun
+
+        calls = []
+        progress = []
+
+        async def on_progress(run, stage):
+            progress.append((stage, sorted(run.done)))
+
+        workflow = Workflow(
+            [
+                Step("a", record(calls, "a")),
+                Step("mark", record(calls, "mark"), checkpoint=False),
+                Step("b", record(calls, "b"), needs=("a", "mark")),
+            ]
+        )
+        run = WorkflowRun(workflow, {}, completed_steps=["a", "mark"], on_progress=on_progress)
+
+        assert await run.execute() is True
+        assert calls == ["mark", "b"]
+        assert progress == [("mark", ["a", "mark"]), ("b", ["a", "b", "mark"])]
@@ -37,3 +37,29 @@ class TestDatabaseService:
 
         result = await get_session("TICKET-999")
         assert result is None
+
+    @pytest.mark.asyncio
+    async def test_checkpoint_round_trip(self):
+        from demetra.services.database import delete_checkpoint, get_checkpoint, list_checkpoints, save_checkpoint
+
+        for stage in ("plan", "build"):
+            await save_checkpoint(
+                task_id="task-1",
+                task_identifier="TICKET-1",
+                project_path="/projects/demetra",
+                stage=stage,
+                completed_steps=["worktree", stage],
+                loops={"build": 1},
+                state={"build_plan": "The plan"},
+            )
+
+        checkpoint = await get_checkpoint(task_identifier="ticket-1")
+        assert checkpoint is not None
+        assert checkpoint.stage == "build"
+        assert checkpoint.completed_steps == ["worktree", "build"]
+        assert checkpoint.loops == {"build": 1}
+        assert checkpoint.state == {"build_plan": "The plan"}
+        assert len(await list_checkpoints()) == 1
+
+        await delete_checkpoint("task-1")
+        assert await get_checkpoint(task_id="task-1") is None
@@ -1,20 +1,437 @@
+from unittest.mock import patch
+
 import pytest
 
 
 class TestGraphqlService:
+    def test_queries_are_preloaded_by_operation_name(self):
+        from demetra.services.graphql import queries
+
+        assert {query.name for query in queries} == {
+            "CreateIssueComment",
+            "GetTodoIssues",
+            "ListIssueComments",
+            "ListStates",
+            "SyncIssues",
+            "UpdateIssue",
+        }
+        assert queries["SyncIssues"].operation == "query"
+        assert queries["UpdateIssue"].operation == "mutation"
+
+    def test_sync_issues_query_is_graphql(self):
+        from demetra.services.graphql import queries
+
+        document = queries["SyncIssues"].document
+        assert "issues" in document
+        assert "IssueFilter" in document
+        assert "updatedAt" in document
+
+    def test_get_todo_issues_query_is_graphql(self):
+        from demetra.services.graphql import queries
+
+        document = queries["GetTodoIssues"].document
+        assert "issues" in document
+        assert "pageInfo" in document
+        assert "state" in document
+
+    def test_unknown_query_raises(self):
+        from demetra.exceptions import GraphQLQueryError
+        from demetra.services.graphql import queries
+
+        with pytest.raises(GraphQLQueryError):
+            queries["Missing"]
+
+    def test_parse_query_hashes_document(self):
+        import hashlib
+
+        from demetra.services.graphql import parse_query
+
+        query = parse_query("query Viewer { viewer { id } }\n")
+        assert query.name == "Viewer"
+        assert query.sha256 == hashlib.sha256(b"query Viewer { viewer { id } }").hexdigest()
+
+    @pytest.mark.parametrize(
+        "document",
+        [
+            "query { viewer { id } }",
+            "query A { a } query B { b }",
+            "query Viewer { viewer { id }",
+            'query Viewer { viewer(name: ")") { id }',
+        ],
+    )
+    def test_parse_query_rejects_broken_documents(self, document):
+        from demetra.exceptions import GraphQLQueryError
+        from demetra.services.graphql import parse_query
+
+        with pytest.raises(GraphQLQueryError):
+            parse_query(document)
+
+    def test_registry_rejects_duplicate_operations(self, tmp_path):
+        from demetra.exceptions import GraphQLQueryError
+        from demetra.services.graphql import QueryRegistry
+
+        (tmp_path / "a.gql").write_text("query Viewer { viewer { id } }")
+        (tmp_path / "b.gql").write_text("query Viewer { viewer { name } }")
+
+        with pytest.raises(GraphQLQueryError):
+            QueryRegistry(path=tmp_path).load()
+
+
+class TestGraphqlClient:
+    @pytest.fixture
+    async def server(self):
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+
+        self.requests = []
+
+        async def handler(request):
+            self.requests.append((request.headers.get("Authorization"), await request.json()))
+            return web.json_response({"data": {"ok": True}})
+
+        app = web.Application()
+        app.router.add_post("/graphql", handler)
+        server = TestServer(app)
+        await server.start_server()
+        yield server
+        await server.close()
+
+    @pytest.mark.asyncio
+    async def test_request_reuses_single_session(self, server):
+        from demetra.services.graphql import GraphQLClient
+
+        client = GraphQLClient(url=str(server.make_url("/graphql")))
+        with patch("demetra.services.graphql.LINEAR_API_KEY", "test-key"):
+            first = await client.request("query { a }")
+            session = client.session
+            second = await client.request("query { b }", {"x": 1})
+
+        assert first == second == {"data": {"ok": True}}
+        assert client.session is session
+        assert self.requests == [
+            ("test-key", {"query": "query { a }"}),
+            ("test-key", {"query": "query { b }", "variables": {"x": 1}}),
+        ]
+        await client.close()
+        assert session.closed
+
+    @pytest.mark.asyncio
+    async def test_session_is_recreated_after_close(self):
+        from demetra.services.graphql import GraphQLClient
+
+        client = GraphQLClient(limit=5, limit_per_host=2)
+        session = client.session
+        assert session.connector is not None
+        assert session.connector.limit == 5
+        assert session.connector.limit_per_host == 2
+
+        await client.close()
+        assert client.session is not session
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_request_raises_without_api_key(self):
+        from demetra.exceptions import LinearError
+        from demetra.services.graphql import GraphQLClient
+
+        with patch("demetra.services.graphql.LINEAR_API_KEY", None), pytest.raises(LinearError):
+            await GraphQLClient().request("query { a }")
+
+    @pytest.mark.asyncio
+    async def test_persisted_queries_send_hash_after_first_request(self):
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+
+        from demetra.services.graphql import GraphQLClient, parse_query
+
+        payloads, known = [], set()
+
+        async def handler(request):
+            payload = await request.json()
+            payloads.append(payload)
+            sha256 = payload["extensions"]["persistedQuery"]["sha256Hash"]
+            if "query" in payload:
+                known.add(sha256)
+            elif sha256 not in known:
+                return web.json_response({"errors": [{"message": "PersistedQueryNotFound"}]})
+            return web.json_response({"data": {"ok": True}})
+
+        app = web.Application()
+        app.router.add_post("/graphql", handler)
+        server = TestServer(app)
+        await server.start_server()
+
+        query = parse_query("query Viewer { viewer { id } }")
+        client = GraphQLClient(url=str(server.make_url("/graphql")), persisted_queries=True)
+        with patch("demetra.services.graphql.LINEAR_API_KEY", "test-key"):
+            await client.request(query)
+            await client.request(query)
+            known.clear()
+            result = await client.request(query)
+        await client.close()
+        await server.close()
+
+        assert result == {"data": {"ok": True}}
+        assert ["query" in payload for payload in payloads] == [True, False, False, True]
+        assert all(payload["operationName"] == "Viewer" for payload in payloads)
+
+
+class TestMutationBatcher:
+    @pytest.mark.asyncio
+    async def test_merge_mutations_aliases_fields_and_variables(self):
+        from demetra.services.graphql import merge_mutations, queries
+
+        query, variables = merge_mutations(
+            [
+                (queries["CreateIssueComment"], {"issueId": "issue-1", "body": "plan"}),
+                (queries["UpdateIssue"], {"issueId": "issue-1", "stateId": "state-1"}),
+            ]
+        )
+
+        assert query.name == "BatchMutations"
+        assert "m0: commentCreate(input: { id: $m0_commentId, issueId: $m0_issueId, body: $m0_body })" in query.document
+        assert "m1: issueUpdate(id: $m1_issueId, input: { stateId: $m1_stateId })" in query.document
+        assert "$m0_body: String!" in query.document
+        assert variables == {
+            "m0_issueId": "issue-1",
+            "m0_body": "plan",
+            "m1_issueId": "issue-1",
+            "m1_stateId": "state-1",
+        }
+
+    @pytest.mark.asyncio
+    async def test_split_batch_result_maps_data_and_errors(self):
+        from demetra.services.graphql import queries, split_batch_result
+
+        mutations = [(queries["CreateIssueComment"], {}), (queries["UpdateIssue"], {})]
+        result = {
+            "data": {"m0": {"success": True}, "m1": None},
+            "errors": [{"message": "Entity not found", "path": ["m1"]}],
+        }
+
+        comment, update = split_batch_result(mutations, result)
+        assert comment == {"data": {"commentCreate": {"success": True}}}
+        assert update == {
+            "data": {"issueUpdate": None},
+            "errors": [{"message": "Entity not found", "path": ["issueUpdate"]}],
+        }
+
+    @pytest.mark.asyncio
+    async def test_concurrent_mutations_share_one_request(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        from demetra.services.graphql import MutationBatcher, queries
+
+        batcher = MutationBatcher(window=0.01)
+        with patch("demetra.services.graphql.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = {"data": {"m0": {"success": True}, "m1": {"success": False}}}
+            comment, update = await asyncio.gather(
+                batcher.submit(queries["CreateIssueComment"], {"issueId": "issue-1", "body": "plan"}),
+                batcher.submit(queries["UpdateIssue"], {"issueId": "issue-1", "stateId": "state-1"}),
+            )
+
+        assert mock_request.call_count == 1
+        assert mock_request.call_args.args[0].name == "BatchMutations"
+        assert comment == {"data": {"commentCreate": {"success": True}}}
+        assert update == {"data": {"issueUpdate": {"success": False}}}
+
+    @pytest.mark.asyncio
+    async def test_single_mutation_is_sent_unchanged(self):
+        from unittest.mock import AsyncMock
+
+        from demetra.services.graphql import MutationBatcher, queries
+
+        batcher = MutationBatcher(window=0.01)
+        with patch("demetra.services.graphql.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = {"data": {"issueUpdate": {"success": True}}}
+            result = await batcher.submit(queries["UpdateIssue"], {"issueId": "issue-1", "stateId": "state-1"})
+
+        mock_request.assert_called_once_with(
+            queries["UpdateIssue"], {"issueId": "issue-1", "stateId": "state-1"}, idempotent=False
+        )
+        assert result == {"data": {"issueUpdate": {"success": True}}}
+
     @pytest.mark.asyncio
-    async def test_get_todo_issues_query_returns_query_string(self):
-        from demetra.services.graphql import get_todo_issues_query
+    async def test_batch_is_idempotent_only_when_every_mutation_is(self):
+        import asyncio
+        from unittest.mock import AsyncMock
 
-        result = await get_todo_issues_query()
-        assert isinstance(result, str)
-        assert "query" in result.lower()
-        assert "issues" in result.lower()
+        from demetra.services.graphql import MutationBatcher, queries
+
+        batcher = MutationBatcher(window=0.01)
+        with patch("demetra.services.graphql.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = {"data": {}}
+            await asyncio.gather(
+                batcher.submit(queries["UpdateIssue"], {"issueId": "issue-1", "stateId": "state-1"}, idempotent=True),
+                batcher.submit(queries["CreateIssueComment"], {"issueId": "issue-1", "body": "plan"}),
+            )
+            await batcher.submit(queries["UpdateIssue"], {"issueId": "issue-2", "stateId": "state-1"}, idempotent=True)
+
+        assert [call.kwargs["idempotent"] for call in mock_request.call_args_list] == [False, True]
 
     @pytest.mark.asyncio
-    async def test_get_todo_issues_query_returns_graphql(self):
-        from demetra.services.graphql import get_todo_issues_query
+    async def test_request_error_is_raised_for_every_caller(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        from demetra.exceptions import LinearError
+        from demetra.services.graphql import MutationBatcher, queries
+
+        batcher = MutationBatcher(window=0.01)
+        with patch("demetra.services.graphql.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.side_effect = LinearError("boom")
+            results = await asyncio.gather(
+                batcher.submit(queries["UpdateIssue"], {"issueId": "issue-1", "stateId": "state-1"}),
+                batcher.submit(queries["UpdateIssue"], {"issueId": "issue-2", "stateId": "state-1"}),
+                return_exceptions=True,
+            )
+
+        assert all(isinstance(result, LinearError) for result in results)
+
+
+class TestRateLimiting:
+    @pytest.fixture
+    async def server(self):
+        import asyncio
+
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+
+        self.responses = []
+        self.calls = 0
+        self.delay = 0
+
+        async def handler(request):
+            self.calls += 1
+            status, body, headers = self.responses.pop(0)
+            await asyncio.sleep(self.delay)
+            return web.json_response(body, status=status, headers=headers)
+
+        app = web.Application()
+        app.router.add_post("/graphql", handler)
+        server = TestServer(app)
+        await server.start_server()
+        with patch("demetra.services.graphql.LINEAR_API_KEY", "test-key"):
+            yield server
+        await server.close()
+
+    def make_client(self, server, **kwargs):
+        from demetra.services.graphql import GraphQLClient
+
+        return GraphQLClient(url=str(server.make_url("/graphql")), backoff=0, **kwargs)
+
+    @pytest.mark.asyncio
+    async def test_retries_server_errors_and_rate_limits(self, server):
+        self.responses = [
+            (503, {}, {}),
+            (429, {}, {"Retry-After": "0"}),
+            (400, {"errors": [{"extensions": {"code": "RATELIMITED"}}]}, {}),
+            (200, {"data": {"ok": True}}, {}),
+        ]
+        client = self.make_client(server)
+
+        assert await client.request("query { a }") == {"data": {"ok": True}}
+        assert self.calls == 4
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_mutations_only_retry_rate_limits(self, server):
+        from demetra.exceptions import LinearError
+
+        self.responses = [(429, {}, {"Retry-After": "0"}), (503, {}, {}), (200, {"data": {"ok": True}}, {})]
+        client = self.make_client(server)
+
+        with pytest.raises(LinearError, match="503"):
+            await client.request("mutation M { a }")
+        assert self.calls == 2
+        assert await client.request("mutation M { a }", idempotent=True) == {"data": {"ok": True}}
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_timed_out_mutations_are_not_retried(self, server):
+        import asyncio
+
+        from demetra.exceptions import LinearError
+
+        self.responses = [(200, {"data": {"ok": True}}, {})] * 2
+        self.delay = 0.5
+        client = self.make_client(server, timeout=0.1)
+
+        with pytest.raises(LinearError, match="Timeout"):
+            await client.request("mutation M { a }")
+        await asyncio.sleep(0)
+        assert self.calls == 1
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_retries(self, server):
+        from demetra.exceptions import LinearError
+
+        self.responses = [(502, {}, {}), (502, {}, {})]
+        client = self.make_client(server, max_retries=1)
+
+        with pytest.raises(LinearError, match="502"):
+            await client.request("query { a }")
+        assert self.calls == 2
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self, server):
+        from demetra.exceptions import LinearError
+
+        self.responses = [(400, {"errors": [{"message": "Invalid query"}]}, {})]
+        client = self.make_client(server)
+
+        with pytest.raises(LinearError, match="400"):
+            await client.request("query { a }")
+        assert self.calls == 1
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_bucket_is_seeded_from_response_headers(self, server):
+        headers = {"X-RateLimit-Requests-Limit": "100", "X-RateLimit-Requests-Remaining": "7"}
+        self.responses = [(200, {"data": {}}, headers)]
+        client = self.make_client(server)
+
+        await client.request("query { a }")
+        assert client.rate_limiter.capacity == 100
+        assert client.rate_limiter.tokens <= 7.01
+        await client.close()
+
+    def test_bucket_blocks_until_reset_when_exhausted(self):
+        import time
+
+        from demetra.services.graphql import TokenBucket
+
+        bucket = TokenBucket(capacity=10, window=10)
+        reset = int((time.time() + 5) * 1000)
+        bucket.update(
+            {
+                "X-RateLimit-Requests-Limit": "10",
+                "X-RateLimit-Requests-Remaining": "0",
+                "X-RateLimit-Requests-Reset": str(reset),
+            }
+        )
+
+        assert bucket.tokens == 0
+        assert 4 < bucket.blocked_until - time.monotonic() <= 5
+
+    @pytest.mark.asyncio
+    async def test_bucket_waits_for_refill(self):
+        import time
+
+        from demetra.services.graphql import TokenBucket
+
+        bucket = TokenBucket(capacity=20, window=1)
+        bucket.tokens = 0
+        started = time.monotonic()
+        await bucket.acquire()
+
+        assert time.monotonic() - started >= 0.04
+
+    def test_retry_delay_respects_retry_after(self):
+        from demetra.services.graphql import retry_delay
 
-        result = await get_todo_issues_query()
-        assert "team" in result.lower()
-        assert "state" in result.lower()
+        assert 0 <= retry_delay(3, backoff=0.1) <= 0.8
+        assert retry_delay(0, headers={"Retry-After": "3"}, backoff=0.1) == 3
@@ -4,268 +4,225 @@ import pytest
 
 
 class TestLinearService:
-    @pytest.mark.asyncio
-    async def test_get_todo_issues_returns_matching_project(self):
-        from demetra.services.linear import get_todo_issues
-
-        mock_data = {
-            "data": {
-                "team": {
-                    "states": {
-                        "nodes": [
-                            {
-                                "name": "Todo",
-                                "issues": {
-                                    "nodes": [
-                                        {
-                                            "id": "issue-1",
-                                            "identifier": "DEMETRA-1",
-                                            "title": "Test Issue",
-                                            "description": "Description",
-                                            "priority": 1,
-                                            "createdAt": "2024-01-01",
-                                            "branchName": "feature/test",
-                                            "project": {"name": "demetra"},
-                                        }
-                                    ]
-                                },
-                            }
-                        ]
-                    }
-                }
+    @staticmethod
+    def issues_page(identifiers: list[str], end_cursor: str | None = None) -> dict:
+        nodes = [
+            {
+                "id": identifier.lower(),
+                "identifier": identifier,
+                "title": identifier,
+                "description": None,
+                "priority": 1,
+                "createdAt": "2024-01-01",
+                "branchName": identifier.lower(),
+                "project": {"name": "demetra"},
             }
-        }
+            for identifier in identifiers
+        ]
+        page_info = {"hasNextPage": end_cursor is not None, "endCursor": end_cursor}
+        return {"data": {"issues": {"nodes": nodes, "pageInfo": page_info}}}
+
+    @pytest.mark.asyncio
+    async def test_iter_todo_issues_filters_on_server(self):
+        from demetra.services.graphql import queries
+        from demetra.services.linear import iter_todo_issues
 
         with (
-            patch("demetra.services.linear.get_todo_issues_query", new_callable=AsyncMock) as mock_query,
             patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
+            patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"),
         ):
-            mock_query.return_value = "query"
-            mock_request.return_value = mock_data
-            with patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"):
-                issues = await get_todo_issues("demetra")
+            mock_request.return_value = self.issues_page(["DEMETRA-1"])
+            issues = [issue async for issue in iter_todo_issues("demetra", page_size=5)]
 
-        assert len(issues) == 1
-        assert issues[0].identifier == "DEMETRA-1"
-        assert issues[0].title == "Test Issue"
+        assert [issue.identifier for issue in issues] == ["DEMETRA-1"]
+        assert issues[0].description == ""
+        mock_request.assert_called_once_with(
+            queries["GetTodoIssues"], {"teamId": "team-123", "projectName": "demetra", "stateName": "todo", "first": 5}
+        )
 
     @pytest.mark.asyncio
-    async def test_get_todo_issues_filters_by_project_name(self):
-        from demetra.services.linear import get_todo_issues
-
-        mock_data = {
-            "data": {
-                "team": {
-                    "states": {
-                        "nodes": [
-                            {
-                                "name": "Todo",
-                                "issues": {
-                                    "nodes": [
-                                        {
-                                            "id": "issue-1",
-                                            "identifier": "DEMETRA-1",
-                                            "title": "Issue 1",
-                                            "description": "",
-                                            "priority": 1,
-                                            "createdAt": "2024-01-01",
-                                            "branchName": "feature/test",
-                                            "project": {"name": "demetra"},
-                                        },
-                                        {
-                                            "id": "issue-2",
-                                            "identifier": "DEMETRA-2",
-                                            "title": "Issue 2",
-                                            "description": "",
-                                            "priority": 1,
-                                            "createdAt": "2024-01-01",
-                                            "branchName": "feature/test2",
-                                            "project": {"name": "other"},
-                                        },
-                                    ]
-                                },
-                            }
-                        ]
-                    }
-                }
-            }
-        }
+    async def test_iter_todo_issues_walks_all_pages(self):
+        from demetra.services.linear import iter_todo_issues
 
         with (
-            patch("demetra.services.linear.get_todo_issues_query", new_callable=AsyncMock) as mock_query,
             patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
         ):
-            mock_query.return_value = "query"
-            mock_request.return_value = mock_data
-            with patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"):
-                issues = await get_todo_issues("demetra")
+            mock_request.side_effect = [
+                self.issues_page(["DEMETRA-1", "DEMETRA-2"], end_cursor="cursor-1"),
+                self.issues_page(["DEMETRA-3"]),
+            ]
+            issues = [issue async for issue in iter_todo_issues("demetra", page_size=2)]
 
-        assert len(issues) == 1
-        assert issues[0].identifier == "DEMETRA-1"
+        assert [issue.identifier for issue in issues] == ["DEMETRA-1", "DEMETRA-2", "DEMETRA-3"]
+        assert "after" not in mock_request.call_args_list[0].args[1]
+        assert mock_request.call_args_list[1].args[1]["after"] == "cursor-1"
 
     @pytest.mark.asyncio
-    async def test_get_linear_task_returns_first_by_priority(self):
-        from demetra.services.linear import get_linear_task
-
-        mock_data = {
-            "data": {
-                "team": {
-                    "states": {
-                        "nodes": [
-                            {
-                                "name": "Todo",
-                                "issues": {
-                                    "nodes": [
-                                        {
-                                            "id": "issue-1",
-                                            "identifier": "DEMETRA-2",
-                                            "title": "Low Priority",
-                                            "description": "",
-                                            "priority": 4,
-                                            "createdAt": "2024-01-02",
-                                            "branchName": "feature/low",
-                                            "project": {"name": "demetra"},
-                                        },
-                                        {
-                                            "id": "issue-2",
-                                            "identifier": "DEMETRA-1",
-                                            "title": "High Priority",
-                                            "description": "",
-                                            "priority": 1,
-                                            "createdAt": "2024-01-01",
-                                            "branchName": "feature/high",
-                                            "project": {"name": "demetra"},
-                                        },
-                                    ]
-                                },
-                            }
-                        ]
-                    }
-                }
-            }
-        }
+    async def test_iter_todo_issues_fetches_pages_lazily(self):
+        from demetra.services.linear import iter_todo_issues
 
         with (
-            patch("demetra.services.linear.get_todo_issues_query", new_callable=AsyncMock) as mock_query,
             patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
         ):
-            mock_query.return_value = "query"
-            mock_request.return_value = mock_data
-            with patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"):
-                task = await get_linear_task("demetra")
+            mock_request.return_value = self.issues_page(["DEMETRA-1", "DEMETRA-2"], end_cursor="cursor-1")
+            issues = iter_todo_issues("demetra", page_size=2)
+            issue = await anext(issues)
+            await issues.aclose()
+
+        assert issue.identifier == "DEMETRA-1"
+        assert mock_request.call_count == 1
+
+
+@pytest.mark.usefixtures("database")
+class TestLinearSync:
+    @staticmethod
+    def issue_node(identifier: str, **fields) -> dict:
+        return {
+            "id": identifier.lower(),
+            "identifier": identifier,
+            "title": identifier,
+            "description": "",
+            "priority": 2,
+            "createdAt": "2024-01-01T00:00:00.000Z",
+            "updatedAt": "2024-01-01T00:00:00.000Z",
+            "archivedAt": None,
+            "branchName": identifier.lower(),
+            "state": {"name": "Todo"},
+            "project": {"name": "Demetra"},
+            **fields,
+        }
 
-        assert task is not None
-        assert task.identifier == "DEMETRA-1"
+    @staticmethod
+    def sync_page(nodes: list[dict], end_cursor: str | None = None) -> dict:
+        page_info = {"hasNextPage": end_cursor is not None, "endCursor": end_cursor}
+        return {"data": {"issues": {"nodes": nodes, "pageInfo": page_info}}}
 
     @pytest.mark.asyncio
-    async def test_get_linear_task_returns_none_when_no_issues(self):
-        from demetra.services.linear import get_linear_task
-
-        mock_data = {"data": {"team": {"states": {"nodes": []}}}}
+    async def test_sync_issues_stores_pages_and_watermark(self):
+        from demetra.services.database import get_sync_watermark
+        from demetra.services.linear import sync_issues
 
         with (
-            patch("demetra.services.linear.get_todo_issues_query", new_callable=AsyncMock) as mock_query,
             patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
+            patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"),
         ):
-            mock_query.return_value = "query"
-            mock_request.return_value = mock_data
-            with patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"):
-                task = await get_linear_task("demetra")
-
-        assert task is None
+            mock_request.side_effect = [
+                self.sync_page([self.issue_node("DEMETRA-1")], end_cursor="cursor-1"),
+                self.sync_page([self.issue_node("DEMETRA-2", updatedAt="2024-02-01T00:00:00.000Z")]),
+            ]
+            synced = await sync_issues()
+
+        assert synced == 2
+        first_variables = mock_request.call_args_list[0].args[1]
+        assert first_variables["filter"] == {
+            "team": {"id": {"eq": "team-123"}},
+            "state": {"name": {"eqIgnoreCase": "todo"}},
+        }
+        assert first_variables["includeArchived"] is False
+        assert mock_request.call_args_list[1].args[1]["after"] == "cursor-1"
+        assert await get_sync_watermark("issues:team-123") == "2024-02-01T00:00:00.000Z"
 
     @pytest.mark.asyncio
-    async def test_update_ticket_status_returns_true_on_success(self):
-        from demetra.services.linear import update_ticket_status
-
-        mock_data = {
-            "data": {
-                "issueUpdate": {
-                    "success": True,
-                    "issue": {
-                        "id": "issue-1",
-                        "state": {"id": "state-1", "name": "In Progress"},
-                    },
-                }
-            }
-        }
+    async def test_sync_issues_is_incremental(self):
+        from demetra.services.database import list_issues, set_sync_watermark
+        from demetra.services.linear import sync_issues
 
+        await set_sync_watermark("issues:team-123", "2024-01-01T00:00:00.000Z")
         with (
-            patch("demetra.services.linear.get_update_issue_mutation", new_callable=AsyncMock) as mock_mutation,
             patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
+            patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"),
         ):
-            mock_mutation.return_value = "mutation"
-            mock_request.return_value = mock_data
-            result = await update_ticket_status("issue-1", "state-1")
-
-        assert result is True
+            mock_request.return_value = self.sync_page(
+                [self.issue_node("DEMETRA-1", archivedAt="2024-01-02T00:00:00.000Z")]
+            )
+            await sync_issues()
+
+        variables = mock_request.call_args.args[1]
+        assert variables["filter"] == {
+            "team": {"id": {"eq": "team-123"}},
+            "updatedAt": {"gt": "2024-01-01T00:00:00.000Z"},
+        }
+        assert variables["includeArchived"] is True
+        assert await list_issues(project_name="demetra", state_name="todo", limit=10) == []
 
     @pytest.mark.asyncio
-    async def test_update_ticket_status_returns_false_on_failure(self):
-        from demetra.services.linear import update_ticket_status
-
-        mock_data = {
-            "data": {
-                "issueUpdate": {
-                    "success": False,
-                }
-            }
-        }
+    async def test_sync_issues_keeps_filtering_until_something_is_synced(self):
+        from demetra.services.database import get_sync_watermark
+        from demetra.services.linear import sync_issues
 
         with (
-            patch("demetra.services.linear.get_update_issue_mutation", new_callable=AsyncMock) as mock_mutation,
             patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
+            patch("demetra.services.linear.LINEAR_TEAM_ID", "team-123"),
         ):
-            mock_mutation.return_value = "mutation"
-            mock_request.return_value = mock_data
-            result = await update_ticket_status("issue-1", "state-1")
+            mock_request.return_value = self.sync_page([])
+            await sync_issues()
+            await sync_issues()
 
-        assert result is False
+        assert await get_sync_watermark("issues:team-123") is None
+        assert all("state" in call.args[1]["filter"] for call in mock_request.call_args_list)
 
     @pytest.mark.asyncio
-    async def test_post_comment_returns_true_on_success(self):
-        from demetra.services.linear import post_comment
-
-        mock_data = {
-            "data": {
-                "commentCreate": {
-                    "success": True,
-                    "comment": {
-                        "id": "comment-1",
-                        "body": "Test comment",
-                    },
-                }
-            }
-        }
+    async def test_claim_linear_tasks_returns_first_by_priority(self):
+        from demetra.services.linear import claim_linear_tasks
 
-        with (
-            patch("demetra.services.linear.get_create_comment_mutation", new_callable=AsyncMock) as mock_mutation,
-            patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
-        ):
-            mock_mutation.return_value = "mutation"
-            mock_request.return_value = mock_data
-            result = await post_comment("issue-1", "Test comment")
+        nodes = [
+            self.issue_node("DEMETRA-1", priority=4),
+            self.issue_node("DEMETRA-2", priority=1),
+            self.issue_node("DEMETRA-3", priority=1, state={"name": "In Progress"}),
+            self.issue_node("DEMETRA-4", priority=1, project={"name": "other"}),
+        ]
+        with patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = self.sync_page(nodes)
+            tasks = await claim_linear_tasks("demetra", limit=1)
 
-        assert result is True
+        assert [task.identifier for task in tasks] == ["DEMETRA-2"]
 
     @pytest.mark.asyncio
-    async def test_post_comment_returns_false_on_failure(self):
-        from demetra.services.linear import post_comment
-
-        mock_data = {
-            "data": {
-                "commentCreate": {
-                    "success": False,
-                }
-            }
-        }
+    async def test_claim_linear_tasks_uses_local_copy_when_sync_fails(self):
+        from demetra.exceptions import LinearError
+        from demetra.services.database import upsert_issues
+        from demetra.services.linear import build_linear_issue, claim_linear_tasks
 
+        await upsert_issues([build_linear_issue(self.issue_node("DEMETRA-1"))])
         with (
-            patch("demetra.services.linear.get_create_comment_mutation", new_callable=AsyncMock) as mock_mutation,
             patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request,
+            patch("demetra.services.linear.print_message"),
         ):
-            mock_mutation.return_value = "mutation"
-            mock_request.return_value = mock_data
-            result = await post_comment("issue-1", "Test comment")
+            mock_request.side_effect = LinearError("offline")
+            tasks = await claim_linear_tasks("demetra", limit=1)
+
+        assert [task.identifier for task in tasks] == ["DEMETRA-1"]
+
+    @pytest.mark.asyncio
+    async def test_claim_linear_tasks_never_claims_twice(self):
+        import asyncio
+
+        from demetra.services.database import list_issues
+        from demetra.services.linear import claim_linear_tasks
+
+        nodes = [
+            self.issue_node("DEMETRA-1", priority=4),
+            self.issue_node("DEMETRA-2", priority=1),
+            self.issue_node("DEMETRA-3", priority=2),
+        ]
+        with patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = self.sync_page(nodes)
+            first, second = await asyncio.gather(
+                claim_linear_tasks("demetra", limit=2), claim_linear_tasks("demetra", limit=2)
+            )
+
+        claimed = [issue.identifier for issue in first + second]
+        assert sorted(claimed) == ["DEMETRA-1", "DEMETRA-2", "DEMETRA-3"]
+        longest = first if len(first) >= len(second) else second
+        assert [issue.identifier for issue in longest] == ["DEMETRA-2", "DEMETRA-3"]
+        assert await list_issues(project_name="demetra", state_name="todo", limit=10) == []
+
+    @pytest.mark.asyncio
+    async def test_claim_linear_tasks_returns_nothing_when_no_issues(self):
+        from demetra.services.linear import claim_linear_tasks
+
+        with patch("demetra.services.linear.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = self.sync_page([])
+            tasks = await claim_linear_tasks("demetra", limit=1)
 
-        assert result is False
+        assert tasks == []
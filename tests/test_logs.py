@@ -0,0 +1,85 @@
+import gzip
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from tests.conftest import make_issue
+
+
+@pytest.mark.asyncio
+class TestCommandLogs:
+    @pytest.fixture(autouse=True)
+    async def setup(self, database, tmp_path):
+        self.logs_path = tmp_path / "logs"
+        with patch("demetra.services.logs.LOGS_PATH", self.logs_path):
+            yield
+
+    async def test_no_log_outside_of_run(self):
+        from demetra.services.logs import open_command_log
+
+        assert await open_command_log(["echo", "hello"]) is None
+
+    async def test_command_output_is_logged_per_step(self, tmp_path):
+        from demetra.services.database import list_command_logs
+        from demetra.services.logs import log_run, read_command_log, set_log_step
+        from demetra.services.subprocess import run_command
+
+        with log_run(make_issue("ENG-1")) as run_id:
+            set_log_step("lint")
+            await run_command(
+                [sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"],
+                tmp_path,
+                disable_stdio=True,
+            )
+
+        logs = await list_command_logs(task_identifier="eng-1")
+        assert len(logs) == 1
+        assert logs[0].run_id == run_id
+        assert logs[0].step == "lint"
+        assert logs[0].exit_code == 3
+        assert logs[0].finished_at is not None
+
+        content = read_command_log(Path(logs[0].path))
+        assert content.startswith(f"$ {sys.executable} -c")
+        assert "out\n" in content
+        assert "err\n" in content
+        assert logs[0].size == len(content.encode())
+
+    async def test_interrupted_log_is_readable(self):
+        from demetra.services.logs import CommandLogWriter, log_run, open_command_log, read_command_log
+
+        with log_run(make_issue("ENG-1")):
+            writer = await open_command_log(["agent"])
+        assert isinstance(writer, CommandLogWriter)
+
+        writer.flush_size = 1
+        writer.write("partial output\n")
+        content = read_command_log(Path(writer.log.path))
+        writer._file.close()
+
+        assert content == "$ agent\npartial output\n"
+        with gzip.open(writer.log.path, "rt") as file:
+            assert file.read() == content
+
+    async def test_show_logs_prints_latest_run(self, capsys):
+        from demetra.services.logs import log_run, open_command_log, set_log_step, show_logs
+        from demetra.services.output import output
+
+        for text in ("first run\n", "second run\n"):
+            with log_run(make_issue("ENG-1")):
+                set_log_step("build")
+                writer = await open_command_log(["build"])
+                assert writer is not None
+                writer.write(text)
+                await writer.finish(0)
+
+        with patch("demetra.services.logs.print_message") as mock_print:
+            await show_logs(task_identifier="ENG-1")
+            await output.drain()
+
+        captured = capsys.readouterr().out
+        assert "second run" in captured
+        assert "first run" not in captured
+        mock_print.assert_called_once_with("ENG-1 / build (exit code 0)", style="heading")
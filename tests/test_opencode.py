@@ -1,5 +1,5 @@
 from pathlib import Path
-from unittest.mock import AsyncMock, patch
+from unittest.mock import ANY, AsyncMock, patch
 
 import pytest
 
@@ -26,6 +26,8 @@ class TestOpencodeService:
             session_id="session-123",
             task_title="do something",
             agent="plan",
+            stream=ANY,
+            priority=1,
         )
         assert result is not None
 
@@ -98,3 +100,119 @@ class TestOpencodeService:
         plan_output = f"some plan content\n{PLAN_HAS_QUESTIONS}\nmore text"
         result = await extract_plan(plan_output)
         assert result == "some plan content"
+
+    @pytest.mark.asyncio
+    async def test_get_opencode_sessions_parses_large_output(self, tmp_path):
+        import json
+        import sys
+
+        from demetra.services.opencode import get_opencode_sessions
+        from demetra.settings import OUTPUT_BUFFER_MAX_MEMORY
+
+        sessions = [{"id": f"ses-{index}", "title": "x" * 100} for index in range(OUTPUT_BUFFER_MAX_MEMORY // 100)]
+        (tmp_path / "sessions.json").write_text(json.dumps(sessions))
+        script = tmp_path / "opencode"
+        script.write_text(f"#!{sys.executable}\nimport sys\nsys.stdout.write(open('sessions.json').read())\n")
+        script.chmod(0o755)
+
+        with (
+            patch("demetra.services.opencode.OPENCODE_BACKEND", "cli"),
+            patch("demetra.services.opencode.OPENCODE_PATH", script),
+        ):
+            result = await get_opencode_sessions(target_path=tmp_path)
+
+        assert len(result) == len(sessions)
+        assert result[-1] == sessions[-1]
+
+
+class TestPlanStream:
+    def test_collects_text_events(self):
+        from demetra.services.opencode import PlanStream
+
+        stream = PlanStream()
+        with patch("demetra.services.opencode.output"):
+            stream.feed_line('{"type": "step_start", "sessionID": "ses-1", "part": {"type": "step-start"}}')
+            stream.feed_line('{"type": "tool_use", "sessionID": "ses-1", "part": {"type": "tool", "tool": "read"}}')
+            stream.feed_line('{"type": "text", "sessionID": "ses-1", "part": {"type": "text", "text": "## Plan"}}')
+
+        assert stream.text == "## Plan\n"
+        assert stream.session_id == "ses-1"
+        assert not stream.done.is_set()
+
+    def test_detects_end_marker_across_parts(self):
+        from demetra.services.opencode import PlanStream
+
+        stream = PlanStream()
+        with patch("demetra.services.opencode.output"):
+            stream.add_text("plan\nReady to proceed")
+            assert not stream.done.is_set()
+            stream.add_text(" to build.")
+
+        assert stream.done.is_set()
+
+    def test_plain_lines_are_text(self):
+        from demetra.services.opencode import PLAN_HAS_QUESTIONS, PlanStream
+
+        stream = PlanStream()
+        with patch("demetra.services.opencode.output"):
+            stream.feed_line(f"question?\n{PLAN_HAS_QUESTIONS}")
+
+        assert stream.done.is_set()
+
+    @pytest.mark.asyncio
+    async def test_plan_agent_ends_run_once_plan_is_final(self, tmp_path):
+        import json
+        import sys
+        import time
+
+        from demetra.services.opencode import PlanStream, extract_plan, plan_agent
+
+        events = [
+            {"type": "step_start", "sessionID": "ses-1", "part": {"type": "step-start"}},
+            {"type": "text", "sessionID": "ses-1", "part": {"type": "text", "text": "## Implementation Plan\n1. Do"}},
+            {"type": "text", "sessionID": "ses-1", "part": {"type": "text", "text": "Ready to proceed to build."}},
+        ]
+        script = tmp_path / "opencode"
+        script.write_text(
+            f"#!{sys.executable}\n"
+            "import sys, time\n"
+            f"for event in {[json.dumps(event) for event in events]!r}:\n"
+            "    print(event, flush=True)\n"
+            "time.sleep(30)\n"
+        )
+        script.chmod(0o755)
+
+        started_at = time.monotonic()
+        with (
+            patch("demetra.services.opencode.OPENCODE_PATH", script),
+            patch("demetra.services.opencode.output"),
+        ):
+            stream = PlanStream()
+            exit_code, plan_output, _ = await plan_agent(target_path=tmp_path, task="do something", stream=stream)
+
+        assert time.monotonic() - started_at < 10
+        assert exit_code == 0
+        assert await extract_plan(plan_output) == "## Implementation Plan\n1. Do"
+        assert stream.session_id == "ses-1"
+
+    @pytest.mark.asyncio
+    async def test_server_backend_reports_the_plan_session(self):
+        from demetra.services.opencode import PlanStream, run_opencode_agent
+
+        server = AsyncMock()
+        server.create_session.return_value = "ses-2"
+        stream = PlanStream()
+        with (
+            patch("demetra.services.opencode.OPENCODE_BACKEND", "server"),
+            patch("demetra.services.opencode.get_opencode_server", new_callable=AsyncMock, return_value=server),
+            patch("demetra.services.opencode.run_server_agent", new_callable=AsyncMock) as mock_agent,
+        ):
+            mock_agent.return_value = (0, "plan", "")
+            await run_opencode_agent(
+                target_path=Path("/worktree"), task="do it", agent="plan", task_title="ENG-1 Title", stream=stream
+            )
+
+        server.create_session.assert_awaited_once_with(title="ENG-1 Title")
+        assert mock_agent.await_args is not None
+        assert mock_agent.await_args.kwargs["session_id"] == "ses-2"
+        assert stream.session_id == "ses-2"
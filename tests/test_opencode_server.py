@@ -0,0 +1,188 @@
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+def create_stub_app(requests: list) -> web.Application:
+    async def list_sessions(request: web.Request) -> web.Response:
+        requests.append(("GET", request.path, dict(request.query), None))
+        return web.json_response([{"id": "ses-1", "title": "ENG-1 Title"}])
+
+    async def create_session(request: web.Request) -> web.Response:
+        payload = await request.json()
+        requests.append(("POST", request.path, dict(request.query), payload))
+        return web.json_response({"id": "ses-2", "title": payload.get("title")})
+
+    async def send_message(request: web.Request) -> web.Response:
+        payload = await request.json()
+        requests.append(("POST", request.path, dict(request.query), payload))
+        if request.match_info["session_id"] == "broken":
+            return web.json_response({"error": "unknown session"}, status=404)
+        return web.json_response(
+            {
+                "info": {"id": "msg-1"},
+                "parts": [
+                    {"type": "step-start"},
+                    {"type": "text", "text": "## Implementation Plan\n"},
+                    {"type": "tool", "tool": "read"},
+                    {"type": "text", "text": "Ready to proceed to build."},
+                ],
+            }
+        )
+
+    app = web.Application()
+    app.router.add_get("/session", list_sessions)
+    app.router.add_post("/session", create_session)
+    app.router.add_post("/session/{session_id}/message", send_message)
+    return app
+
+
+@pytest.mark.asyncio
+class TestOpenCodeServer:
+    @pytest.fixture(autouse=True)
+    async def stub_server(self):
+        self.requests = []
+        self.server = TestServer(create_stub_app(self.requests))
+        await self.server.start_server()
+        self.url = str(self.server.make_url("")).rstrip("/")
+        yield
+        from demetra.services.opencode_server import stop_opencode_servers
+
+        await stop_opencode_servers()
+        await self.server.close()
+
+    async def test_attaches_to_running_server(self):
+        from demetra.services.opencode_server import OpenCodeServer
+
+        server = OpenCodeServer(target_path=Path("/worktree"), url=self.url)
+        await server.start()
+        sessions = await server.list_sessions()
+        await server.stop()
+
+        assert sessions == [{"id": "ses-1", "title": "ENG-1 Title"}]
+        assert self.requests[0][2] == {"directory": "/worktree"}
+
+    async def test_prompt_sends_agent_and_model(self):
+        from demetra.services.opencode_server import OpenCodeServer
+
+        server = OpenCodeServer(target_path=Path("/worktree"), url=self.url)
+        result = await server.prompt(session_id="ses-1", agent="plan", text="do it", model="opencode/some-model")
+        await server.stop()
+
+        assert result == "## Implementation Plan\nReady to proceed to build."
+        _, path, _, payload = self.requests[-1]
+        assert path == "/session/ses-1/message"
+        assert payload == {
+            "agent": "plan",
+            "model": {"providerID": "opencode", "modelID": "some-model"},
+            "parts": [{"type": "text", "text": "do it"}],
+        }
+
+    async def test_error_response_raises(self):
+        from demetra.exceptions import OpenCodeServerError
+        from demetra.services.opencode_server import OpenCodeServer
+
+        server = OpenCodeServer(target_path=Path("/worktree"), url=self.url)
+        with pytest.raises(OpenCodeServerError, match="404"):
+            await server.prompt(session_id="broken", agent="build", text="do it")
+        await server.stop()
+
+    async def test_run_server_agent_reuses_server_and_creates_session(self):
+        from demetra.services.opencode_server import run_server_agent, servers
+
+        with patch("demetra.services.opencode_server.OPENCODE_SERVER_URL", self.url):
+            first = await run_server_agent(
+                target_path=Path("/worktree"), task="plan it", agent="plan", task_title="ENG-1 Title"
+            )
+            await run_server_agent(target_path=Path("/worktree"), task="build it", agent="build", session_id="ses-2")
+
+        assert first == (0, "## Implementation Plan\nReady to proceed to build.", "")
+        assert list(servers) == [Path("/worktree")]
+        paths = [path for _, path, _, _ in self.requests]
+        assert paths == ["/session", "/session", "/session/ses-2/message", "/session/ses-2/message"]
+        assert self.requests[1][3] == {"title": "ENG-1 Title"}
+
+    async def test_server_exit_during_startup_raises(self, tmp_path):
+        from demetra.exceptions import OpenCodeServerError
+        from demetra.services.opencode_server import OpenCodeServer
+
+        with patch("demetra.services.opencode_server.OPENCODE_PATH", Path("/bin/false")):
+            server = OpenCodeServer(target_path=tmp_path, start_timeout=5)
+            with pytest.raises(OpenCodeServerError, match="exited with code 1"):
+                await server.start()
+
+        assert server.process is None
+
+
+@pytest.mark.asyncio
+class TestGetOpenCodeServer:
+    @pytest.fixture(autouse=True)
+    def failed_servers(self):
+        with patch("demetra.services.opencode_server.failed_servers", {}):
+            yield
+
+    async def test_failed_start_is_not_retried_for_the_worktree(self, tmp_path):
+        from demetra.exceptions import OpenCodeServerError
+        from demetra.services.opencode_server import OpenCodeServer, get_opencode_server, stop_opencode_server
+
+        with patch.object(OpenCodeServer, "start", side_effect=OpenCodeServerError("exited with code 1")) as mock_start:
+            with pytest.raises(OpenCodeServerError, match="exited with code 1"):
+                await get_opencode_server(tmp_path)
+            with pytest.raises(OpenCodeServerError, match="failed to start earlier: exited with code 1"):
+                await get_opencode_server(tmp_path)
+            assert mock_start.call_count == 1
+
+            await stop_opencode_server(tmp_path)
+            with pytest.raises(OpenCodeServerError, match="exited with code 1"):
+                await get_opencode_server(tmp_path)
+            assert mock_start.call_count == 2
+
+    async def test_failed_url_is_not_retried_for_other_worktrees(self):
+        from demetra.exceptions import OpenCodeServerError
+        from demetra.services.opencode_server import OpenCodeServer, get_opencode_server
+
+        with (
+            patch("demetra.services.opencode_server.OPENCODE_SERVER_URL", "http://127.0.0.1:1"),
+            patch.object(OpenCodeServer, "start", side_effect=OpenCodeServerError("request failed")) as mock_start,
+        ):
+            for target_path in (Path("/worktree-1"), Path("/worktree-2")):
+                with pytest.raises(OpenCodeServerError, match="request failed"):
+                    await get_opencode_server(target_path)
+
+        assert mock_start.call_count == 1
+
+
+@pytest.mark.asyncio
+class TestOpenCodeBackend:
+    async def test_server_backend_falls_back_to_cli(self):
+        from demetra.exceptions import OpenCodeServerError
+        from demetra.services.opencode import run_opencode_agent
+
+        with (
+            patch("demetra.services.opencode.OPENCODE_BACKEND", "server"),
+            patch("demetra.services.opencode.run_server_agent", side_effect=OpenCodeServerError("down")),
+            patch("demetra.services.opencode.print_message"),
+            patch("demetra.services.opencode.run_command", new_callable=AsyncMock) as mock_run,
+        ):
+            mock_run.return_value = (0, "cli output", "")
+            result = await run_opencode_agent(target_path=Path("/worktree"), task="do it", agent="plan")
+
+        assert result == (0, "cli output", "")
+        assert mock_run.call_args.kwargs["command"][1] == "run"
+
+    async def test_server_backend_skips_cli(self):
+        from demetra.services.opencode import run_opencode_agent
+
+        with (
+            patch("demetra.services.opencode.OPENCODE_BACKEND", "server"),
+            patch("demetra.services.opencode.run_server_agent", new_callable=AsyncMock) as mock_agent,
+            patch("demetra.services.opencode.run_command", new_callable=AsyncMock) as mock_run,
+        ):
+            mock_agent.return_value = (0, "server output", "")
+            result = await run_opencode_agent(target_path=Path("/worktree"), task="do it", agent="build")
+
+        assert result == (0, "server output", "")
+        mock_run.assert_not_called()
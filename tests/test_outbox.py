@@ -0,0 +1,145 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+@pytest.mark.usefixtures("database")
+class TestOutboxService:
+    @staticmethod
+    def success(query, variables, idempotent=False):
+        field = "commentCreate" if query.name == "CreateIssueComment" else "issueUpdate"
+        return {"data": {field: {"success": True}}}
+
+    @pytest.mark.asyncio
+    async def test_enqueue_is_idempotent(self):
+        from demetra.services.database import count_pending_outbox_messages
+        from demetra.services.outbox import enqueue_comment
+
+        first = await enqueue_comment(task_id="issue-1", body="plan", idempotency_key="plan:issue-1")
+        second = await enqueue_comment(task_id="issue-1", body="plan", idempotency_key="plan:issue-1")
+
+        assert first.id == second.id
+        assert first.variables["commentId"] == second.variables["commentId"]
+        assert await count_pending_outbox_messages() == 1
+
+    @pytest.mark.asyncio
+    async def test_messages_are_delivered_in_order_per_issue(self):
+        from demetra.services.database import count_pending_outbox_messages
+        from demetra.services.outbox import OutboxWorker, enqueue_comment, enqueue_status_update
+
+        await enqueue_status_update(task_id="issue-1", state_id="in-progress")
+        await enqueue_comment(task_id="issue-1", body="plan")
+        await enqueue_status_update(task_id="issue-2", state_id="in-progress")
+
+        delivered = []
+
+        async def mutation(query, variables, idempotent=False):
+            delivered.append((variables["issueId"], query.name))
+            return self.success(query, variables)
+
+        with patch("demetra.services.outbox.graphql_mutation", side_effect=mutation):
+            worker = OutboxWorker()
+            assert await worker.process() == 2
+            assert await worker.process() == 1
+            assert await worker.process() == 0
+
+        assert delivered == [
+            ("issue-1", "UpdateIssue"),
+            ("issue-2", "UpdateIssue"),
+            ("issue-1", "CreateIssueComment"),
+        ]
+        assert await count_pending_outbox_messages() == 0
+
+    @pytest.mark.asyncio
+    async def test_known_mutations_are_sent_as_idempotent(self):
+        from demetra.services.database import list_outbox_heads
+        from demetra.services.outbox import enqueue_comment, enqueue_mutation, enqueue_status_update, is_idempotent
+
+        await enqueue_status_update(task_id="issue-1", state_id="in-progress")
+        await enqueue_comment(task_id="issue-2", body="plan")
+        await enqueue_mutation(operation="CreateIssueComment", issue_id="issue-3", variables={"body": "plan"})
+
+        messages = {message.issue_id: message for message in await list_outbox_heads()}
+        assert [is_idempotent(messages[issue_id]) for issue_id in ("issue-1", "issue-2", "issue-3")] == [
+            True,
+            True,
+            False,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_failed_delivery_is_retried_later(self):
+        from demetra.exceptions import LinearError
+        from demetra.services.database import list_outbox_heads
+        from demetra.services.outbox import OutboxWorker, enqueue_status_update
+
+        await enqueue_status_update(task_id="issue-1", state_id="in-progress")
+
+        with (
+            patch("demetra.services.outbox.graphql_mutation", new_callable=AsyncMock) as mock_mutation,
+            patch("demetra.services.outbox.retry_delay", return_value=3600),
+        ):
+            mock_mutation.side_effect = LinearError("Linear API error: 503")
+            worker = OutboxWorker()
+            await worker.process()
+            assert await worker.process() == 0
+
+        (message,) = await list_outbox_heads()
+        assert message.status == "pending"
+        assert message.attempts == 1
+        assert message.last_error == "Linear API error: 503"
+
+    @pytest.mark.asyncio
+    async def test_rejected_state_is_resolved_again_once(self):
+        from demetra.exceptions import LinearError
+        from demetra.services.database import list_outbox_heads
+        from demetra.services.outbox import OutboxWorker, enqueue_status_update
+
+        await enqueue_status_update(task_id="issue-1", state_id="state-old")
+
+        with (
+            patch("demetra.services.outbox.graphql_mutation", new_callable=AsyncMock) as mock_mutation,
+            patch("demetra.services.outbox.refresh_state_id", new_callable=AsyncMock) as mock_refresh,
+            patch("demetra.services.outbox.retry_delay", return_value=0),
+        ):
+            mock_mutation.side_effect = LinearError("Linear API error: Entity not found: WorkflowState")
+            mock_refresh.return_value = "state-new"
+            worker = OutboxWorker()
+            await worker.process()
+            (message,) = await list_outbox_heads()
+            assert message.variables["stateId"] == "state-new"
+
+            await worker.process()
+
+        mock_refresh.assert_awaited_once_with("state-old")
+        assert mock_mutation.await_args is not None
+        assert mock_mutation.await_args.args[1]["stateId"] == "state-new"
+
+    @pytest.mark.asyncio
+    async def test_message_fails_after_max_attempts(self):
+        from demetra.services.database import count_pending_outbox_messages
+        from demetra.services.outbox import OutboxWorker, enqueue_status_update
+
+        await enqueue_status_update(task_id="issue-1", state_id="unknown")
+
+        with (
+            patch("demetra.services.outbox.graphql_mutation", new_callable=AsyncMock) as mock_mutation,
+            patch("demetra.services.outbox.print_message"),
+        ):
+            mock_mutation.return_value = {"data": {"issueUpdate": {"success": False}}}
+            await OutboxWorker(max_attempts=1).process()
+
+        assert await count_pending_outbox_messages() == 0
+
+    @pytest.mark.asyncio
+    async def test_stop_drains_pending_messages(self):
+        from demetra.services.database import count_pending_outbox_messages
+        from demetra.services.outbox import OutboxWorker, enqueue_status_update
+
+        await enqueue_status_update(task_id="issue-1", state_id="todo")
+
+        with patch("demetra.services.outbox.graphql_mutation", side_effect=self.success):
+            worker = OutboxWorker(poll_interval=60)
+            await worker.start()
+            await worker.stop(timeout=5)
+
+        assert await count_pending_outbox_messages() == 0
@@ -0,0 +1,100 @@
+import asyncio
+import io
+import threading
+
+import pytest
+
+
+class RecordingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+        self.threads = set()
+
+    def write(self, text):
+        self.writes.append(text)
+        self.threads.add(threading.current_thread().name)
+        return super().write(text)
+
+
+@pytest.mark.asyncio
+class TestOutputMultiplexer:
+    async def test_write_coalesces_into_one_batch(self):
+        from demetra.services.output import OutputMultiplexer
+
+        stream = RecordingStream()
+        output = OutputMultiplexer(refresh_interval=0.01, stream=stream)
+
+        for index in range(100):
+            output.write(f"line {index}\n")
+        await asyncio.sleep(0.05)
+        await output.drain()
+
+        assert len(stream.writes) == 1
+        assert stream.getvalue().count("\n") == 100
+
+    async def test_write_happens_off_event_loop(self):
+        from demetra.services.output import OutputMultiplexer
+
+        stream = RecordingStream()
+        output = OutputMultiplexer(stream=stream)
+
+        output.write("hello\n")
+        await output.drain()
+
+        assert stream.getvalue() == "hello\n"
+        assert threading.current_thread().name not in stream.threads
+
+    async def test_write_without_event_loop_is_synchronous(self):
+        from demetra.services.output import OutputMultiplexer
+
+        stream = RecordingStream()
+        output = OutputMultiplexer(stream=stream)
+
+        await asyncio.to_thread(output.write, "sync\n")
+
+        assert stream.getvalue() == "sync\n"
+
+    async def test_single_channel_is_not_labelled(self):
+        from demetra.services.output import OutputMultiplexer
+
+        stream = RecordingStream()
+        output = OutputMultiplexer(stream=stream)
+
+        output.open_channel("ENG-1")
+        output.write("partial", channel="ENG-1")
+        await output.drain()
+
+        assert stream.getvalue() == "partial"
+
+    async def test_concurrent_channels_are_labelled_by_line(self):
+        from demetra.services.output import OutputMultiplexer
+
+        stream = RecordingStream()
+        output = OutputMultiplexer(stream=stream)
+
+        output.open_channel("ENG-1")
+        output.open_channel("ENG-2/build")
+        output.write("first ", channel="ENG-1")
+        output.write("other\n", channel="ENG-2/build")
+        output.write("line\nrest", channel="ENG-1")
+        output.close_channel("ENG-1")
+        await output.drain()
+
+        assert stream.getvalue() == "[ENG-2/build] other\n[ENG-1] first line\n[ENG-1] rest\n"
+
+    async def test_output_channel_nests_labels(self):
+        from unittest.mock import patch
+
+        from demetra.services.output import OutputMultiplexer, current_channel, output_channel
+
+        stream = RecordingStream()
+        output = OutputMultiplexer(stream=stream)
+
+        with patch("demetra.services.output.output", output):
+            with output_channel("ENG-1"), output_channel("plan") as label:
+                assert label == "ENG-1/plan"
+                assert current_channel.get() == "ENG-1/plan"
+            assert current_channel.get() is None
+
+        assert not output.labelled
@@ -0,0 +1,109 @@
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+class TestBuildPlanCacheKey:
+    def test_same_request_gives_same_key(self):
+        from demetra.services.plan_cache import build_plan_cache_key
+
+        first = build_plan_cache_key(
+            task_id="task-1", task="Task", previous_plan=None, agent="plan", model="model", base_commit="abc"
+        )
+        second = build_plan_cache_key(
+            task_id="task-1", task="Task", previous_plan=None, agent="plan", model="model", base_commit="abc"
+        )
+
+        assert first == second
+
+    @pytest.mark.parametrize(
+        "changes",
+        [
+            {"task_id": "task-2"},
+            {"task": "Other"},
+            {"previous_plan": "The plan"},
+            {"model": "other-model"},
+            {"base_commit": "def"},
+        ],
+    )
+    def test_any_change_gives_another_key(self, changes):
+        from demetra.services.plan_cache import build_plan_cache_key
+
+        request: dict[str, Any] = {
+            "task_id": "task-1",
+            "task": "Task",
+            "previous_plan": None,
+            "agent": "plan",
+            "model": "model",
+            "base_commit": "abc",
+        }
+
+        assert build_plan_cache_key(**request) != build_plan_cache_key(**request | changes)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("database")
+class TestPlanCache:
+    async def test_stores_and_loads_plans(self):
+        from demetra.services.plan_cache import load_plan, save_plan
+
+        assert await load_plan("key") is None
+        await save_plan("key", "The plan")
+
+        assert await load_plan("key") == "The plan"
+
+    async def test_expired_plans_are_not_used(self):
+        from demetra.services.plan_cache import load_plan, save_plan
+
+        await save_plan("key", "The plan")
+
+        with patch("demetra.services.plan_cache.PLAN_CACHE_MAX_AGE", 0):
+            assert await load_plan("key") is None
+
+    async def test_evicts_least_recently_used_plans_over_size(self):
+        from demetra.services.database import evict_cached_plans
+        from demetra.services.plan_cache import load_plan, save_plan
+
+        await save_plan("first", "a" * 10)
+        await save_plan("second", "b" * 10)
+        await load_plan("first")
+
+        cutoff = (datetime.now(UTC) - timedelta(days=1)).isoformat()
+        assert await evict_cached_plans(created_before=cutoff, max_size=15) == 1
+
+        assert await load_plan("first") == "a" * 10
+        assert await load_plan("second") is None
+
+    async def test_key_needs_a_commit(self):
+        from demetra.services.plan_cache import get_plan_cache_key
+
+        with patch("demetra.services.plan_cache.git_head", new_callable=AsyncMock, return_value=None):
+            assert (
+                await get_plan_cache_key(
+                    target_path=Path("/worktree"), task_id="task-1", task="Task", previous_plan=None
+                )
+                is None
+            )
+
+        with patch("demetra.services.plan_cache.git_head", new_callable=AsyncMock, return_value="abc"):
+            assert await get_plan_cache_key(
+                target_path=Path("/worktree"), task_id="task-1", task="Task", previous_plan=None
+            )
+
+    async def test_disabled_cache_has_no_key(self):
+        from demetra.services.plan_cache import get_plan_cache_key
+
+        with (
+            patch("demetra.services.plan_cache.PLAN_CACHE_ENABLED", False),
+            patch("demetra.services.plan_cache.git_head", new_callable=AsyncMock, return_value="abc") as mock_head,
+        ):
+            assert (
+                await get_plan_cache_key(
+                    target_path=Path("/worktree"), task_id="task-1", task="Task", previous_plan=None
+                )
+                is None
+            )
+        mock_head.assert_not_awaited()
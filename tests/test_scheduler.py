@@ -0,0 +1,131 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.asyncio
+class TestPool:
+    async def test_limit_is_enforced(self):
+        from demetra.services.scheduler import Pool
+
+        pool = Pool(name="test", limit=2)
+        running, peak = 0, 0
+
+        async def job():
+            nonlocal running, peak
+            await pool.acquire()
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            pool.release()
+
+        await asyncio.gather(*(job() for _ in range(6)))
+
+        assert peak == 2
+        assert pool.active == 0
+        assert pool.stats().acquired == 6
+
+    async def test_waiters_run_by_priority_then_arrival(self):
+        from demetra.services.scheduler import Pool
+
+        pool = Pool(name="test", limit=1)
+        await pool.acquire()
+        order = []
+
+        async def job(name, priority):
+            await pool.acquire(priority=priority)
+            order.append(name)
+            pool.release()
+
+        tasks = [asyncio.create_task(job(name, priority)) for name, priority in (("a", 3), ("b", 1), ("c", 1))]
+        await asyncio.sleep(0)
+        assert pool.queued == 3
+
+        pool.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["b", "c", "a"]
+
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        from demetra.services.scheduler import Pool
+
+        pool = Pool(name="test", limit=1)
+        await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        pool.release()
+
+        assert pool.active == 0
+        assert pool.queued == 0
+
+    async def test_wait_time_is_recorded(self):
+        from demetra.services.scheduler import Pool
+
+        pool = Pool(name="test", limit=1)
+        await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.05)
+        pool.release()
+
+        waited = await waiter
+        stats = pool.stats()
+
+        assert waited >= 0.04
+        assert stats.max_wait == waited
+        assert stats.average_wait == pytest.approx(waited / 2, abs=0.01)
+
+
+@pytest.mark.asyncio
+class TestScheduler:
+    async def test_keyed_pools_take_family_limit(self):
+        from demetra.services.scheduler import Scheduler
+
+        scheduler = Scheduler(limits={"git": 1, "command": 4})
+
+        assert scheduler.pool("git:/repo-a").limit == 1
+        assert scheduler.pool("git:/repo-a") is scheduler.pool("git:/repo-a")
+        assert scheduler.pool("git:/repo-b") is not scheduler.pool("git:/repo-a")
+        assert scheduler.pool("unknown").limit == 4
+
+    async def test_describe_lists_used_pools(self):
+        from demetra.services.scheduler import Scheduler
+
+        scheduler = Scheduler(limits={"agent": 2, "command": 4})
+        async with scheduler.slot("agent"):
+            scheduler.pool("command")
+
+            assert scheduler.describe() == "agent 1/2 (0 queued, 0.0s average wait)"
+
+    async def test_worktrees_share_repository_pool(self, tmp_path):
+        from demetra.services.scheduler import git_pool
+
+        project = tmp_path / "project"
+        (project / ".git" / "worktrees" / "feature").mkdir(parents=True)
+        worktree = tmp_path / "worktree"
+        worktree.mkdir()
+        (worktree / ".git").write_text(f"gitdir: {project / '.git' / 'worktrees' / 'feature'}\n")
+
+        assert git_pool(worktree) == git_pool(project) == f"git:{(project / '.git').resolve()}"
+
+    async def test_run_command_waits_for_pool_slot(self, tmp_path):
+        from unittest.mock import patch
+
+        from demetra.services.scheduler import Scheduler
+        from demetra.services.subprocess import run_command
+
+        scheduler = Scheduler(limits={"command": 1})
+        command = [sys.executable, "-c", "import time; time.sleep(0.2)"]
+
+        with patch("demetra.services.subprocess.scheduler", scheduler):
+            await asyncio.gather(*(run_command(command, Path(tmp_path), disable_stdio=True) for _ in range(2)))
+
+        stats = scheduler.pool("command").stats()
+        assert stats.acquired == 2
+        assert stats.max_wait >= 0.15
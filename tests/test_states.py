@@ -0,0 +1,127 @@
+import json
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+STATES_RESPONSE = {
+    "data": {
+        "team": {
+            "states": {
+                "nodes": [
+                    {"id": "state-backlog", "name": "Backlog", "type": "backlog"},
+                    {"id": "state-todo", "name": "Todo", "type": "unstarted"},
+                    {"id": "state-doing", "name": "Doing", "type": "started"},
+                    {"id": "state-review", "name": "In Review", "type": "started"},
+                ]
+            }
+        }
+    }
+}
+
+
+class TestStatesService:
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        self.cache_path = tmp_path / "states.json"
+        with (
+            patch("demetra.services.states.LINEAR_STATES_CACHE_PATH", self.cache_path),
+            patch("demetra.services.states.LINEAR_TEAM_ID", "team-123"),
+            patch("demetra.services.states._states_cache", {}),
+        ):
+            yield
+
+    @pytest.mark.asyncio
+    async def test_get_state_id_resolves_by_name_and_type(self):
+        from demetra.services.states import STATE_IN_PROGRESS, STATE_IN_REVIEW, STATE_TODO, get_state_id
+
+        with patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = STATES_RESPONSE
+            assert await get_state_id(STATE_TODO) == "state-todo"
+            assert await get_state_id(STATE_IN_REVIEW) == "state-review"
+            assert await get_state_id(STATE_IN_PROGRESS) == "state-doing"
+
+        mock_request.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_get_state_id_falls_back_to_settings(self):
+        from demetra.services.states import STATE_AWAITING_INPUT, STATE_DEFAULTS, get_state_id
+
+        with patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = STATES_RESPONSE
+            assert await get_state_id(STATE_AWAITING_INPUT) == STATE_DEFAULTS[STATE_AWAITING_INPUT]
+
+    @pytest.mark.asyncio
+    async def test_get_state_id_uses_defaults_when_linear_fails(self):
+        from demetra.exceptions import LinearError
+        from demetra.services.states import STATE_DEFAULTS, STATE_TODO, get_state_id
+
+        with (
+            patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request,
+            patch("demetra.services.states.print_message"),
+        ):
+            mock_request.side_effect = LinearError("offline")
+            assert await get_state_id(STATE_TODO) == STATE_DEFAULTS[STATE_TODO]
+
+    @pytest.mark.asyncio
+    async def test_states_are_cached_on_disk(self):
+        from demetra.services.states import get_states
+
+        with patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = STATES_RESPONSE
+            await get_states()
+
+        cache = json.loads(self.cache_path.read_text())
+        assert cache["team_id"] == "team-123"
+        assert len(cache["states"]) == 4
+
+        with (
+            patch("demetra.services.states._states_cache", {}),
+            patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request,
+        ):
+            states = await get_states()
+
+        mock_request.assert_not_called()
+        assert states == cache["states"]
+
+    @pytest.mark.asyncio
+    async def test_expired_cache_is_refreshed(self):
+        from demetra.services.states import get_states
+
+        self.cache_path.write_text(json.dumps({"team_id": "team-123", "fetched_at": time.time() - 10**6, "states": []}))
+        with patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request:
+            mock_request.return_value = STATES_RESPONSE
+            states = await get_states()
+
+        mock_request.assert_called_once()
+        assert len(states) == 4
+
+    @pytest.mark.asyncio
+    async def test_expired_memory_cache_is_refreshed(self):
+        from demetra.services.states import get_states
+
+        with (
+            patch("demetra.services.states._states_cache", {"team-123": (time.time() - 10**6, [])}),
+            patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request,
+        ):
+            mock_request.return_value = STATES_RESPONSE
+            states = await get_states()
+
+        mock_request.assert_called_once()
+        assert len(states) == 4
+
+    @pytest.mark.asyncio
+    async def test_refresh_state_id_resolves_a_rejected_id_again(self):
+        from demetra.services.states import refresh_state_id
+
+        stale_states = [{"id": "state-old", "name": "Doing", "type": "started"}]
+        with (
+            patch("demetra.services.states._states_cache", {"team-123": (time.time(), stale_states)}),
+            patch("demetra.services.states.graphql_request", new_callable=AsyncMock) as mock_request,
+        ):
+            mock_request.return_value = STATES_RESPONSE
+            assert await refresh_state_id("state-old") == "state-doing"
+            assert await refresh_state_id("state-unknown") is None
+
+        assert mock_request.call_count == 2
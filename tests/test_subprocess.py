@@ -10,7 +10,7 @@ class TestSubprocessService:
     async def test_run_command_returns_combined_output(self):
         from demetra.services.subprocess import run_command
 
-        async def capture_stream(stream, result=None, disable_stdio=False):
+        async def capture_stream(stream, result=None, disable_stdio=False, on_line=None, on_chunk=None):
             while True:
                 line = await stream.readline()
                 if not line:
@@ -93,3 +93,88 @@ class TestSubprocessService:
         call_kwargs = mock_create.call_args.kwargs
         assert call_kwargs["stdout"] == asyncio.subprocess.PIPE
         assert call_kwargs["stderr"] == asyncio.subprocess.PIPE
+
+    @pytest.mark.asyncio
+    async def test_run_command_truncates_large_output(self, tmp_path):
+        import sys
+
+        from demetra.services.subprocess import run_command
+
+        script = "for i in range(2000): print(f'line {i:04d}')"
+        with (
+            patch("demetra.services.utils.OUTPUT_BUFFER_HEAD_SIZE", 20),
+            patch("demetra.services.utils.OUTPUT_BUFFER_TAIL_SIZE", 20),
+        ):
+            exit_code, stdout, _ = await run_command(
+                [sys.executable, "-c", script], tmp_path, disable_stdio=True, max_memory=1000
+            )
+
+        assert exit_code == 0
+        assert stdout == "line 0000\nline 0001\n\n... [19960 characters truncated] ...\nline 1998\nline 1999\n"
+
+    @pytest.mark.asyncio
+    async def test_capture_command_exposes_full_output(self, tmp_path):
+        import sys
+
+        from demetra.services.subprocess import capture_command
+
+        script = "for i in range(2000): print(f'line {i:04d}')"
+        async with capture_command([sys.executable, "-c", script], tmp_path, True, max_memory=1000) as (
+            exit_code,
+            result,
+            _,
+        ):
+            assert exit_code == 0
+            assert result.spilled
+            assert result.read().count("\n") == 2000
+
+    @pytest.mark.asyncio
+    async def test_run_command_raises_on_wall_clock_timeout(self, tmp_path):
+        import sys
+
+        from demetra.exceptions import CommandTimeoutError
+        from demetra.services.subprocess import run_command
+
+        script = "import time\nprint('started', flush=True)\ntime.sleep(30)"
+        with pytest.raises(CommandTimeoutError) as error:
+            await run_command([sys.executable, "-c", script], tmp_path, disable_stdio=True, timeout=0.5)
+
+        assert error.value.reason == "wall-clock"
+        assert error.value.stdout == "started\n"
+
+    @pytest.mark.asyncio
+    async def test_run_command_raises_on_idle_timeout(self, tmp_path):
+        import sys
+
+        from demetra.exceptions import CommandTimeoutError
+        from demetra.services.subprocess import run_command
+
+        script = "import time\nfor _ in range(3):\n    print('tick', flush=True)\n    time.sleep(0.1)\ntime.sleep(30)"
+        with pytest.raises(CommandTimeoutError) as error:
+            await run_command(
+                [sys.executable, "-c", script], tmp_path, disable_stdio=True, timeout=None, idle_timeout=0.5
+            )
+
+        assert error.value.reason == "idle"
+        assert error.value.stdout.count("tick") == 3
+
+    @pytest.mark.asyncio
+    async def test_cancel_kills_process_group(self, tmp_path):
+        from demetra.services.subprocess import run_command
+
+        pid_file = tmp_path / "grandchild.pid"
+        task = asyncio.create_task(
+            run_command(["sh", "-c", f"sleep 30 & echo $! > {pid_file}; wait"], tmp_path, disable_stdio=True)
+        )
+        while not pid_file.exists() or not pid_file.read_text().strip():
+            await asyncio.sleep(0.05)
+        grandchild = int(pid_file.read_text())
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        await asyncio.sleep(0.1)
+        # Killed orphans may stay as zombies until init reaps them
+        stat_path = Path(f"/proc/{grandchild}/stat")
+        assert not stat_path.exists() or stat_path.read_text().split()[2] == "Z"
@@ -3,6 +3,7 @@ from unittest.mock import AsyncMock, patch
 
 import pytest
 
+from demetra.services.scheduler import POOL_TEST
 from demetra.services.test import run_pytests
 
 
@@ -18,7 +19,9 @@ async def test_test_agent_success():
         result = await run_pytests(target_path=target_path, session_id=session_id)
 
         mock_run.assert_called_once_with(
-            command=["uv", "run", "--active", "pytest", "--lf", "--quiet", "--color=no"], target_path=target_path
+            command=["uv", "run", "--active", "pytest", "--lf", "--quiet", "--color=no"],
+            target_path=target_path,
+            pool=POOL_TEST,
         )
 
         assert result == (0, "pytest output", "")
@@ -49,6 +52,8 @@ async def test_test_agent_no_session():
         result = await run_pytests(target_path=target_path, session_id=session_id)
 
         mock_run.assert_called_once_with(
-            command=["uv", "run", "--active", "pytest", "--lf", "--quiet", "--color=no"], target_path=target_path
+            command=["uv", "run", "--active", "pytest", "--lf", "--quiet", "--color=no"],
+            target_path=target_path,
+            pool=POOL_TEST,
         )
         assert result == (0, "pytest output", "")
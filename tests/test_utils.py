@@ -1,29 +1,27 @@
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
 
 class TestUtilsService:
     @pytest.mark.asyncio
-    async def test_live_stream_reads_lines(self):
+    async def test_live_stream_reads_chunks(self):
         from demetra.services.utils import live_stream
 
         mock_stream = AsyncMock()
-        mock_stream.readline = AsyncMock(side_effect=[b"line 1\n", b"line 2\n", b""])
+        mock_stream.read = AsyncMock(side_effect=[b"line 1\nli", b"ne 2\n", b""])
 
         result = []
-        await live_stream(mock_stream, result=result)
+        await live_stream(mock_stream, result=result, disable_stdio=True)
 
-        assert len(result) == 2
-        assert "line 1" in result[0]
-        assert "line 2" in result[1]
+        assert "".join(result) == "line 1\nline 2\n"
 
     @pytest.mark.asyncio
     async def test_live_stream_handles_empty_stream(self):
         from demetra.services.utils import live_stream
 
         mock_stream = AsyncMock()
-        mock_stream.readline = AsyncMock(side_effect=[b""])
+        mock_stream.read = AsyncMock(side_effect=[b""])
 
         result = []
         await live_stream(mock_stream, result=result)
@@ -31,14 +29,133 @@ class TestUtilsService:
         assert len(result) == 0
 
     @pytest.mark.asyncio
-    async def test_live_stream_stops_on_empty_line(self):
+    async def test_live_stream_stops_on_eof(self):
         from demetra.services.utils import live_stream
 
         mock_stream = AsyncMock()
-        mock_stream.readline = AsyncMock(side_effect=[b"line\n", b"", b"more data\n"])
+        mock_stream.read = AsyncMock(side_effect=[b"line\n", b"", b"more data\n"])
 
         result = []
-        await live_stream(mock_stream, result=result)
+        await live_stream(mock_stream, result=result, disable_stdio=True)
+
+        assert result == ["line\n"]
+
+    @pytest.mark.asyncio
+    async def test_live_stream_decodes_split_multibyte_characters(self):
+        from demetra.services.utils import live_stream
+
+        data = "→ done\n".encode()
+        mock_stream = AsyncMock()
+        mock_stream.read = AsyncMock(side_effect=[data[:1], data[1:], b""])
+
+        result = []
+        await live_stream(mock_stream, result=result, disable_stdio=True)
+
+        assert "".join(result) == "→ done\n"
+
+    @pytest.mark.asyncio
+    async def test_live_stream_splits_lines_lazily(self):
+        from demetra.services.utils import live_stream
+
+        mock_stream = AsyncMock()
+        mock_stream.read = AsyncMock(side_effect=[b"first\nsec", b"ond\n", b"tail", b""])
+
+        lines = []
+        await live_stream(mock_stream, disable_stdio=True, on_line=lines.append)
+
+        assert lines == ["first\n", "second\n", "tail"]
+
+    @pytest.mark.asyncio
+    async def test_live_stream_handles_long_lines(self):
+        import asyncio
+
+        from demetra.services.utils import live_stream
+
+        stream = asyncio.StreamReader()
+        stream.feed_data(b"x" * 200_000 + b"\n")
+        stream.feed_eof()
+
+        lines = []
+        await live_stream(stream, disable_stdio=True, on_line=lines.append)
+
+        assert len(lines) == 1
+        assert len(lines[0]) == 200_001
+
+    @pytest.mark.asyncio
+    async def test_live_stream_writes_to_output_multiplexer(self):
+        from unittest.mock import patch
+
+        from demetra.services.utils import live_stream
+
+        mock_stream = AsyncMock()
+        mock_stream.read = AsyncMock(side_effect=[b"a\n", b"b\n", b""])
+
+        with patch("demetra.services.utils.output") as mock_output:
+            await live_stream(mock_stream)
+
+        assert [call.args[0] for call in mock_output.write.call_args_list] == ["a\n", "b\n"]
+
+
+class TestOutputBuffer:
+    def test_small_output_stays_in_memory(self):
+        from demetra.services.utils import OutputBuffer
+
+        buffer = OutputBuffer(max_memory=100)
+        buffer.append("line 1\n")
+        buffer.append("line 2\n")
+
+        assert not buffer.spilled
+        assert buffer.text() == buffer.read() == "line 1\nline 2\n"
+        assert len(buffer) == 14
+
+    def test_large_output_spills_to_disk(self):
+        from demetra.services.utils import OutputBuffer
+
+        buffer = OutputBuffer(max_memory=50, head_size=10, tail_size=10)
+        lines = [f"line {index:03d}\n" for index in range(20)]
+        for line in lines:
+            buffer.append(line)
+
+        assert buffer.spilled
+        assert buffer.head() == "line 000\nl"
+        assert buffer.tail() == "\nline 019\n"
+        assert buffer.read() == "".join(lines)
+        assert buffer.text() == "line 000\nl\n... [160 characters truncated] ...\n\nline 019\n"
+
+        buffer.append("end\n")
+        assert buffer.read().endswith("line 019\nend\n")
+        buffer.close()
+        assert not buffer.spilled
+
+    def test_spilled_output_within_head_and_tail_is_not_truncated(self):
+        from demetra.services.utils import OutputBuffer
+
+        buffer = OutputBuffer(max_memory=5, head_size=10, tail_size=10)
+        buffer.append("line 000\n")
+        buffer.append("line 001\n")
+
+        assert buffer.spilled
+        assert buffer.text() == "line 000\nline 001\n"
+
+    def test_sizes_follow_the_settings(self):
+        from demetra.services.utils import OutputBuffer
+
+        with (
+            patch("demetra.services.utils.OUTPUT_BUFFER_HEAD_SIZE", 3),
+            patch("demetra.services.utils.OUTPUT_BUFFER_TAIL_SIZE", 4),
+        ):
+            buffer = OutputBuffer()
+
+        assert (buffer.head_size, buffer.tail_size) == (3, 4)
+
+    @pytest.mark.asyncio
+    async def test_live_stream_writes_to_buffer(self):
+        from demetra.services.utils import OutputBuffer, live_stream
+
+        mock_stream = AsyncMock()
+        mock_stream.read = AsyncMock(side_effect=[b"line 1\n", b"line 2\n", b""])
+
+        buffer = OutputBuffer()
+        await live_stream(mock_stream, result=buffer, disable_stdio=True)
 
-        assert len(result) == 1
-        assert "line" in result[0]
+        assert buffer.read() == "line 1\nline 2\n"
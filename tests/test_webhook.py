@@ -0,0 +1,141 @@
+import hashlib
+import hmac
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+
+SECRET = "webhook-secret"  # nosec B105
+
+
+def issue_data(identifier: str, **fields) -> dict:
+    return {
+        "id": identifier.lower(),
+        "identifier": identifier,
+        "title": identifier,
+        "description": "",
+        "priority": 2,
+        "createdAt": "2024-01-01T00:00:00.000Z",
+        "updatedAt": "2024-01-01T00:00:00.000Z",
+        "teamId": "team-123",
+        "state": {"name": "Todo"},
+        "project": {"name": "demetra"},
+        **fields,
+    }
+
+
+class TestWebhookService:
+    @pytest.fixture(autouse=True)
+    async def setup(self, database):
+        from demetra.services.webhook import IssueQueue, WebhookReceiver
+
+        with (
+            patch("demetra.services.webhook.LINEAR_TEAM_ID", "team-123"),
+            patch("demetra.services.webhook.print_message"),
+        ):
+            self.queue = IssueQueue()
+            receiver = WebhookReceiver(queue=self.queue, projects=["Demetra"], secret=SECRET)
+            self.client = TestClient(TestServer(receiver.create_app()))
+            await self.client.start_server()
+            yield
+            await self.client.close()
+
+    async def send(self, action: str, data: dict, secret: str = SECRET, timestamp: float | None = None):
+        body = json.dumps(
+            {
+                "action": action,
+                "type": "Issue",
+                "data": data,
+                "webhookTimestamp": int((timestamp or time.time()) * 1000),
+            }
+        ).encode()
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return await self.client.post("/webhooks/linear", data=body, headers={"Linear-Signature": signature})
+
+    @pytest.mark.asyncio
+    async def test_todo_issue_is_queued(self):
+        response = await self.send("create", issue_data("DEMETRA-1"))
+
+        assert response.status == 200
+        issue = await self.queue.get()
+        assert issue.identifier == "DEMETRA-1"
+
+    @pytest.mark.asyncio
+    async def test_invalid_signature_is_rejected(self):
+        response = await self.send("create", issue_data("DEMETRA-1"), secret=f"{SECRET}-wrong")
+
+        assert response.status == 401
+        assert len(self.queue) == 0
+
+    @pytest.mark.asyncio
+    async def test_stale_delivery_is_rejected(self):
+        response = await self.send("create", issue_data("DEMETRA-1"), timestamp=time.time() - 3600)
+
+        assert response.status == 401
+        assert len(self.queue) == 0
+
+    @pytest.mark.asyncio
+    async def test_other_projects_and_states_are_ignored(self):
+        await self.send("create", issue_data("DEMETRA-1", project={"name": "other"}))
+        await self.send("create", issue_data("DEMETRA-2", state={"name": "In Progress"}))
+
+        assert len(self.queue) == 0
+
+    @pytest.mark.asyncio
+    async def test_reprioritised_issue_moves_ahead(self):
+        await self.send("create", issue_data("DEMETRA-1", priority=3))
+        await self.send("create", issue_data("DEMETRA-2", priority=2))
+        await self.send("update", issue_data("DEMETRA-1", priority=1))
+
+        assert (await self.queue.get()).identifier == "DEMETRA-1"
+        assert (await self.queue.get()).identifier == "DEMETRA-2"
+        assert len(self.queue) == 0
+
+    @pytest.mark.asyncio
+    async def test_issue_leaving_todo_is_dropped(self):
+        from demetra.services.database import list_issues
+
+        await self.send("create", issue_data("DEMETRA-1"))
+        await self.send("update", issue_data("DEMETRA-1", state={"name": "In Progress"}))
+
+        assert len(self.queue) == 0
+        assert await list_issues(project_name="demetra", state_name="todo", limit=10) == []
+        assert len(await list_issues(project_name="demetra", state_name="in progress", limit=10)) == 1
+
+    def test_receiver_requires_secret(self):
+        from demetra.exceptions import SettingsError
+        from demetra.services.webhook import IssueQueue, WebhookReceiver
+
+        with pytest.raises(SettingsError):
+            WebhookReceiver(queue=IssueQueue(), projects=["demetra"], secret=None)
+
+    @pytest.mark.asyncio
+    async def test_wait_for_webhook_task_claims_the_issue(self):
+        from unittest.mock import AsyncMock
+
+        from demetra.services.database import get_issue, upsert_issues
+        from demetra.services.linear import build_linear_issue
+        from demetra.services.webhook import IssueQueue, wait_for_webhook_task
+
+        issues = [build_linear_issue(issue_data(identifier)) for identifier in ("DEMETRA-1", "DEMETRA-2")]
+        await upsert_issues(issues)
+        queue = IssueQueue()
+        for issue in issues:
+            queue.put(issue)
+        # Another run claimed the first issue after it was delivered
+        await upsert_issues([build_linear_issue(issue_data("DEMETRA-1", state={"name": "In Progress"}))])
+
+        with (
+            patch("demetra.services.webhook.IssueQueue", return_value=queue),
+            patch("demetra.services.webhook.WebhookReceiver"),
+            patch("demetra.services.webhook.start_webhook_server", new_callable=AsyncMock),
+        ):
+            task = await wait_for_webhook_task(project_name="demetra")
+
+        assert task.identifier == "DEMETRA-2"
+        claimed = await get_issue("demetra-2")
+        assert claimed is not None
+        assert claimed.state_name == "in progress"
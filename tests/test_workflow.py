@@ -0,0 +1,352 @@
+import asyncio
+from contextlib import ExitStack
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from tests.conftest import make_issue
+
+
+pytestmark = pytest.mark.usefixtures("database")
+
+
+@pytest.fixture
+def task():
+    return make_issue("DEMETRA-1", issue_id="task-1", title="Add feature", description="Details")
+
+
+@pytest.fixture
+def services():
+    names = [
+        "git_worktree_create",
+        "get_session",
+        "create_session",
+        "enqueue_status_update",
+        "enqueue_comment",
+        "get_state_id",
+        "plan_agent",
+        "extract_plan",
+        "get_opencode_session_id",
+        "request_approval",
+        "build_agent",
+        "review_agent",
+        "is_package_installed",
+        "run_ruff_format",
+        "run_ruff_checks",
+        "run_pytests",
+        "git_add_all",
+        "git_commit",
+        "git_push",
+        "create_pull_request",
+        "stop_opencode_server",
+        "git_cleanup",
+        "linear_cleanup",
+        "get_plan_cache_key",
+    ]
+    with ExitStack() as stack:
+        mocks = {
+            name: stack.enter_context(patch(f"demetra.services.workflow.{name}", new_callable=AsyncMock))
+            for name in names
+        }
+        stack.enter_context(patch("demetra.services.workflow.print_message"))
+        stack.enter_context(patch("demetra.services.dag.print_message"))
+        mocks["git_worktree_create"].return_value = Path("/worktrees/demetra-1")
+        mocks["get_session"].return_value = None
+        mocks["get_plan_cache_key"].return_value = None
+        mocks["get_opencode_session_id"].return_value = "session-1"
+        mocks["plan_agent"].return_value = (0, "plan output", "")
+        mocks["extract_plan"].return_value = "The plan"
+        mocks["request_approval"].return_value = ("approve", None)
+        mocks["review_agent"].return_value = (0, "", "")
+        mocks["is_package_installed"].return_value = True
+        mocks["run_ruff_checks"].return_value = (0, "", "")
+        mocks["run_pytests"].return_value = (0, "", "")
+        yield mocks
+
+
+class TestWorkflowGraph:
+    @pytest.mark.parametrize("concurrent", [False, True])
+    def test_inputs_are_provided(self, concurrent):
+        from demetra.services.workflow import build_workflow
+
+        state = dict.fromkeys(["task", "project_path", "plan_task", "build_plan", "feedback"])
+        state |= dict.fromkeys(["review_feedback", "lint_feedback", "test_feedback"])
+        build_workflow(concurrent=concurrent).check_inputs(state)
+
+
+@pytest.mark.asyncio
+class TestRunTask:
+    async def test_completes_the_workflow(self, task, services):
+        from demetra.services.workflow import run_task
+
+        assert await run_task(task=task, project_path=Path("/projects/demetra")) is True
+
+        services["build_agent"].assert_awaited_once()
+        assert services["build_agent"].await_args.kwargs["task"] == "The plan"
+        services["enqueue_comment"].assert_awaited_once_with(task_id="task-1", body="The plan")
+        services["create_session"].assert_awaited_once_with(task_id="task-1", session_id="session-1")
+        services["git_push"].assert_awaited_once()
+        services["create_pull_request"].assert_awaited_once()
+        assert services["enqueue_status_update"].await_count == 2
+        services["git_cleanup"].assert_awaited_once()
+        assert services["git_cleanup"].await_args.kwargs["is_error"] is False
+        services["linear_cleanup"].assert_awaited_once_with(task_id="task-1", is_error=False)
+
+    async def test_failed_checks_feed_back_into_build(self, task, services):
+        from demetra.services.workflow import run_task
+
+        services["run_pytests"].side_effect = [(1, "test failed", ""), (0, "", "")]
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        assert [call.kwargs["task"] for call in services["build_agent"].await_args_list] == ["The plan", "test failed"]
+        services["linear_cleanup"].assert_awaited_once_with(task_id="task-1", is_error=False)
+
+    async def test_repeated_failures_end_the_workflow(self, task, services):
+        from demetra.services.workflow import run_task
+
+        services["run_ruff_checks"].return_value = (1, "lint failed", "")
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        assert services["build_agent"].await_count == 2
+        services["git_commit"].assert_not_awaited()
+        services["linear_cleanup"].assert_awaited_once_with(task_id="task-1", is_error=True)
+
+    async def test_plan_comment_replans(self, task, services):
+        from demetra.services.workflow import run_task
+
+        services["request_approval"].side_effect = [("comment", "Use a queue"), ("approve", None)]
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        assert [call.kwargs["task"] for call in services["plan_agent"].await_args_list] == [task.text, "Use a queue"]
+
+    async def test_streamed_session_is_used_for_the_build(self, task, services):
+        from demetra.services.workflow import run_task
+
+        async def plan_agent(stream, **kwargs):
+            stream.session_id = "ses-streamed"
+            return 0, "plan output", ""
+
+        services["plan_agent"].side_effect = plan_agent
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        services["get_opencode_session_id"].assert_not_awaited()
+        services["create_session"].assert_awaited_once_with(task_id="task-1", session_id="ses-streamed")
+        assert services["build_agent"].await_args.kwargs["session_id"] == "ses-streamed"
+
+    async def test_auto_policy_approves_plans_and_asks_about_reviews(self, task, services):
+        from demetra.services.approvals import ApprovalQueue, request_approval
+        from demetra.services.workflow import run_task
+
+        services["request_approval"].side_effect = request_approval
+        services["review_agent"].return_value = (0, "Rename x", "")
+
+        with (
+            patch("demetra.services.approvals.approvals", ApprovalQueue(policy_names=["auto"])),
+            patch("demetra.services.approvals.print_message"),
+            patch(
+                "demetra.services.approvals.user_input", new_callable=AsyncMock, return_value=("skip", None)
+            ) as mock_input,
+        ):
+            assert await run_task(task=task, project_path=Path("/projects/demetra")) is True
+
+        mock_input.assert_awaited_once_with([("1", "approve"), ("2", "skip")])
+        services["build_agent"].assert_awaited_once()
+        services["create_pull_request"].assert_awaited_once()
+
+    async def test_cached_plan_skips_the_plan_agent(self, task, services):
+        from demetra.services.database import create_session, get_session
+        from demetra.services.plan_cache import get_plan_cache_key
+        from demetra.services.workflow import run_task
+
+        # The first run stores its OpenCode session, the rerun starts with it
+        services["get_session"].side_effect = get_session
+        services["create_session"].side_effect = create_session
+        services["get_plan_cache_key"].side_effect = get_plan_cache_key
+        with patch("demetra.services.plan_cache.git_head", new_callable=AsyncMock, return_value="abc"):
+            await run_task(task=task, project_path=Path("/projects/demetra"))
+            await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        services["plan_agent"].assert_awaited_once()
+        assert [call.kwargs["task"] for call in services["build_agent"].await_args_list] == ["The plan", "The plan"]
+
+    async def test_same_comment_on_another_task_is_planned_again(self, task, services):
+        from demetra.services.plan_cache import get_plan_cache_key
+        from demetra.services.workflow import run_task
+
+        other = make_issue("DEMETRA-2", issue_id="task-2", title="Other feature", description="Other details")
+        services["get_plan_cache_key"].side_effect = get_plan_cache_key
+        services["extract_plan"].side_effect = ["The plan", "Plan with tests", "Other plan", "Other plan with tests"]
+        services["request_approval"].side_effect = [("comment", "add tests"), ("approve", None)] * 2
+        with patch("demetra.services.plan_cache.git_head", new_callable=AsyncMock, return_value="abc"):
+            await run_task(task=task, project_path=Path("/projects/demetra"))
+            await run_task(task=other, project_path=Path("/projects/demetra"))
+
+        assert services["plan_agent"].await_count == 4
+        assert [call.kwargs["task"] for call in services["build_agent"].await_args_list] == [
+            "Plan with tests",
+            "Other plan with tests",
+        ]
+
+    async def test_empty_plan_stops_the_workflow(self, task, services):
+        from demetra.services.workflow import run_task
+
+        services["extract_plan"].return_value = ""
+
+        assert await run_task(task=task, project_path=Path("/projects/demetra")) is False
+
+        services["build_agent"].assert_not_awaited()
+        assert services["git_cleanup"].await_args.kwargs["is_error"] is True
+        services["linear_cleanup"].assert_awaited_once_with(task_id="task-1", is_error=True)
+
+
+class TestCombineFeedback:
+    def test_orders_findings_by_priority(self):
+        from demetra.services.workflow import combine_feedback
+
+        feedback = combine_feedback(review_feedback="Rename x", lint_feedback="E501", test_feedback="1 failed\n")
+
+        assert feedback == "## Failing tests\n\n1 failed\n\n## Lint errors\n\nE501\n\n## Review comments\n\nRename x"
+
+    def test_returns_none_without_findings(self):
+        from demetra.services.workflow import combine_feedback
+
+        assert combine_feedback(review_feedback=None, lint_feedback="", test_feedback=None) is None
+
+
+@pytest.mark.asyncio
+class TestConcurrentChecks:
+    @pytest.fixture(autouse=True)
+    def workflow(self):
+        from demetra.services.workflow import build_workflow
+
+        with patch("demetra.services.workflow.WORKFLOW", build_workflow(concurrent=True)):
+            yield
+
+    async def test_checks_run_together(self, task, services):
+        from demetra.services.workflow import run_task
+
+        running = 0
+        overlap = 0
+
+        async def check(*args, **kwargs):
+            nonlocal running, overlap
+            running += 1
+            await asyncio.sleep(0.05)
+            overlap = max(overlap, running)
+            running -= 1
+            return (0, "", "")
+
+        services["review_agent"].side_effect = check
+        services["run_ruff_checks"].side_effect = check
+        services["run_pytests"].side_effect = check
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        assert overlap == 3
+        services["run_ruff_format"].assert_awaited_once()
+        services["linear_cleanup"].assert_awaited_once_with(task_id="task-1", is_error=False)
+
+    async def test_build_gets_all_findings_at_once(self, task, services):
+        from demetra.services.workflow import run_task
+
+        services["review_agent"].side_effect = [(0, "Rename x", ""), (0, "", "")]
+        services["run_ruff_checks"].side_effect = [(1, "E501", ""), (0, "", "")]
+        services["run_pytests"].side_effect = [(1, "1 failed", ""), (0, "", "")]
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        feedback = services["build_agent"].await_args_list[1].kwargs["task"]
+        assert feedback.index("1 failed") < feedback.index("E501") < feedback.index("Rename x")
+        assert services["build_agent"].await_count == 2
+        services["git_commit"].assert_awaited_once()
+
+
+@pytest.mark.asyncio
+class TestCheckpoints:
+    async def test_failed_run_keeps_worktree_and_checkpoint(self, task, services, tmp_path):
+        from demetra.exceptions import DemetraError
+        from demetra.services.database import get_checkpoint
+        from demetra.services.workflow import run_task
+
+        services["git_worktree_create"].return_value = tmp_path
+        services["build_agent"].side_effect = DemetraError("agent crashed")
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        services["git_cleanup"].assert_not_awaited()
+        services["linear_cleanup"].assert_awaited_once_with(task_id="task-1", is_error=True)
+        checkpoint = await get_checkpoint(task_identifier="demetra-1")
+        assert checkpoint is not None
+        assert checkpoint.stage == "post-plan"
+        assert "approve-plan" in checkpoint.completed_steps
+        assert "build" not in checkpoint.completed_steps
+        assert checkpoint.state["build_plan"] == "The plan"
+        assert checkpoint.state["worktree_path"] == str(tmp_path)
+
+    async def test_resumed_run_continues_after_last_step(self, task, services, tmp_path):
+        from demetra.exceptions import DemetraError
+        from demetra.services.database import get_checkpoint
+        from demetra.services.workflow import run_task
+
+        services["git_worktree_create"].return_value = tmp_path
+        services["build_agent"].side_effect = [DemetraError("agent crashed"), None]
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        services["git_worktree_create"].assert_awaited_once()
+        services["plan_agent"].assert_awaited_once()
+        assert services["build_agent"].await_args.kwargs["task"] == "The plan"
+        assert services["build_agent"].await_args.kwargs["target_path"] == tmp_path
+        # Moving the task to In Progress is repeated, the failed run moved it back to TODO
+        assert services["enqueue_status_update"].await_count == 3
+        services["git_cleanup"].assert_awaited_once()
+        assert await get_checkpoint(task_id="task-1") is None
+
+    async def test_missing_worktree_starts_over(self, task, services, tmp_path):
+        from demetra.exceptions import DemetraError
+        from demetra.services.workflow import run_task
+
+        services["git_worktree_create"].return_value = tmp_path / "worktree"
+        (tmp_path / "worktree").mkdir()
+        services["build_agent"].side_effect = [DemetraError("agent crashed"), None]
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+        (tmp_path / "worktree").rmdir()
+
+        await run_task(task=task, project_path=Path("/projects/demetra"))
+
+        assert services["git_worktree_create"].await_count == 2
+        assert services["plan_agent"].await_count == 2
+
+    async def test_resume_workflow_runs_checkpointed_task(self, task):
+        from demetra.services.database import save_checkpoint, upsert_issues
+        from demetra.services.workflow import resume_workflow
+
+        task.project_name = "demetra"
+        task.state_name = "In Progress"
+        await upsert_issues([task])
+        await save_checkpoint(
+            task_id=task.id,
+            task_identifier=task.identifier,
+            project_path="/projects/demetra",
+            stage="build",
+            completed_steps=["worktree", "build"],
+            loops={},
+            state={},
+        )
+
+        with (
+            patch("demetra.services.workflow.run_workflow", new_callable=AsyncMock) as mock_run,
+            patch("demetra.services.workflow.print_message"),
+        ):
+            await resume_workflow(task_identifier="DEMETRA-1")
+
+        mock_run.assert_awaited_once()
+        assert mock_run.await_args is not None
+        assert mock_run.await_args.kwargs["task"].id == "task-1"
+        assert mock_run.await_args.kwargs["project_path"] == Path("/projects/demetra")